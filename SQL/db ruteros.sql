@@ -540,13 +540,12 @@ CREATE TABLE sistema.lotes_importacion (
     nombre_archivo NVARCHAR(260) NOT NULL,
     hash_archivo VARBINARY(32) NULL,
     estado VARCHAR(15) NOT NULL,
-    subido_por INT NOT NULL,
+    subido_por INT NOT NULL, -- id del usuario de Django (auth_user), sin FK a sistema.usuarios
     subido_en DATETIME2(3) NOT NULL DEFAULT SYSUTCDATETIME(),
     comentarios NVARCHAR(500) NULL,
+    reclamado_en DATETIME2(3) NULL,
     
-    CONSTRAINT CK_li_estado CHECK (estado IN ('PENDIENTE','VALIDADO','CARGADO')),
-    CONSTRAINT FK_li_usuario FOREIGN KEY (subido_por)
-        REFERENCES sistema.usuarios(id_usuario)
+    CONSTRAINT CK_li_estado CHECK (estado IN ('PENDIENTE','EN_PROCESO','VALIDADO','CARGADO','ERROR'))
 );
 
 CREATE INDEX IX_li_estado_fecha 
@@ -37,6 +37,37 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Medición por solicitud (SQL, serializadores, render) en Server-Timing y en el log management.rendimiento.
+# Va justo después de CORS para que el total cubra casi toda la cadena.
+MEDICION_ACTIVA = os.getenv('MEDICION_ACTIVA', 'True') == 'True'
+# Con 'False' se sigue registrando en el log pero no se expone el encabezado a los clientes.
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'True') == 'True'
+if MEDICION_ACTIVA:
+    MIDDLEWARE.insert(1, 'management.rendimiento.MedicionMiddleware')
+
+# Métricas en formato de texto de Prometheus en /metrics, solo para un recolector local.
+# Con METRICAS_DIR cada worker escribe en su propio archivo mmap y /metrics suma todos los archivos;
+# el directorio se vacía al arrancar el servicio ('manage.py limpiar_metricas'). Sin él, cada proceso expone solo lo suyo.
+METRICAS_ACTIVAS = os.getenv('METRICAS_ACTIVAS', 'True') == 'True'
+METRICAS_DIR = os.getenv('METRICAS_DIR', '')
+METRICAS_IPS = os.getenv('METRICAS_IPS', '127.0.0.1,::1').split(',')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        # En desarrollo (DEBUG) no se imprime una línea por solicitud salvo que se pida con MEDICION_LOG_NIVEL=INFO.
+        'management.rendimiento': {
+            'handlers': ['console'],
+            'level': os.getenv('MEDICION_LOG_NIVEL', 'WARNING' if DEBUG else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 ROOT_URLCONF = 'core.urls'
 
 TEMPLATES = [
@@ -96,20 +127,49 @@ USE_TZ = True
 STATIC_URL = '/static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caché por defecto en memoria de cada proceso. Con varios workers (gunicorn/uwsgi) hay que usar una
+# compartida (Redis, Memcached o DatabaseCache): ahí viven las versiones de catálogos y el estado de los
+# usuarios del JWT, y un cambio solo se ve en todos los procesos al instante si la caché es común.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Segundos que un proceso reutiliza su copia de un catálogo. Con la caché en memoria es lo máximo que
+# otro worker tarda en ver un cambio; con una caché compartida el cambio se ve en la siguiente solicitud.
+CATALOGOS_TTL = int(os.getenv('CATALOGOS_TTL', '300'))
+
 MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
 MEDIA_ROOT = Path(os.getenv('MEDIA_ROOT', BASE_DIR / 'media'))
 
 MEDIA_ROOT.mkdir(parents=True, exist_ok=True)
 
 # Configuración básica de DRF con autenticación JWT por defecto.
+# JSON con orjson si está instalado (requirements-rapido.txt); con 'False' se usan el renderer y parser estándar de DRF.
+JSON_RAPIDO = os.getenv('JSON_RAPIDO', 'True') == 'True'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'management.autenticacion.JWTSinConsulta',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # Todas las listas van paginadas; rutas, evidencias y ventas usan cursor (ver management/pagination.py).
+    'DEFAULT_PAGINATION_CLASS': 'management.pagination.PaginacionEstandar',
+    'PAGE_SIZE': int(os.getenv('API_TAMANO_PAGINA', '50')),
+    'DEFAULT_RENDERER_CLASSES': (
+        'management.renderers.ORJSONRenderer' if JSON_RAPIDO else 'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'management.renderers.ORJSONParser' if JSON_RAPIDO else 'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
+API_MAX_TAMANO_PAGINA = int(os.getenv('API_MAX_TAMANO_PAGINA', '500'))
 
 from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
@@ -120,6 +180,80 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
 
+# Segundos que se recuerda si un usuario sigue activo; un token de usuario desactivado deja de valer a más tardar en ese tiempo.
+JWT_REVOCACION_TTL = int(os.getenv('JWT_REVOCACION_TTL', '60'))
+
+# Tiempo que guardamos las respuestas asociadas a un Idempotency-Key antes de purgarlas.
+IDEMPOTENCIA_TTL = timedelta(hours=int(os.getenv('IDEMPOTENCIA_TTL_HORAS', '24')))
+IDEMPOTENCIA_INTERVALO_PURGA = int(os.getenv('IDEMPOTENCIA_INTERVALO_PURGA', '60'))
+# Segundos que una clave queda reservada sin respuesta antes de darla por abandonada (el worker murió a medias).
+# Debe superar lo que tarda la solicitud más lenta, o un reintento podría ejecutarla dos veces.
+IDEMPOTENCIA_RESERVA = timedelta(seconds=int(os.getenv('IDEMPOTENCIA_RESERVA_SEGUNDOS', '120')))
+
+# Cantidad de ventas que validamos e insertamos por transacción en la ingesta NDJSON.
+INGESTA_TAMANO_BLOQUE = int(os.getenv('INGESTA_TAMANO_BLOQUE', '500'))
+# Bytes máximos de una línea NDJSON (una venta con sus detalles); una más larga se rechaza sin leerla entera.
+INGESTA_MAX_BYTES_LINEA = int(os.getenv('INGESTA_MAX_BYTES_LINEA', str(256 * 1024)))
+
+# Filas de CSV que validamos y escribimos juntas al importar clientes.
+IMPORTACION_TAMANO_BLOQUE = int(os.getenv('IMPORTACION_TAMANO_BLOQUE', '1000'))
+# Bytes que leemos por vez del archivo subido al decodificar el CSV.
+IMPORTACION_TAMANO_LECTURA = int(os.getenv('IMPORTACION_TAMANO_LECTURA', str(64 * 1024)))
+
+IMPORTACION_ERRORES_POR_PAGINA = int(os.getenv('IMPORTACION_ERRORES_POR_PAGINA', '50'))
+# Minutos sin avance tras los que 'procesar_lotes' devuelve a la cola un lote EN_PROCESO. Debe superar lo que
+# tarda la carga final de un lote grande, que corre en una sola transacción sin renovar la marca.
+IMPORTACION_LOTE_ABANDONADO_MINUTOS = int(os.getenv('IMPORTACION_LOTE_ABANDONADO_MINUTOS', '30'))
+
+# Llaves máximas en consultas por lote como ?nit=a,b,c (SQL Server admite ~2100 parámetros).
+CONSULTA_MAX_CLAVES = int(os.getenv('CONSULTA_MAX_CLAVES', '500'))
+# Intercalación sin mayúsculas para ?codigo= en productos. En SQLite, NOCASE (tiene su índice); en SQL Server
+# vacía porque la columna ya usa la intercalación CI de la base. Si la base distingue mayúsculas, indique una CI
+# (p. ej. Modern_Spanish_CI_AS), aunque así la búsqueda ya no usa la llave primaria.
+PRODUCTOS_CODIGO_COLACION = os.getenv(
+    'PRODUCTOS_CODIGO_COLACION', '' if DB_ENGINE in ('mssql', 'sql_server', 'sql_server.pyodbc') else 'NOCASE'
+)
+
+# Máximo de filas por carga masiva de productos
+PRODUCTOS_CARGA_MAX_FILAS = int(os.getenv('PRODUCTOS_CARGA_MAX_FILAS', '5000'))
+
+# Derivados de las fotos de evidencia: lado máximo en píxeles y calidad JPEG
+EVIDENCIA_MINIATURA_PX = int(os.getenv('EVIDENCIA_MINIATURA_PX', '320'))
+EVIDENCIA_MEDIANA_PX = int(os.getenv('EVIDENCIA_MEDIANA_PX', '1280'))
+EVIDENCIA_CALIDAD_JPEG = int(os.getenv('EVIDENCIA_CALIDAD_JPEG', '80'))
+
+# Normalización de la foto subida: se orienta, se quitan metadatos y se reduce/recomprime (JPEG o WEBP)
+EVIDENCIA_NORMALIZAR = os.getenv('EVIDENCIA_NORMALIZAR', 'True') == 'True'
+EVIDENCIA_MAX_PX = int(os.getenv('EVIDENCIA_MAX_PX', '2048'))
+EVIDENCIA_FORMATO = os.getenv('EVIDENCIA_FORMATO', 'JPEG').upper()
+EVIDENCIA_CALIDAD = int(os.getenv('EVIDENCIA_CALIDAD', '85'))
+
+# Subidas por partes: archivos temporales fuera de MEDIA_ROOT, tamaño máximo y vigencia de una carga sin finalizar
+EVIDENCIA_CARGAS_DIR = Path(os.getenv('EVIDENCIA_CARGAS_DIR', BASE_DIR / 'cargas'))
+EVIDENCIA_CARGA_MAX_BYTES = int(os.getenv('EVIDENCIA_CARGA_MAX_BYTES', str(25 * 1024 * 1024)))
+EVIDENCIA_CARGA_MAX_BLOQUE = int(os.getenv('EVIDENCIA_CARGA_MAX_BLOQUE', str(4 * 1024 * 1024)))
+EVIDENCIA_CARGA_TTL = timedelta(hours=int(os.getenv('EVIDENCIA_CARGA_TTL_HORAS', '24')))
+
+# Subida de varias fotos en una solicitud: máximo de archivos y cuántos se guardan en paralelo
+EVIDENCIA_MAX_ARCHIVOS_LOTE = int(os.getenv('EVIDENCIA_MAX_ARCHIVOS_LOTE', '20'))
+EVIDENCIA_HILOS_SUBIDA = int(os.getenv('EVIDENCIA_HILOS_SUBIDA', '4'))
+
+# Descarga de evidencias y reportes: '' la sirve Django; 'x-accel' (nginx) o 'x-sendfile' (Apache) la delegan al servidor web.
+# Con x-accel, los prefijos deben ser locations 'internal' de nginx con alias a MEDIA_ROOT y al directorio temporal.
+ARCHIVOS_DESCARGA = os.getenv('ARCHIVOS_DESCARGA', '').lower()
+MEDIA_ACCEL_PREFIX = os.getenv('MEDIA_ACCEL_PREFIX', '/_media/')
+REPORTES_ACCEL_PREFIX = os.getenv('REPORTES_ACCEL_PREFIX', '/_reportes/')
+
+# Tamaño de página del buscador de clientes (autocompletado).
+BUSQUEDA_TAMANO_PAGINA = int(os.getenv('BUSQUEDA_TAMANO_PAGINA', '20'))
+BUSQUEDA_MAX_TAMANO_PAGINA = int(os.getenv('BUSQUEDA_MAX_TAMANO_PAGINA', '100'))
+# Coincidencias máximas que se puntúan por búsqueda; mantiene acotada la latencia con términos comunes.
+BUSQUEDA_MAX_CANDIDATOS = int(os.getenv('BUSQUEDA_MAX_CANDIDATOS', '2000'))
+
+# Tareas en segundo plano (lotes de importación, etc.) en un pool de hilos del mismo proceso.
+TAREAS_EN_SEGUNDO_PLANO = os.getenv('TAREAS_EN_SEGUNDO_PLANO', 'True') == 'True'
+TAREAS_HILOS = int(os.getenv('TAREAS_HILOS', '2'))
+
 # Permitimos al frontend local conectarse sin errores de CORS.
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:4200',
@@ -5,14 +5,23 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework import routers
 from management import urls as management_urls
+from management.medios import MedioEvidenciaView
+from management.metricas import vista_metricas
 
 # Redirigimos al API principal y exponemos el administrador.
 urlpatterns = [
     path('', RedirectView.as_view(url='/api/', permanent=False)),
     path('admin/', admin.site.urls),
     path('api/', include(management_urls)),
+    path('metrics', vista_metricas, name='metricas'),
 ]
 
+# Evidencias con caché, Range y descarga delegada al servidor web, también fuera de DEBUG.
+if not settings.MEDIA_URL.startswith(('http://', 'https://')):
+    urlpatterns.append(
+        path(f"{settings.MEDIA_URL.lstrip('/')}evidencias/<path:nombre>", MedioEvidenciaView.as_view(), name='medio-evidencia'),
+    )
+
 # Servimos archivos multimedia en modo desarrollo.
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,59 @@
+import hashlib
+import os
+import re
+from pathlib import PurePosixPath
+
+from django.core.files.storage import FileSystemStorage
+
+NOMBRE_CONTENIDO = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+EXTENSIONES_EQUIVALENTES = {'.jpeg': '.jpg', '.jpe': '.jpg', '.tif': '.tiff'}
+
+
+def huella_contenido(content):
+    sha = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for bloque in content.chunks():
+        sha.update(bloque)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()
+
+
+# Guarda cada archivo como <prefijo>/ab/cd/<sha256>.ext: el mismo contenido siempre cae en el mismo nombre.
+class AlmacenamientoPorContenido(FileSystemStorage):
+    def __init__(self, prefijo, **kwargs):
+        super().__init__(**kwargs)
+        self.prefijo = prefijo
+
+    def nombre_para(self, huella, nombre_original):
+        extension = PurePosixPath(nombre_original or '').suffix.lower()
+        extension = EXTENSIONES_EQUIVALENTES.get(extension, extension)
+        return f'{self.prefijo}/{huella[:2]}/{huella[2:4]}/{huella}{extension}'
+
+    def _save(self, name, content):
+        nombre = self.nombre_para(huella_contenido(content), name)
+        if self.exists(nombre):
+            # Ya existe: no escribimos nada. Renovamos la fecha para que el recolector no lo borre
+            # antes de que se registre la nueva referencia.
+            os.utime(self.path(nombre))
+            return nombre
+        return super()._save(nombre, content)
+
+    # Recorre los archivos con nombre por contenido: (nombre, fecha de modificación).
+    def archivos_por_contenido(self):
+        raiz = self.path(self.prefijo)
+        if not os.path.isdir(raiz):
+            return
+        for nivel1 in os.scandir(raiz):
+            if not (nivel1.is_dir() and len(nivel1.name) == 2):
+                continue
+            for nivel2 in os.scandir(nivel1.path):
+                if not (nivel2.is_dir() and len(nivel2.name) == 2):
+                    continue
+                for archivo in os.scandir(nivel2.path):
+                    if archivo.is_file() and NOMBRE_CONTENIDO.match(archivo.name):
+                        yield f'{self.prefijo}/{nivel1.name}/{nivel2.name}/{archivo.name}', archivo.stat().st_mtime
+
+
+almacenamiento_evidencias = AlmacenamientoPorContenido('evidencias')
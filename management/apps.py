@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class ManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'management'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import archivos, autenticacion, catalogos, condicional
+
+        catalogos.conectar_senales()
+        archivos.conectar_senales()
+        autenticacion.conectar_senales()
+        condicional.conectar_senales()
+        # Serializer.data se envuelve solo si el middleware que lo usa está instalado; si no, DRF queda intacto.
+        if 'management.rendimiento.MedicionMiddleware' in settings.MIDDLEWARE:
+            from . import rendimiento
+
+            rendimiento.instrumentar_serializadores()
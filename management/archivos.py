@@ -0,0 +1,129 @@
+import mimetypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+
+from .almacenamiento import almacenamiento_evidencias
+from .models import Archivo, EvidenciaFotografica
+
+TIPO_EVIDENCIA = 'evidencia'
+CATEGORIAS_EVIDENCIA = ('original', 'miniatura', 'mediana')
+TAMANO_CONSULTA = 500
+
+
+def _archivos_evidencia(evidencia):
+    return zip(CATEGORIAS_EVIDENCIA, (evidencia.imagen, evidencia.miniatura, evidencia.mediana))
+
+
+# Deja en sistema.archivos exactamente una referencia por cada archivo que usan las evidencias.
+def sincronizar_referencias(evidencias):
+    evidencias = [evidencia for evidencia in evidencias if evidencia.pk is not None]
+    if not evidencias:
+        return
+    deseadas = {
+        (str(evidencia.pk), categoria, archivo.name): archivo.name
+        for evidencia in evidencias
+        for categoria, archivo in _archivos_evidencia(evidencia)
+        if archivo
+    }
+    existentes = {
+        (registro.id_entidad, registro.categoria, registro.url): registro.id_archivo
+        for registro in Archivo.objects.filter(
+            tipo_entidad=TIPO_EVIDENCIA, id_entidad__in=[str(evidencia.pk) for evidencia in evidencias],
+        )
+    }
+    sobrantes = [id_archivo for clave, id_archivo in existentes.items() if clave not in deseadas]
+    if sobrantes:
+        Archivo.objects.filter(id_archivo__in=sobrantes).delete()
+    nuevas = []
+    for (id_entidad, categoria, nombre) in deseadas.keys() - existentes.keys():
+        try:
+            tamano = almacenamiento_evidencias.size(nombre)
+        except OSError:
+            tamano = None
+        nuevas.append(Archivo(
+            tipo_entidad=TIPO_EVIDENCIA,
+            id_entidad=id_entidad,
+            categoria=categoria,
+            nombre_archivo=nombre.rsplit('/', 1)[-1],
+            tipo_mime=mimetypes.guess_type(nombre)[0],
+            url=nombre,
+            tamano_bytes=tamano,
+        ))
+    Archivo.objects.bulk_create(nuevas)
+
+
+# Guarda varias fotos en paralelo y crea todas sus evidencias con un solo INSERT.
+# preparar (opcional) se aplica a cada archivo dentro del mismo hilo que lo guarda, p. ej. para quitarle metadatos.
+def guardar_lote_evidencias(archivos, comunes, preparar=None):
+    def guardar(archivo):
+        if preparar is not None:
+            archivo = preparar(archivo)
+        return almacenamiento_evidencias.save(archivo.name, archivo)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(len(archivos), settings.EVIDENCIA_HILOS_SUBIDA))) as executor:
+        nombres = list(executor.map(guardar, archivos))
+    evidencias = [EvidenciaFotografica(imagen=nombre, **comunes) for nombre in nombres]
+    with transaction.atomic():
+        if connection.features.can_return_rows_from_bulk_insert:
+            # bulk_create no dispara post_save: registramos las referencias aquí.
+            EvidenciaFotografica.objects.bulk_create(evidencias)
+            sincronizar_referencias(evidencias)
+        else:
+            # Sin ids de vuelta no podríamos encolar los derivados; guardamos una por una en la misma transacción.
+            for evidencia in evidencias:
+                evidencia.save()
+    return evidencias
+
+
+def _al_guardar_evidencia(sender, instance, **kwargs):
+    sincronizar_referencias([instance])
+
+
+def _al_borrar_evidencia(sender, instance, **kwargs):
+    # El archivo queda en disco; el recolector lo borra cuando ya nadie lo referencia.
+    Archivo.objects.filter(tipo_entidad=TIPO_EVIDENCIA, id_entidad=str(instance.pk)).delete()
+
+
+def conectar_senales():
+    post_save.connect(_al_guardar_evidencia, sender=EvidenciaFotografica, dispatch_uid='archivos_evidencia_save')
+    post_delete.connect(_al_borrar_evidencia, sender=EvidenciaFotografica, dispatch_uid='archivos_evidencia_delete')
+
+
+def _referenciados(nombres):
+    referenciados = set(Archivo.objects.filter(url__in=nombres).values_list('url', flat=True))
+    # Por seguridad también respetamos evidencias que aún no tengan su fila en archivos.
+    for campo in ('imagen', 'miniatura', 'mediana'):
+        referenciados.update(
+            EvidenciaFotografica.objects.filter(**{f'{campo}__in': nombres}).values_list(campo, flat=True)
+        )
+    return referenciados
+
+
+# Una subida repetida renueva la fecha del archivo antes de guardar su referencia: se vuelve a mirar justo antes de borrar.
+def _tocado_despues(nombre, limite):
+    try:
+        return os.stat(almacenamiento_evidencias.path(nombre)).st_mtime >= limite
+    except FileNotFoundError:
+        return True
+
+
+# Borra archivos por contenido sin referencias. La gracia protege subidas recientes cuya referencia aún no se guarda.
+def recolectar_huerfanos(gracia_segundos, simular=False):
+    limite = time.time() - gracia_segundos
+    candidatos = [nombre for nombre, modificado in almacenamiento_evidencias.archivos_por_contenido() if modificado < limite]
+    borrados = []
+    for inicio in range(0, len(candidatos), TAMANO_CONSULTA):
+        bloque = candidatos[inicio:inicio + TAMANO_CONSULTA]
+        referenciados = _referenciados(bloque)
+        for nombre in bloque:
+            if nombre in referenciados or _tocado_despues(nombre, limite):
+                continue
+            if not simular:
+                almacenamiento_evidencias.delete(nombre)
+            borrados.append(nombre)
+    return borrados
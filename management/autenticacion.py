@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import UserProfile
+
+CLAIMS_USUARIO = ('username', 'rol')
+
+
+# Token con los datos que el API necesita del usuario, para no leerlos de la base en cada solicitud.
+class TokenConDatosSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.get_username()
+        token['rol'] = UserProfile.objects.filter(user_id=user.pk).values_list('rol', flat=True).first()
+        return token
+
+
+# Usuario armado desde el token: id, username y rol salen de los claims.
+class UsuarioToken(TokenUser):
+    @cached_property
+    def id(self):
+        valor = self.token[api_settings.USER_ID_CLAIM]
+        return int(valor) if str(valor).isdigit() else valor
+
+    @cached_property
+    def rol(self):
+        return self.token.get('rol')
+
+
+def _clave_activo(user_id):
+    return f'jwt:activo:{user_id}'
+
+
+# Revocación: si el usuario fue desactivado o borrado el token deja de servir a más tardar en JWT_REVOCACION_TTL.
+def usuario_activo(user_id):
+    clave = _clave_activo(user_id)
+    activo = cache.get(clave)
+    if activo is None:
+        activo = get_user_model().objects.filter(pk=user_id, is_active=True).exists()
+        cache.set(clave, activo, settings.JWT_REVOCACION_TTL)
+    return activo
+
+
+# JWT sin consulta de usuario por solicitud. Tokens emitidos antes de los claims siguen por el camino normal.
+class JWTSinConsulta(JWTAuthentication):
+    def get_user(self, validated_token):
+        if not all(claim in validated_token for claim in CLAIMS_USUARIO):
+            return super().get_user(validated_token)
+        usuario = UsuarioToken(validated_token)
+        if not usuario_activo(usuario.id):
+            raise AuthenticationFailed('Usuario inactivo o eliminado.', code='user_inactive')
+        return usuario
+
+
+def _al_cambiar_usuario(sender, instance, **kwargs):
+    cache.delete(_clave_activo(instance.pk))
+
+
+def conectar_senales():
+    modelo = get_user_model()
+    post_save.connect(_al_cambiar_usuario, sender=modelo, dispatch_uid='jwt_usuario_save')
+    post_delete.connect(_al_cambiar_usuario, sender=modelo, dispatch_uid='jwt_usuario_delete')
@@ -0,0 +1,55 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+
+from .models import Cliente
+
+MAX_TERMINOS = 8
+
+
+def terminos_busqueda(texto):
+    # Solo letras y dígitos: así la expresión de búsqueda nunca lleva comillas ni operadores del usuario.
+    return re.findall(r'\w+', (texto or '').lower())[:MAX_TERMINOS]
+
+
+def _expresion_prefijos(terminos):
+    return ' AND '.join(f'"{termino}*"' if connection.vendor == 'microsoft' else f'"{termino}"*' for termino in terminos)
+
+
+# Búsqueda por prefijo de cada término en NIT, nombre y dirección, ordenada por relevancia.
+def buscar_clientes(texto, limite, desplazamiento=0):
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return []
+    tabla = Cliente._meta.db_table
+    expresion = _expresion_prefijos(terminos)
+
+    candidatos = settings.BUSQUEDA_MAX_CANDIDATOS
+
+    # Solo los mejores candidatos pasan al JOIN, como el top_n de CONTAINSTABLE: un término muy común
+    # no obliga a leer toda la tabla de clientes. ORDER BY rank lo resuelve FTS5 con los pesos de bm25.
+    if connection.vendor == 'sqlite':
+        sql = (
+            "SELECT c.* FROM ("
+            "SELECT rowid, rank AS puntaje FROM clientes_fts "
+            "WHERE clientes_fts MATCH %s AND rank MATCH 'bm25(10.0, 5.0, 1.0)' ORDER BY rank LIMIT %s"
+            f") f JOIN {tabla} c ON c.rowid = f.rowid "
+            "ORDER BY f.puntaje, c.nombre LIMIT %s OFFSET %s"
+        )
+        return list(Cliente.objects.raw(sql, [expresion, candidatos, limite, desplazamiento]))
+
+    if connection.vendor == 'microsoft':
+        sql = (
+            f"SELECT c.* FROM {tabla} c "
+            f"JOIN CONTAINSTABLE({tabla}, (nit, nombre, direccion), %s, %s) ft ON ft.[KEY] = c.nit "
+            "ORDER BY ft.RANK DESC, c.nombre OFFSET %s ROWS FETCH NEXT %s ROWS ONLY"
+        )
+        return list(Cliente.objects.raw(sql, [expresion, candidatos, desplazamiento, limite]))
+
+    # Otros motores: prefijos con el ORM, sin ranking.
+    filtro = Q()
+    for termino in terminos:
+        filtro &= Q(nit__startswith=termino) | Q(nombre__istartswith=termino) | Q(direccion__istartswith=termino)
+    return list(Cliente.objects.filter(filtro).order_by('nombre')[desplazamiento:desplazamiento + limite])
@@ -0,0 +1,89 @@
+from rest_framework.permissions import SAFE_METHODS
+
+
+def _lista_campos(valor):
+    return {campo.strip() for campo in (valor or '').split(',') if campo.strip()}
+
+
+def campos_de_consulta(request):
+    # Solo en lecturas: en escrituras quitar campos cambiaría la validación.
+    if request is None or request.method not in SAFE_METHODS:
+        return None, None
+    params = request.query_params
+    return _lista_campos(params.get('fields')) or None, _lista_campos(params.get('omit'))
+
+
+def _rutas_select_related(relaciones, prefijo=''):
+    for nombre, hijas in relaciones.items():
+        ruta = f'{prefijo}{nombre}'
+        if hijas:
+            yield from _rutas_select_related(hijas, f'{ruta}__')
+        else:
+            yield ruta
+
+
+# Permite ?fields=a,b y ?omit=c en la respuesta; solo actúa en el serializer raíz, no en los anidados.
+class CamposDinamicosMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = (kwargs.get('context') or {}).get('request')
+        incluir, omitir = campos_de_consulta(request)
+        if incluir is None and not omitir:
+            return
+        for nombre in list(self.fields):
+            if (incluir is not None and nombre not in incluir) or nombre in omitir:
+                self.fields.pop(nombre)
+
+
+# Recorta también el SQL: only() con las columnas pedidas y prefetch solo de los anidados que se muestran.
+class CamposDinamicosViewSetMixin:
+    # Nombre del campo del serializer -> Prefetch (o ruta) que necesita.
+    prefetch_por_campo = {}
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        incluir, omitir = campos_de_consulta(self.request)
+        if incluir is None and not omitir:
+            return qs.prefetch_related(*self.prefetch_por_campo.values()) if self.prefetch_por_campo else qs
+
+        campos = self.get_serializer().fields
+        prefetch = [valor for nombre, valor in self.prefetch_por_campo.items() if nombre in campos]
+        if prefetch:
+            qs = qs.prefetch_related(*prefetch)
+        columnas = self._columnas(qs, campos)
+        if columnas is not None:
+            qs = self._recortar_select_related(qs, columnas).only(*columnas)
+        return qs
+
+    def _recortar_select_related(self, qs, columnas):
+        # only() no admite diferir una llave que select_related recorre: quitamos los JOIN de relaciones no pedidas.
+        relaciones = qs.query.select_related
+        if not relaciones:
+            return qs
+        if relaciones is True:
+            campos_fk = {campo.name for campo in qs.model._meta.concrete_fields if campo.is_relation}
+            rutas = sorted(campos_fk & set(columnas))
+        else:
+            rutas = [ruta for ruta in _rutas_select_related(relaciones) if ruta.split('__')[0] in columnas]
+        # Sin argumentos select_related() volvería a seguir todas las llaves.
+        qs = qs.select_related(None)
+        return qs.select_related(*rutas) if rutas else qs
+
+    def _columnas(self, qs, campos):
+        modelo = qs.model
+        concretos = {}
+        for campo in modelo._meta.concrete_fields:
+            concretos[campo.name] = campo.name
+            concretos[campo.attname] = campo.name
+        columnas = {modelo._meta.pk.name}
+        for orden in qs.query.order_by:
+            if isinstance(orden, str) and orden.lstrip('-') in concretos:
+                columnas.add(concretos[orden.lstrip('-')])
+        for nombre, campo in campos.items():
+            if campo.write_only or nombre in self.prefetch_por_campo:
+                continue
+            # Métodos o fuentes con relaciones pueden leer cualquier atributo: en ese caso no recortamos.
+            if campo.source not in concretos:
+                return None
+            columnas.add(concretos[campo.source])
+        return sorted(columnas)
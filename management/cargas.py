@@ -0,0 +1,94 @@
+import logging
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import CargaEvidencia
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LECTURA = 64 * 1024
+
+
+class ErrorCarga(Exception):
+    def __init__(self, detalle, recibido=None):
+        super().__init__(detalle)
+        self.detalle = detalle
+        self.recibido = recibido
+
+
+# Archivo ya completo en disco: storage.save lo mueve en lugar de copiarlo (igual que un TemporaryUploadedFile).
+class ArchivoPreparado(File):
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def ruta_temporal(carga):
+    return Path(settings.EVIDENCIA_CARGAS_DIR) / f'{carga.id_carga.hex}.part'
+
+
+def iniciar_carga(nombre_archivo, tamano_total, metadatos, usuario_id):
+    if tamano_total <= 0 or tamano_total > settings.EVIDENCIA_CARGA_MAX_BYTES:
+        raise ErrorCarga(f'El tamaño debe estar entre 1 y {settings.EVIDENCIA_CARGA_MAX_BYTES} bytes.')
+    ahora = timezone.now()
+    carga = CargaEvidencia.objects.create(
+        nombre_archivo=os.path.basename(nombre_archivo)[:260] or 'evidencia',
+        tamano_total=tamano_total,
+        metadatos=metadatos,
+        subido_por=usuario_id,
+        creado_en=ahora,
+        expira_en=ahora + settings.EVIDENCIA_CARGA_TTL,
+    )
+    ruta = ruta_temporal(carga)
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta.touch()
+    return carga
+
+
+# Escribe un bloque en su posición. Un bloque repetido (reintento) se reescribe igual y no avanza el contador.
+def escribir_bloque(carga, desplazamiento, longitud, flujo):
+    if carga.evidencia_id is not None:
+        raise ErrorCarga('La carga ya fue finalizada.', carga.recibido)
+    if desplazamiento > carga.recibido:
+        raise ErrorCarga('El bloque no continúa donde quedó la carga.', carga.recibido)
+    if longitud <= 0 or longitud > settings.EVIDENCIA_CARGA_MAX_BLOQUE:
+        raise ErrorCarga(f'Cada bloque debe tener entre 1 y {settings.EVIDENCIA_CARGA_MAX_BLOQUE} bytes.', carga.recibido)
+    if desplazamiento + longitud > carga.tamano_total:
+        raise ErrorCarga('El bloque excede el tamaño declarado.', carga.recibido)
+
+    escritos = 0
+    with open(ruta_temporal(carga), 'r+b') as destino:
+        destino.seek(desplazamiento)
+        while escritos < longitud:
+            datos = flujo.read(min(TAMANO_LECTURA, longitud - escritos))
+            if not datos:
+                break
+            destino.write(datos)
+            escritos += len(datos)
+    # Si la conexión se cortó a medio bloque contamos solo lo que llegó; el cliente reanuda desde ahí.
+    nuevo = desplazamiento + escritos
+    CargaEvidencia.objects.filter(pk=carga.pk).update(recibido=Greatest('recibido', nuevo))
+    carga.recibido = max(carga.recibido, nuevo)
+    return escritos
+
+
+def eliminar_temporal(carga):
+    try:
+        ruta_temporal(carga).unlink()
+    except FileNotFoundError:
+        pass
+
+
+# Borra cargas vencidas que nunca se finalizaron junto con sus archivos temporales.
+def purgar_cargas_vencidas():
+    vencidas = CargaEvidencia.objects.filter(expira_en__lte=timezone.now())
+    total = 0
+    for carga in vencidas.iterator():
+        eliminar_temporal(carga)
+        total += 1
+    vencidas.delete()
+    return total
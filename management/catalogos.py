@@ -0,0 +1,90 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .models import CatEstatusCredito, CatPresentacion, CatResultadoVisita, CatTiempoCliente
+
+# Catálogos pequeños que casi no cambian: se cargan una vez por proceso y se invalidan por versión.
+# Además cada copia local vence a los CATALOGOS_TTL segundos, por si la caché no es compartida entre procesos.
+CATALOGOS = {
+    'estatus_credito': CatEstatusCredito,
+    'presentacion': CatPresentacion,
+    'resultado_visita': CatResultadoVisita,
+    'tiempo_cliente': CatTiempoCliente,
+}
+
+_locales = {}
+_lock = threading.Lock()
+
+
+def _clave_version(nombre):
+    return f'catalogos:version:{nombre}'
+
+
+def _version(nombre):
+    # La versión vive en la caché compartida para que un cambio en un proceso invalide a los demás.
+    clave = _clave_version(nombre)
+    version = cache.get(clave)
+    if version is None:
+        # Si la clave se perdió usamos una versión nueva, nunca una que un proceso pudo haber visto.
+        cache.add(clave, _version_nueva(), timeout=None)
+        version = cache.get(clave)
+    return version
+
+
+def _version_nueva():
+    return time.time_ns()
+
+
+def _vigente(local, version):
+    return local is not None and local[0] == version and time.monotonic() < local[2]
+
+
+def obtener_catalogo(nombre):
+    version = _version(nombre)
+    local = _locales.get(nombre)
+    if _vigente(local, version):
+        return local[1]
+    with _lock:
+        local = _locales.get(nombre)
+        if _vigente(local, version):
+            return local[1]
+        modelo = CATALOGOS[nombre]
+        registros = {registro.pk: registro for registro in modelo.objects.all()}
+        _locales[nombre] = (version, registros, time.monotonic() + settings.CATALOGOS_TTL)
+        return registros
+
+
+def existe(nombre, valor):
+    return valor in obtener_catalogo(nombre)
+
+
+def obtener(nombre, valor):
+    return obtener_catalogo(nombre).get(valor)
+
+
+def invalidar(nombre):
+    clave = _clave_version(nombre)
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.set(clave, _version_nueva(), timeout=None)
+    _locales.pop(nombre, None)
+
+
+def _invalidar_por_senal(sender, **kwargs):
+    for nombre, modelo in CATALOGOS.items():
+        if modelo is sender:
+            # Tras el commit: si otro proceso recargara antes, guardaría las filas viejas con la versión nueva.
+            # Si la transacción se revierte no hay nada que invalidar.
+            transaction.on_commit(lambda nombre=nombre: invalidar(nombre))
+
+
+def conectar_senales():
+    for modelo in CATALOGOS.values():
+        post_save.connect(_invalidar_por_senal, sender=modelo, dispatch_uid=f'catalogos_save_{modelo.__name__}')
+        post_delete.connect(_invalidar_por_senal, sender=modelo, dispatch_uid=f'catalogos_delete_{modelo.__name__}')
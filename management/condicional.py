@@ -0,0 +1,74 @@
+import hashlib
+from calendar import timegm
+
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .models import ClienteRuta, Ruta
+
+
+# ETag y Last-Modified a partir de max(actualizado_en) y el conteo; así un borrado también cambia la firma.
+def validadores(qs, campos):
+    agregados = {f'ultimo_{i}': Max(campo) for i, campo in enumerate(campos)}
+    # Con campos de relaciones el join repite filas, solo entonces contamos con DISTINCT.
+    distinto = any('__' in campo for campo in campos)
+    datos = qs.aggregate(total=Count('pk', distinct=distinto), **agregados)
+    if not datos['total']:
+        return None, None
+    fechas = [datos[f'ultimo_{i}'] for i in range(len(campos)) if datos[f'ultimo_{i}'] is not None]
+    ultimo = max(fechas) if fechas else None
+    firma = f"{qs.model._meta.label}:{datos['total']}:" + ':'.join(fecha.isoformat() for fecha in fechas)
+    etag = 'W/' + quote_etag(hashlib.md5(firma.encode(), usedforsecurity=False).hexdigest())
+    return etag, (timegm(ultimo.utctimetuple()) if ultimo else None)
+
+
+# GET condicional para list/retrieve: responde 304 antes de serializar si nada cambió.
+class GetCondicionalMixin:
+    # Campos cuya fecha máxima invalida la respuesta; las rutas incluyen la de sus clientes anidados.
+    campos_modificacion = ('actualizado_en',)
+
+    def verificar_condicional(self, request, qs):
+        etag, ultimo = validadores(qs, self.campos_modificacion)
+        self._validadores = (etag, ultimo)
+        if etag is None:
+            return None
+        return get_conditional_response(request, etag=etag, last_modified=ultimo)
+
+    def list(self, request, *args, **kwargs):
+        no_modificado = self.verificar_condicional(request, self.filter_queryset(self.get_queryset()))
+        return no_modificado or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        qs = self.filter_queryset(self.get_queryset()).filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        no_modificado = self.verificar_condicional(request, qs)
+        return no_modificado or super().retrieve(request, *args, **kwargs)
+
+    def perform_update(self, serializer):
+        # Sin esto actualizado_en no cambia al editar y los clientes seguirían recibiendo 304.
+        serializer.save(actualizado_en=timezone.now())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag, ultimo = getattr(self, '_validadores', (None, None))
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            if etag:
+                response['ETag'] = etag
+            if ultimo is not None:
+                response['Last-Modified'] = http_date(ultimo)
+        return response
+
+
+# ClienteRuta no tiene actualizado_en: un cambio en el orden, el resultado o las horas de una visita
+# renueva el de su ruta para que el ETag cambie. bulk_create no envía señales; quien lo usa (RutaSerializer)
+# ya guarda la ruta con actualizado_en nuevo.
+def _al_cambiar_cliente_ruta(sender, instance, **kwargs):
+    Ruta.objects.filter(pk=instance.ruta_id).update(actualizado_en=timezone.now())
+
+
+def conectar_senales():
+    post_save.connect(_al_cambiar_cliente_ruta, sender=ClienteRuta, dispatch_uid='condicional_cliente_ruta_save')
+    post_delete.connect(_al_cambiar_cliente_ruta, sender=ClienteRuta, dispatch_uid='condicional_cliente_ruta_delete')
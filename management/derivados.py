@@ -0,0 +1,160 @@
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .archivos import sincronizar_referencias
+from .models import EvidenciaFotografica
+from .tareas import encolar
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONES = {'JPEG': '.jpg', 'WEBP': '.webp'}
+ORIENTACION = 0x0112
+
+
+def _tamanos():
+    # De mayor a menor: cada versión se reduce a partir de la anterior, no del original.
+    return [('mediana', settings.EVIDENCIA_MEDIANA_PX), ('miniatura', settings.EVIDENCIA_MINIATURA_PX)]
+
+
+def _codificar(imagen, formato, calidad):
+    # Sin exif=: los metadatos (GPS, cámara, orientación) no se copian. El perfil de color sí.
+    opciones = {'quality': calidad}
+    if imagen.info.get('icc_profile'):
+        opciones['icc_profile'] = imagen.info['icc_profile']
+    if formato == 'WEBP':
+        opciones['method'] = 4
+    else:
+        if imagen.mode != 'RGB':
+            imagen = imagen.convert('RGB')
+        opciones.update(optimize=True, progressive=True)
+    buffer = BytesIO()
+    imagen.save(buffer, format=formato, **opciones)
+    return buffer.getvalue()
+
+
+def _jpeg_sin_metadatos(datos, orientacion):
+    # Copia los segmentos del JPEG sin APP1 (EXIF/XMP), APP13 (IPTC) ni comentarios y sin nada después del
+    # fin de imagen (las vistas previas MPF traen su propio EXIF). Los datos comprimidos no se tocan.
+    if datos[:2] != b'\xff\xd8':
+        return None
+    salida = bytearray(b'\xff\xd8')
+    exif = None
+    if orientacion not in (None, 1):
+        # Solo la orientación: la normalización en segundo plano la necesita para enderezar la foto.
+        minimo = Image.Exif()
+        minimo[ORIENTACION] = orientacion
+        exif = minimo.tobytes()
+    posicion = 2
+    while posicion + 4 <= len(datos):
+        if datos[posicion] != 0xFF:
+            return None
+        marcador = datos[posicion + 1]
+        if marcador == 0xDA:
+            if exif is not None:
+                salida += b'\xff\xe1' + (len(exif) + 2).to_bytes(2, 'big') + exif
+                exif = None
+            fin = datos.find(b'\xff\xd9', posicion)
+            if fin < 0:
+                return None
+            salida += datos[posicion:fin + 2]
+            return bytes(salida)
+        largo = int.from_bytes(datos[posicion + 2:posicion + 4], 'big')
+        segmento = datos[posicion:posicion + 2 + largo]
+        if exif is not None and marcador != 0xE0:
+            salida += b'\xff\xe1' + (len(exif) + 2).to_bytes(2, 'big') + exif
+            exif = None
+        if marcador not in (0xE1, 0xED, 0xFE):
+            salida += segmento
+        posicion += 2 + largo
+    return None
+
+
+# Quita los metadatos (GPS, cámara, fecha) antes de guardar la foto. En JPEG es una copia de segmentos sin
+# recomprimir; otros formatos con metadatos se vuelven a codificar. La normalización completa sigue en segundo plano.
+def quitar_metadatos(archivo):
+    archivo.seek(0)
+    datos = archivo.read()
+    archivo.seek(0)
+    try:
+        with Image.open(BytesIO(datos)) as imagen:
+            formato = imagen.format
+            exif = imagen.getexif()
+            con_metadatos = bool(exif) or any(clave in imagen.info for clave in ('exif', 'xmp', 'XML:com.adobe.xmp'))
+            if not con_metadatos:
+                return archivo
+            if formato == 'JPEG':
+                limpio = _jpeg_sin_metadatos(datos, exif.get(ORIENTACION))
+            else:
+                imagen = ImageOps.exif_transpose(imagen)
+                opciones = {'icc_profile': imagen.info['icc_profile']} if imagen.info.get('icc_profile') else {}
+                buffer = BytesIO()
+                imagen.save(buffer, format=formato, **opciones)
+                limpio = buffer.getvalue()
+    except (UnidentifiedImageError, OSError, ValueError):
+        return archivo
+    if limpio is None:
+        return archivo
+    return ContentFile(limpio, name=os.path.basename(archivo.name or 'evidencia'))
+
+
+def _requiere_normalizar(formato, tamano, con_exif):
+    if not settings.EVIDENCIA_NORMALIZAR:
+        return False
+    return formato != settings.EVIDENCIA_FORMATO or max(tamano) > settings.EVIDENCIA_MAX_PX or con_exif
+
+
+# Normaliza la foto subida (orientación, sin metadatos, tamaño y formato) y genera mediana y miniatura.
+# Devuelve False si no hay imagen o no se pudo leer.
+def generar_derivados(evidencia_id):
+    evidencia = EvidenciaFotografica.objects.filter(pk=evidencia_id).only('id', 'imagen', 'miniatura', 'mediana').first()
+    if evidencia is None or not evidencia.imagen:
+        return False
+
+    formato_destino = settings.EVIDENCIA_FORMATO
+    try:
+        with evidencia.imagen.open('rb') as archivo:
+            imagen = Image.open(archivo)
+            formato, tamano = imagen.format, imagen.size
+            con_exif = bool(imagen.info.get('exif') or imagen.info.get('xmp'))
+            normalizar = _requiere_normalizar(formato, tamano, con_exif)
+            # En JPEG, draft decodifica ya reducido: una foto de 12 MP se lee cerca de la escala que vamos a guardar.
+            lado = settings.EVIDENCIA_MAX_PX if normalizar else _tamanos()[0][1]
+            imagen.draft('RGB', (lado, lado))
+            imagen = ImageOps.exif_transpose(imagen)
+            imagen.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError):
+        logger.warning('No se pudo leer la imagen de la evidencia %s (%s)', evidencia_id, evidencia.imagen.name)
+        return False
+
+    storage = EvidenciaFotografica._meta.get_field('imagen').storage
+    extension = EXTENSIONES.get(formato_destino, '.jpg')
+    nuevos = {}
+    if normalizar:
+        imagen.thumbnail((settings.EVIDENCIA_MAX_PX, settings.EVIDENCIA_MAX_PX), Image.LANCZOS)
+        nuevos['imagen'] = storage.save(
+            f'original{extension}', ContentFile(_codificar(imagen, formato_destino, settings.EVIDENCIA_CALIDAD)),
+        )
+    for campo, lado in _tamanos():
+        imagen.thumbnail((lado, lado), Image.LANCZOS)
+        nuevos[campo] = storage.save(
+            f'{campo}{extension}', ContentFile(_codificar(imagen, formato_destino, settings.EVIDENCIA_CALIDAD_JPEG)),
+        )
+
+    # Solo guardamos si la imagen no cambió mientras procesábamos. Los archivos que queden sin
+    # referencia (la foto cruda, derivados anteriores o estos mismos) los borra el recolector de archivos.
+    actualizados = EvidenciaFotografica.objects.filter(pk=evidencia_id, imagen=evidencia.imagen.name).update(**nuevos)
+    if actualizados:
+        for campo, nombre in nuevos.items():
+            setattr(evidencia, campo, nombre)
+        sincronizar_referencias([evidencia])
+    return bool(actualizados)
+
+
+def encolar_derivados(evidencia):
+    if evidencia.imagen:
+        encolar(generar_derivados, evidencia.pk)
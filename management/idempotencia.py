@@ -0,0 +1,129 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import ClaveIdempotencia
+
+IDEMPOTENCY_HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_LONGITUD_CLAVE = 255
+
+# Marca de la última purga de claves vencidas en este proceso.
+_ultima_purga = 0.0
+
+
+def _huella_solicitud(request, clave):
+    usuario = getattr(request.user, 'pk', None) or ''
+    base = f"{usuario}|{request.method}|{request.path}|{clave}"
+    return hashlib.sha256(base.encode('utf-8')).hexdigest()
+
+
+def _huella_cuerpo(request):
+    try:
+        cuerpo = request.body
+    except RawPostDataException:
+        cuerpo = repr(sorted(request.data.items())).encode('utf-8')
+    return hashlib.sha256(cuerpo).hexdigest()
+
+
+def _purgar_vencidas(ahora):
+    # Eliminamos claves vencidas como máximo una vez por intervalo para no cargar cada escritura.
+    global _ultima_purga
+    marca = time.monotonic()
+    if marca - _ultima_purga < settings.IDEMPOTENCIA_INTERVALO_PURGA:
+        return
+    _ultima_purga = marca
+    ClaveIdempotencia.objects.filter(expira_en__lte=ahora).delete()
+
+
+def _respuesta_guardada(registro):
+    if registro.codigo_estado is None:
+        return Response(
+            {"detail": "Ya hay una solicitud en proceso con esta Idempotency-Key."},
+            status=status.HTTP_409_CONFLICT,
+        )
+    response = Response(registro.respuesta, status=registro.codigo_estado)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+# Decorador para acciones POST: la primera respuesta exitosa se guarda y se repite ante reintentos.
+def idempotente(func):
+    @wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        clave = request.META.get(IDEMPOTENCY_HEADER)
+        if request.method != 'POST' or not clave:
+            return func(self, request, *args, **kwargs)
+        if len(clave) > MAX_LONGITUD_CLAVE:
+            return Response(
+                {"detail": f"Idempotency-Key no puede exceder {MAX_LONGITUD_CLAVE} caracteres."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        huella = _huella_solicitud(request, clave)
+        huella_cuerpo = _huella_cuerpo(request)
+        ahora = timezone.now()
+        # En milisegundos, como DATETIME2(3): la reserva se vuelve a buscar por igualdad de creado_en.
+        ahora = ahora.replace(microsecond=ahora.microsecond // 1000 * 1000)
+        _purgar_vencidas(ahora)
+
+        previo = ClaveIdempotencia.objects.filter(huella=huella).first()
+        if previo is not None and previo.expira_en <= ahora:
+            previo.delete()
+            previo = None
+        if previo is not None and previo.codigo_estado is None and previo.creado_en <= ahora - settings.IDEMPOTENCIA_RESERVA:
+            # Reserva sin respuesta más vieja que el plazo: el proceso que la tomó murió a medias. La liberamos
+            # solo si sigue siendo esa misma reserva; si otro la reclamó antes, el create de abajo lo detecta.
+            ClaveIdempotencia.objects.filter(huella=huella, codigo_estado__isnull=True, creado_en=previo.creado_en).delete()
+            previo = None
+        if previo is None:
+            # Reservamos la clave antes de escribir para que un reintento simultáneo no duplique la venta.
+            try:
+                with transaction.atomic():
+                    ClaveIdempotencia.objects.create(
+                        huella=huella,
+                        huella_cuerpo=huella_cuerpo,
+                        creado_en=ahora,
+                        expira_en=ahora + settings.IDEMPOTENCIA_TTL,
+                    )
+            except IntegrityError:
+                previo = ClaveIdempotencia.objects.filter(huella=huella).first()
+                if previo is None:
+                    return Response(
+                        {"detail": "No se pudo reservar la Idempotency-Key, intente de nuevo."},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+
+        if previo is not None:
+            if previo.huella_cuerpo != huella_cuerpo:
+                return Response(
+                    {"detail": "La Idempotency-Key ya se usó con un cuerpo de solicitud distinto."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            return _respuesta_guardada(previo)
+
+        # Filtramos por creado_en para tocar solo nuestra reserva, no una que otro reclamó al vencer el plazo.
+        reserva = ClaveIdempotencia.objects.filter(huella=huella, creado_en=ahora)
+        try:
+            response = func(self, request, *args, **kwargs)
+        except Exception:
+            reserva.delete()
+            raise
+
+        if status.is_success(response.status_code):
+            reserva.update(
+                codigo_estado=response.status_code,
+                respuesta=response.data,
+            )
+        else:
+            # Los errores no se guardan para que el cliente pueda corregir y reintentar con la misma clave.
+            reserva.delete()
+        return response
+
+    return wrapper
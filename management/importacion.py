@@ -0,0 +1,368 @@
+import codecs
+import csv
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import catalogos
+from .metricas import registrar_importacion
+from .models import Cliente, ItemImportacion, LoteImportacion, Producto
+from .tareas import encolar
+
+CAMPOS_CLIENTE = ['nit', 'nombre', 'direccion', 'correo_electronico', 'estatus_credito']
+CAMPOS_ACTUALIZABLES = ['nombre', 'direccion', 'correo_electronico', 'estatus_credito', 'actualizado_en']
+
+
+def _lineas_texto(archivo, tamano_lectura):
+    # Decodificamos por trozos acotados; solo guardamos en memoria la línea incompleta del trozo anterior.
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pendiente = ''
+    for chunk in archivo.chunks(tamano_lectura):
+        partes = (pendiente + decoder.decode(chunk)).split('\n')
+        pendiente = partes.pop()
+        for parte in partes:
+            yield parte + '\n'
+    pendiente += decoder.decode(b'', final=True)
+    if pendiente:
+        yield pendiente
+
+
+# Lector CSV incremental sobre el archivo subido (en memoria o temporal en disco).
+def leer_csv(archivo, tamano_lectura=None):
+    tamano_lectura = tamano_lectura or settings.IMPORTACION_TAMANO_LECTURA
+    return csv.DictReader(_lineas_texto(archivo, tamano_lectura))
+
+
+# SHA-256 del archivo leído por trozos; sirve para detectar cargas repetidas antes de procesarlas.
+def calcular_hash(archivo, tamano_lectura=None):
+    tamano_lectura = tamano_lectura or settings.IMPORTACION_TAMANO_LECTURA
+    digest = hashlib.sha256()
+    for chunk in archivo.chunks(tamano_lectura):
+        digest.update(chunk)
+    return digest.digest()
+
+
+# Lotes que terminaron sin cargar (errores de validación o falla al procesar).
+ESTADOS_FALLIDOS = ('VALIDADO', 'ERROR')
+
+
+# Lote cargado o en curso con el mismo archivo. Un lote fallido no bloquea el reenvío: se libera su hash
+# para que la nueva carga lo reemplace (p. ej. cuando ya existen las rutas o catálogos que faltaban).
+def buscar_lote_por_hash(hash_archivo):
+    lote = LoteImportacion.objects.filter(hash_archivo=hash_archivo).first()
+    if lote is not None and lote.estado in ESTADOS_FALLIDOS:
+        LoteImportacion.objects.filter(id_lote=lote.id_lote, estado=lote.estado).update(hash_archivo=None)
+        return None
+    return lote
+
+
+def normalizar_fila(row):
+    normalized_row = {
+        (k or '').strip().lower(): (v.strip() if isinstance(v, str) else v)
+        for k, v in row.items()
+    }
+    if not any(normalized_row.values()):
+        return None  # fila en blanco
+    return {
+        'nit': normalized_row.get('nit') or '',
+        'nombre': normalized_row.get('nombre') or '',
+        'direccion': normalized_row.get('direccion') or None,
+        'correo_electronico': normalized_row.get('correo_electronico') or None,
+        'estatus_credito': (normalized_row.get('estatus_credito') or 'B')[:2],
+    }
+
+
+# Validamos en Python con los mismos validadores del modelo para no consultar la base por fila.
+def validar_cliente(data):
+    errores = {}
+    for nombre in CAMPOS_CLIENTE:
+        field = Cliente._meta.get_field(nombre)
+        value = data.get(nombre)
+        if value in (None, ''):
+            if not field.blank and not field.has_default():
+                errores[nombre] = ['Este campo es obligatorio.']
+            continue
+        try:
+            field.run_validators(value)
+        except ValidationError as exc:
+            errores[nombre] = list(exc.messages)
+    estatus = data.get('estatus_credito')
+    if estatus and 'estatus_credito' not in errores and not catalogos.existe('estatus_credito', estatus):
+        errores['estatus_credito'] = [f"Estatus de crédito '{estatus}' no existe."]
+    return errores
+
+
+def _en_bloques(items, tamano):
+    bloque = []
+    for item in items:
+        bloque.append(item)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def _aplicar_bloque(filas, ahora):
+    # Si el mismo NIT aparece varias veces en el bloque, la última fila gana como en la carga fila por fila.
+    por_nit = {}
+    repetidos = 0
+    for data in filas:
+        if data['nit'] in por_nit:
+            repetidos += 1
+        por_nit[data['nit']] = data
+
+    existentes = Cliente.objects.in_bulk(list(por_nit), field_name='nit')
+    nuevos = []
+    cambios = []
+    for nit, data in por_nit.items():
+        cliente = existentes.get(nit)
+        if cliente is None:
+            nuevos.append(Cliente(creado_en=ahora, actualizado_en=ahora, **data))
+            continue
+        for campo in CAMPOS_CLIENTE[1:]:
+            setattr(cliente, campo, data[campo])
+        cliente.actualizado_en = ahora
+        cambios.append(cliente)
+
+    if nuevos:
+        Cliente.objects.bulk_create(nuevos)
+    if cambios:
+        Cliente.objects.bulk_update(cambios, CAMPOS_ACTUALIZABLES)
+    return len(nuevos), len(cambios) + repetidos
+
+
+# Recibe pares (fila, datos crudos) y escribe por bloques; debe ejecutarse dentro de una transacción.
+def importar_clientes(filas, tamano_bloque=None):
+    tamano_bloque = tamano_bloque or settings.IMPORTACION_TAMANO_BLOQUE
+    errores = []
+    creados = 0
+    actualizados = 0
+    procesadas = 0
+    inicio = time.perf_counter()
+    ahora = timezone.now()
+
+    for bloque in _en_bloques(filas, tamano_bloque):
+        validas = []
+        for idx, row in bloque:
+            data = normalizar_fila(row)
+            if data is None:
+                continue
+            procesadas += 1
+            errores_fila = validar_cliente(data)
+            if errores_fila:
+                errores.append({'fila': idx, 'errores': errores_fila})
+            else:
+                validas.append(data)
+        # Con errores la transacción se revierte; solo seguimos validando para reportarlos todos.
+        if errores or not validas:
+            continue
+        nuevos, cambios = _aplicar_bloque(validas, ahora)
+        creados += nuevos
+        actualizados += cambios
+
+    registrar_importacion('clientes_csv', procesadas, time.perf_counter() - inicio)
+    return creados, actualizados, errores
+
+
+# Guardamos las filas normalizadas del CSV en items_importacion y dejamos el lote en cola.
+def crear_lote(reader, nombre_archivo, usuario_id, hash_archivo=None):
+    tamano_bloque = settings.IMPORTACION_TAMANO_BLOQUE
+    with transaction.atomic():
+        lote = LoteImportacion.objects.create(
+            nombre_archivo=nombre_archivo[:260],
+            hash_archivo=hash_archivo,
+            estado='PENDIENTE',
+            subido_por=usuario_id,
+        )
+        for bloque in _en_bloques(enumerate(reader, start=2), tamano_bloque):
+            items = []
+            for idx, row in bloque:
+                data = normalizar_fila(row)
+                if data is None:
+                    continue
+                items.append(ItemImportacion(id_lote=lote, fila=idx, datos_json=json.dumps(data)))
+            ItemImportacion.objects.bulk_create(items)
+        encolar(procesar_lote, lote.id_lote)
+    return lote
+
+
+def _items_por_bloque(lote, tamano_bloque, **filtros):
+    # Recorremos por id_item para que cada bloque use el índice y no un OFFSET creciente.
+    ultimo = 0
+    while True:
+        items = list(
+            ItemImportacion.objects.filter(id_lote=lote, id_item__gt=ultimo, **filtros).order_by('id_item')[:tamano_bloque]
+        )
+        if not items:
+            break
+        yield items
+        ultimo = items[-1].id_item
+
+
+def procesar_lote(id_lote):
+    tamano_bloque = settings.IMPORTACION_TAMANO_BLOQUE
+    # Reclamamos el lote para que otro proceso no lo tome al mismo tiempo.
+    reclamado = LoteImportacion.objects.filter(id_lote=id_lote, estado='PENDIENTE').update(
+        estado='EN_PROCESO', reclamado_en=timezone.now(),
+    )
+    if not reclamado:
+        return
+    lote = LoteImportacion.objects.get(id_lote=id_lote)
+    inicio = time.perf_counter()
+
+    try:
+        for items in _items_por_bloque(lote, tamano_bloque):
+            for item in items:
+                errores = validar_cliente(json.loads(item.datos_json))
+                item.valido = not errores
+                item.errores_json = json.dumps(errores) if errores else None
+            ItemImportacion.objects.bulk_update(items, ['valido', 'errores_json'])
+            # Avisamos que seguimos vivos para que no lo tomen como abandonado.
+            LoteImportacion.objects.filter(id_lote=lote.id_lote).update(reclamado_en=timezone.now())
+
+        # Sin errores sigue EN_PROCESO hasta quedar CARGADO: VALIDADO solo marca lotes rechazados.
+        if lote.items.filter(valido=False).exists():
+            lote.estado = 'VALIDADO'
+            lote.comentarios = json.dumps({'detail': 'Se encontraron errores de validación.'})
+            lote.save(update_fields=['estado', 'comentarios'])
+            return
+
+        creados = 0
+        actualizados = 0
+        ahora = timezone.now()
+        with transaction.atomic():
+            for items in _items_por_bloque(lote, tamano_bloque, valido=True):
+                nuevos, cambios = _aplicar_bloque([json.loads(item.datos_json) for item in items], ahora)
+                creados += nuevos
+                actualizados += cambios
+            lote.estado = 'CARGADO'
+            lote.comentarios = json.dumps({'creados': creados, 'actualizados': actualizados})
+            lote.save(update_fields=['estado', 'comentarios'])
+        registrar_importacion('clientes_lote', creados + actualizados, time.perf_counter() - inicio)
+    except Exception as exc:
+        # Dejamos el motivo en el lote; se puede reintentar con 'procesar_lotes --lote <id>'.
+        lote.estado = 'ERROR'
+        lote.comentarios = json.dumps({'detail': f'Error al procesar el lote: {exc}'})[:500]
+        LoteImportacion.objects.filter(id_lote=lote.id_lote).update(estado=lote.estado, comentarios=lote.comentarios)
+        raise
+
+
+# Deja constancia de una importación directa ya aplicada para reconocer el mismo archivo después.
+def registrar_lote_cargado(nombre_archivo, usuario_id, hash_archivo, creados, actualizados):
+    return LoteImportacion.objects.create(
+        nombre_archivo=nombre_archivo[:260],
+        hash_archivo=hash_archivo,
+        estado='CARGADO',
+        subido_por=usuario_id,
+        comentarios=json.dumps({'creados': creados, 'actualizados': actualizados}),
+    )
+
+
+# Devuelve un lote no cargado a la cola, limpiando los resultados de validación previos.
+def reiniciar_lote(lote):
+    if lote.estado == 'CARGADO':
+        return False
+    with transaction.atomic():
+        lote.items.update(valido=False, errores_json=None)
+        LoteImportacion.objects.filter(id_lote=lote.id_lote).update(estado='PENDIENTE', comentarios=None, reclamado_en=None)
+    return True
+
+
+# Lotes EN_PROCESO sin avance en IMPORTACION_LOTE_ABANDONADO_MINUTOS (el proceso murió, se reinició el worker
+# o se perdió la tarea): vuelven a la cola. Los anteriores a reclamado_en no tienen marca y también vuelven.
+def reencolar_abandonados():
+    limite = timezone.now() - timedelta(minutes=settings.IMPORTACION_LOTE_ABANDONADO_MINUTOS)
+    ids = list(
+        LoteImportacion.objects.filter(estado='EN_PROCESO')
+        .filter(Q(reclamado_en__lt=limite) | Q(reclamado_en__isnull=True))
+        .values_list('id_lote', flat=True)
+    )
+    with transaction.atomic():
+        ItemImportacion.objects.filter(id_lote__in=ids).update(valido=False, errores_json=None)
+        # El filtro por estado evita devolver uno que terminó mientras tanto.
+        LoteImportacion.objects.filter(id_lote__in=ids, estado='EN_PROCESO').update(
+            estado='PENDIENTE', comentarios=None, reclamado_en=None,
+        )
+    return ids
+
+
+def progreso_lote(lote):
+    conteo = lote.items.aggregate(
+        total=Count('id_item'),
+        validos=Count('id_item', filter=Q(valido=True)),
+        con_error=Count('id_item', filter=Q(valido=False, errores_json__isnull=False)),
+    )
+    procesados = conteo['validos'] + conteo['con_error']
+    conteo['procesados'] = procesados
+    conteo['porcentaje'] = round(procesados * 100 / conteo['total'], 1) if conteo['total'] else 100.0
+    return conteo
+
+
+CAMPOS_PRODUCTO_ACTUALIZABLES = ['descripcion', 'color', 'precio_unitario', 'presentacion', 'actualizado_en']
+
+
+# Alta o actualización masiva de productos; recibe pares (fila, datos) y escribe todo o nada.
+def cargar_productos(filas):
+    from .serializers import ProductoCargaSerializer
+
+    resultados = []
+    validos = {}
+    inicio = time.perf_counter()
+    for fila, datos in filas:
+        if 'presentacion_id' not in datos and 'presentacion' in datos:
+            datos = dict(datos, presentacion_id=datos['presentacion'])
+        serializer = ProductoCargaSerializer(data=datos)
+        if not serializer.is_valid():
+            resultados.append({'fila': fila, 'codigo': datos.get('codigo'), 'estado': 'error', 'errores': serializer.errors})
+            continue
+        data = serializer.validated_data
+        if data['codigo'] in validos:
+            resultados.append({'fila': fila, 'codigo': data['codigo'], 'estado': 'error', 'errores': {'codigo': ['Código repetido en la carga.']}})
+            continue
+        validos[data['codigo']] = (fila, data)
+        resultados.append({'fila': fila, 'codigo': data['codigo'], 'estado': None})
+
+    if any(resultado['estado'] == 'error' for resultado in resultados):
+        for resultado in resultados:
+            resultado['estado'] = resultado['estado'] or 'sin_cambios'
+        return resultados, False
+
+    ahora = timezone.now()
+    existentes = set(Producto.objects.in_bulk(list(validos), field_name='codigo'))
+    productos = [
+        Producto(
+            codigo=codigo,
+            descripcion=data['descripcion'],
+            color=data.get('color') or None,
+            precio_unitario=data['precio_unitario'],
+            presentacion_id=data['presentacion_id'],
+            creado_en=ahora,
+            actualizado_en=ahora,
+        )
+        for codigo, (_, data) in validos.items()
+    ]
+    with transaction.atomic():
+        if connection.features.supports_update_conflicts_with_target:
+            # Un solo INSERT ... ON CONFLICT: creado_en se conserva porque no está en update_fields.
+            Producto.objects.bulk_create(
+                productos,
+                update_conflicts=True,
+                unique_fields=['codigo'],
+                update_fields=CAMPOS_PRODUCTO_ACTUALIZABLES,
+            )
+        else:
+            Producto.objects.bulk_create([p for p in productos if p.codigo not in existentes])
+            Producto.objects.bulk_update([p for p in productos if p.codigo in existentes], CAMPOS_PRODUCTO_ACTUALIZABLES)
+
+    for resultado in resultados:
+        resultado['estado'] = 'actualizado' if resultado['codigo'] in existentes else 'creado'
+    registrar_importacion('productos', len(productos), time.perf_counter() - inicio)
+    return resultados, True
@@ -0,0 +1,179 @@
+import gzip
+import json
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+
+from .metricas import registrar_importacion
+from .models import Cliente, DetalleVenta, Producto, Ruta, Venta
+from .serializers import VentaIngestaSerializer
+
+
+def abrir_flujo(stream, content_encoding):
+    # Descomprimimos al vuelo para no cargar el archivo completo en memoria.
+    if stream is None:
+        return None
+    if (content_encoding or '').strip().lower() in ('gzip', 'x-gzip'):
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    return stream
+
+
+# Marca de una línea que supera INGESTA_MAX_BYTES_LINEA; se reporta como error de esa línea.
+LINEA_LARGA = object()
+
+
+def _descartar_resto(flujo, limite):
+    # Leemos el resto de la línea por trozos acotados, sin juntarlo en memoria.
+    while True:
+        trozo = flujo.readline(limite)
+        if not trozo or trozo.endswith(b'\n'):
+            return
+
+
+def _leer_registros(flujo):
+    limite = settings.INGESTA_MAX_BYTES_LINEA
+    numero = 0
+    while True:
+        # Con tope: un cuerpo sin saltos de línea (o un gzip que se expande) no se carga entero.
+        linea = flujo.readline(limite + 1)
+        if not linea:
+            break
+        numero += 1
+        if len(linea) > limite and not linea.endswith(b'\n'):
+            _descartar_resto(flujo, limite)
+            yield numero, LINEA_LARGA
+            continue
+        if not linea.strip():
+            continue
+        try:
+            yield numero, json.loads(linea)
+        except ValueError:
+            yield numero, None
+
+
+def _agrupar(registros, tamano):
+    bloque = []
+    for registro in registros:
+        bloque.append(registro)
+        if len(bloque) >= tamano:
+            yield bloque
+            bloque = []
+    if bloque:
+        yield bloque
+
+
+def _resultado(numero, ref, **extra):
+    data = {'linea': numero}
+    if ref:
+        data['ref'] = ref
+    data.update(extra)
+    return data
+
+
+def _procesar_bloque(bloque):
+    resultados = {}
+    validos = []
+    for numero, registro in bloque:
+        if registro is LINEA_LARGA:
+            errores = {'linea': [f'El registro supera {settings.INGESTA_MAX_BYTES_LINEA} bytes.']}
+            resultados[numero] = _resultado(numero, None, estado='error', errores=errores)
+            continue
+        if not isinstance(registro, dict):
+            resultados[numero] = _resultado(numero, None, estado='error', errores={'linea': ['JSON inválido.']})
+            continue
+        serializer = VentaIngestaSerializer(data=registro)
+        if serializer.is_valid():
+            validos.append((numero, serializer.validated_data))
+        else:
+            resultados[numero] = _resultado(numero, registro.get('ref'), estado='error', errores=serializer.errors)
+
+    # Resolvemos todas las referencias del bloque con una consulta por tabla.
+    nits = {data['nit_cliente'] for _, data in validos}
+    rutas = {data['id_ruta'] for _, data in validos if data.get('id_ruta') is not None}
+    codigos = {
+        detalle['codigo_producto']
+        for _, data in validos
+        for detalle in data.get('detalles', [])
+        if detalle.get('codigo_producto')
+    }
+    nits_existentes = set(Cliente.objects.filter(nit__in=nits).values_list('nit', flat=True)) if nits else set()
+    rutas_existentes = set(Ruta.objects.filter(id_ruta__in=rutas).values_list('id_ruta', flat=True)) if rutas else set()
+    codigos_existentes = set(Producto.objects.filter(codigo__in=codigos).values_list('codigo', flat=True)) if codigos else set()
+
+    por_crear = []
+    for numero, data in validos:
+        errores = {}
+        if data['nit_cliente'] not in nits_existentes:
+            errores['nit_cliente'] = [f"Cliente '{data['nit_cliente']}' no existe."]
+        if data.get('id_ruta') is not None and data['id_ruta'] not in rutas_existentes:
+            errores['id_ruta'] = [f"Ruta '{data['id_ruta']}' no existe."]
+        faltantes = sorted({
+            detalle['codigo_producto']
+            for detalle in data.get('detalles', [])
+            if detalle.get('codigo_producto') and detalle['codigo_producto'] not in codigos_existentes
+        })
+        if faltantes:
+            errores['detalles'] = [f"Producto '{codigo}' no existe." for codigo in faltantes]
+        if errores:
+            resultados[numero] = _resultado(numero, data.get('ref'), estado='error', errores=errores)
+        else:
+            por_crear.append((numero, data))
+
+    if por_crear:
+        try:
+            with transaction.atomic():
+                ventas = [
+                    Venta(
+                        fecha=data['fecha'],
+                        nit_cliente_id=data['nit_cliente'],
+                        id_ruta_id=data.get('id_ruta'),
+                        total=data['total'],
+                    )
+                    for _, data in por_crear
+                ]
+                if connection.features.can_return_rows_from_bulk_insert:
+                    Venta.objects.bulk_create(ventas)
+                else:
+                    for venta in ventas:
+                        venta.save()
+                detalles = [
+                    DetalleVenta(
+                        id_venta=venta,
+                        linea=detalle['linea'],
+                        codigo_producto_id=detalle.get('codigo_producto') or None,
+                        cantidad=detalle['cantidad'],
+                        precio_unitario=detalle['precio_unitario'],
+                    )
+                    for venta, (_, data) in zip(ventas, por_crear)
+                    for detalle in data.get('detalles', [])
+                ]
+                DetalleVenta.objects.bulk_create(detalles, batch_size=settings.INGESTA_TAMANO_BLOQUE)
+        except DatabaseError as exc:
+            for numero, data in por_crear:
+                resultados[numero] = _resultado(numero, data.get('ref'), estado='error', errores={'bloque': [str(exc)]})
+        else:
+            for venta, (numero, data) in zip(ventas, por_crear):
+                resultados[numero] = _resultado(numero, data.get('ref'), estado='ok', id_venta=venta.id_venta)
+
+    return [resultados[numero] for numero, _ in bloque]
+
+
+# Genera una línea NDJSON de resultado por cada venta recibida y un resumen al final.
+def ingerir_ventas(flujo):
+    creadas = 0
+    con_error = 0
+    inicio = time.perf_counter()
+    try:
+        for bloque in _agrupar(_leer_registros(flujo), settings.INGESTA_TAMANO_BLOQUE):
+            for resultado in _procesar_bloque(bloque):
+                if resultado['estado'] == 'ok':
+                    creadas += 1
+                else:
+                    con_error += 1
+                yield json.dumps(resultado, default=str) + '\n'
+    except (OSError, EOFError) as exc:
+        # Un gzip truncado o corrupto detiene la lectura; lo ya confirmado por bloque se conserva.
+        yield json.dumps({'error': f'Flujo inválido: {exc}'}) + '\n'
+    registrar_importacion('ventas_ndjson', creadas + con_error, time.perf_counter() - inicio)
+    yield json.dumps({'resumen': {'creadas': creadas, 'con_error': con_error}}) + '\n'
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from management.derivados import generar_derivados
+from management.models import EvidenciaFotografica
+
+
+def _generar(evidencia_id):
+    try:
+        return generar_derivados(evidencia_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    # Genera miniatura y versión mediana de las evidencias que aún no las tienen (fotos previas en media/evidencias/).
+    help = 'Backfill thumbnail and medium derivatives for evidence photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--todas', action='store_true', help='Regenerar también las que ya tienen derivados')
+        parser.add_argument('--hilos', type=int, default=4, help='Imágenes procesadas en paralelo')
+        parser.add_argument('--bloque', type=int, default=500)
+
+    def handle(self, *args, **options):
+        qs = EvidenciaFotografica.objects.exclude(imagen__isnull=True).exclude(imagen='')
+        if not options['todas']:
+            qs = qs.filter(miniatura__isnull=True)
+
+        generadas = fallidas = 0
+        ultimo_id = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['hilos'])) as executor:
+            while True:
+                # Avanzamos por id para no repetir ni saltar filas mientras se actualizan.
+                ids = list(qs.filter(id__gt=ultimo_id).order_by('id').values_list('id', flat=True)[:options['bloque']])
+                if not ids:
+                    break
+                ultimo_id = ids[-1]
+                for ok in executor.map(_generar, ids):
+                    if ok:
+                        generadas += 1
+                    else:
+                        fallidas += 1
+                self.stdout.write(f'Hasta evidencia {ultimo_id}: {generadas} generadas, {fallidas} sin imagen legible')
+        self.stdout.write(self.style.SUCCESS(f'{generadas} evidencia(s) con derivados, {fallidas} omitida(s)'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from management.metricas import limpiar_directorio
+
+
+class Command(BaseCommand):
+    # Borra los archivos de métricas de workers anteriores; correr antes de arrancar gunicorn.
+    help = 'Delete per-process metrics files left in METRICAS_DIR'
+
+    def handle(self, *args, **options):
+        total = limpiar_directorio()
+        self.stdout.write(self.style.SUCCESS(f'{total} archivo(s) de métricas eliminado(s)'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from management.importacion import procesar_lote, reencolar_abandonados, reiniciar_lote
+from management.models import LoteImportacion
+
+
+class Command(BaseCommand):
+    # Procesa lotes de importación pendientes, por ejemplo después de reiniciar el servidor.
+    help = 'Validate and load pending import batches (lotes_importacion)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, help='Reprocesar un lote específico aunque haya quedado a medias (también EN_PROCESO)')
+
+    def handle(self, *args, **options):
+        if options.get('lote'):
+            lote = LoteImportacion.objects.filter(id_lote=options['lote']).first()
+            if lote is None:
+                raise CommandError(f"Lote {options['lote']} no existe")
+            if not reiniciar_lote(lote):
+                raise CommandError(f"Lote {lote.id_lote} ya fue cargado")
+            ids = [lote.id_lote]
+        else:
+            for id_lote in reencolar_abandonados():
+                self.stdout.write(f'Lote {id_lote}: EN_PROCESO sin avance, vuelve a la cola')
+            ids = list(
+                LoteImportacion.objects.filter(estado='PENDIENTE')
+                .order_by('subido_en')
+                .values_list('id_lote', flat=True)
+            )
+
+        for id_lote in ids:
+            procesar_lote(id_lote)
+            lote = LoteImportacion.objects.get(id_lote=id_lote)
+            self.stdout.write(f'Lote {id_lote}: {lote.estado} {lote.comentarios or ""}')
+        self.stdout.write(self.style.SUCCESS(f'{len(ids)} lote(s) procesado(s)'))
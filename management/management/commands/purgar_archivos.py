@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from management.archivos import recolectar_huerfanos
+
+
+class Command(BaseCommand):
+    # Recolector de archivos de evidencia: borra los que ya no tienen referencias en sistema.archivos.
+    help = 'Delete content-addressed evidence files that are no longer referenced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gracia-horas', type=float, default=24, help='No tocar archivos modificados hace menos de estas horas')
+        parser.add_argument('--simular', action='store_true', help='Solo listar lo que se borraría')
+
+    def handle(self, *args, **options):
+        borrados = recolectar_huerfanos(options['gracia_horas'] * 3600, simular=options['simular'])
+        for nombre in borrados:
+            self.stdout.write(nombre)
+        accion = 'se borrarían' if options['simular'] else 'borrado(s)'
+        self.stdout.write(self.style.SUCCESS(f'{len(borrados)} archivo(s) sin referencias {accion}'))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from management.cargas import purgar_cargas_vencidas
+
+
+class Command(BaseCommand):
+    # Elimina subidas por partes vencidas y sus archivos temporales; pensado para correr en un cron.
+    help = 'Delete expired chunked evidence uploads and their staging files'
+
+    def handle(self, *args, **options):
+        total = purgar_cargas_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'{total} carga(s) vencida(s) eliminada(s)'))
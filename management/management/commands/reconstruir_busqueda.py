@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    # Reconstruye el índice de búsqueda de clientes (por ejemplo después de un VACUUM en SQLite).
+    help = 'Rebuild the client full-text search index'
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute("INSERT INTO clientes_fts(clientes_fts) VALUES ('rebuild')")
+            elif connection.vendor == 'microsoft':
+                cursor.execute("ALTER FULLTEXT INDEX ON sistema.clientes START FULL POPULATION")
+            else:
+                self.stdout.write(self.style.WARNING('Motor sin índice de texto completo; nada que reconstruir'))
+                return
+        self.stdout.write(self.style.SUCCESS('Índice de búsqueda de clientes reconstruido'))
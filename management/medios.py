@@ -0,0 +1,155 @@
+import mimetypes
+import os
+import re
+import stat
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.encoding import filepath_to_uri
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework.views import APIView
+
+from .almacenamiento import NOMBRE_CONTENIDO, almacenamiento_evidencias
+
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+TAMANO_LECTURA = 64 * 1024
+# private: los archivos requieren autenticación y no deben quedar en cachés compartidas.
+CACHE_INMUTABLE = 'private, max-age=31536000, immutable'
+
+
+def _rango(request, tamano, etag, modificado):
+    encabezado = request.META.get('HTTP_RANGE', '').strip()
+    if not encabezado:
+        return None
+    # If-Range: si el archivo cambió desde que el cliente guardó el pedazo, se envía completo.
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range:
+        fecha = parse_http_date_safe(if_range)
+        if fecha is None and etag not in parse_etags(if_range):
+            return None
+        if fecha is not None and int(modificado) > fecha:
+            return None
+    coincidencia = RANGO.match(encabezado)
+    if not coincidencia or coincidencia.groups() == ('', ''):
+        # Varios rangos o sintaxis desconocida: se ignora y se envía el archivo completo.
+        return None
+    inicio, fin = coincidencia.groups()
+    if inicio == '':
+        inicio, fin = max(tamano - int(fin), 0), tamano - 1
+    else:
+        inicio, fin = int(inicio), min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+def _leer(ruta, inicio, longitud):
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        while longitud > 0:
+            datos = archivo.read(min(TAMANO_LECTURA, longitud))
+            if not datos:
+                break
+            longitud -= len(datos)
+            yield datos
+
+
+# Prefijo absoluto de MEDIA_URL: se calcula una vez por respuesta y cada URL es solo una concatenación.
+def prefijo_media(request):
+    if request is None or settings.MEDIA_URL.startswith(('http://', 'https://')):
+        return settings.MEDIA_URL
+    return request.build_absolute_uri(settings.MEDIA_URL)
+
+
+def url_media(prefijo, nombre):
+    return prefijo + filepath_to_uri(nombre) if nombre else None
+
+
+def ruta_descarga_interna(prefijo, relativa):
+    if settings.ARCHIVOS_DESCARGA == 'x-accel' and prefijo and relativa:
+        return prefijo.rstrip('/') + '/' + relativa.replace(os.sep, '/')
+    return None
+
+
+# Entrega un archivo con ETag, Last-Modified, Range y Cache-Control. Con ARCHIVOS_DESCARGA configurado
+# el servidor web (nginx: X-Accel-Redirect, Apache/lighttpd: X-Sendfile) envía los bytes y el worker queda libre.
+def servir_archivo(request, ruta, *, etag=None, inmutable=False, tipo=None, nombre_descarga=None, ruta_interna=None):
+    try:
+        estado = os.stat(ruta)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404('Archivo no encontrado')
+    if not stat.S_ISREG(estado.st_mode):
+        raise Http404('Archivo no encontrado')
+    tamano, modificado = estado.st_size, estado.st_mtime
+    etag = quote_etag(etag or f'{estado.st_mtime_ns:x}-{tamano:x}')
+
+    def encabezados(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(modificado)
+        response['Cache-Control'] = CACHE_INMUTABLE if inmutable else 'private, max-age=0, must-revalidate'
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    no_modificado = get_conditional_response(request, etag=etag, last_modified=int(modificado))
+    if no_modificado is not None:
+        return encabezados(no_modificado)
+
+    if settings.ARCHIVOS_DESCARGA == 'x-sendfile':
+        response = HttpResponse(content_type=tipo)
+        response['X-Sendfile'] = os.fspath(ruta)
+    elif ruta_interna:
+        response = HttpResponse(content_type=tipo)
+        response['X-Accel-Redirect'] = ruta_interna
+    else:
+        response = None
+
+    if response is not None:
+        # El servidor web resuelve Range y Content-Length por su cuenta.
+        if nombre_descarga:
+            response['Content-Disposition'] = f'attachment; filename="{nombre_descarga}"'
+        return encabezados(response)
+
+    rango = _rango(request, tamano, etag, modificado)
+    if rango is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{tamano}'
+        return encabezados(response)
+    if rango:
+        inicio, fin = rango
+        response = StreamingHttpResponse(_leer(ruta, inicio, fin - inicio + 1), status=206, content_type=tipo)
+        response['Content-Length'] = str(fin - inicio + 1)
+        response['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+    else:
+        # FileResponse usa wsgi.file_wrapper (sendfile en gunicorn/uwsgi) para el archivo completo.
+        response = FileResponse(
+            open(ruta, 'rb'), content_type=tipo, as_attachment=bool(nombre_descarga), filename=nombre_descarga or '',
+        )
+    if nombre_descarga and 'Content-Disposition' not in response:
+        response['Content-Disposition'] = f'attachment; filename="{nombre_descarga}"'
+    return encabezados(response)
+
+
+# Archivos de evidencia fuera de DEBUG, con la misma autenticación JWT y permisos que /api/evidencias/.
+# Los nombres por contenido nunca cambian: el navegador los cachea un año.
+class MedioEvidenciaView(APIView):
+    http_method_names = ['get', 'head']
+
+    def get(self, request, nombre):
+        nombre = f'evidencias/{nombre}'
+        try:
+            ruta = almacenamiento_evidencias.path(nombre)
+        except SuspiciousFileOperation:
+            raise Http404('Archivo no encontrado')
+        base = PurePosixPath(nombre).name
+        por_contenido = bool(NOMBRE_CONTENIDO.match(base))
+        return servir_archivo(
+            request,
+            ruta,
+            etag=base.split('.')[0] if por_contenido else None,
+            inmutable=por_contenido,
+            tipo=mimetypes.guess_type(base)[0] or 'application/octet-stream',
+            ruta_interna=ruta_descarga_interna(settings.MEDIA_ACCEL_PREFIX, nombre),
+        )
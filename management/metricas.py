@@ -0,0 +1,268 @@
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Archivo de valores por proceso: [uint32 bytes usados][relleno] y luego entradas
+# [uint32 largo clave][clave utf-8 rellena a 8 bytes][float64 valor]. Solo lo escribe su proceso.
+ENCABEZADO = 8
+CAPACIDAD_INICIAL = 64 * 1024
+TIPO_CONTENIDO = 'text/plain; version=0.0.4; charset=utf-8'
+TIPOS_CONSULTA = ('select', 'insert', 'update', 'delete')
+METODOS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+_FAMILIAS = {}
+
+
+def _relleno(largo):
+    return (largo + 7) // 8 * 8
+
+
+def _entradas(datos):
+    usados = struct.unpack_from('<I', datos, 0)[0]
+    posicion = ENCABEZADO
+    while posicion < usados:
+        largo = struct.unpack_from('<I', datos, posicion)[0]
+        clave = bytes(datos[posicion + 4:posicion + 4 + largo]).decode('utf-8')
+        valor = posicion + _relleno(4 + largo)
+        yield clave, valor
+        posicion = valor + 8
+
+
+class _Valores:
+    def __init__(self, ruta=None):
+        self.lock = threading.Lock()
+        self.ruta = ruta
+        if ruta is None:
+            self.datos = bytearray(CAPACIDAD_INICIAL)
+        else:
+            self.archivo = open(ruta, 'a+b')
+            if os.fstat(self.archivo.fileno()).st_size < CAPACIDAD_INICIAL:
+                self.archivo.truncate(CAPACIDAD_INICIAL)
+            self.datos = mmap.mmap(self.archivo.fileno(), 0)
+        usados = struct.unpack_from('<I', self.datos, 0)[0]
+        if usados == 0:
+            struct.pack_into('<I', self.datos, 0, ENCABEZADO)
+        self.posiciones = {clave: posicion for clave, posicion in _entradas(self.datos)}
+
+    def _agregar(self, clave):
+        codificada = clave.encode('utf-8')
+        tamano = _relleno(4 + len(codificada)) + 8
+        usados = struct.unpack_from('<I', self.datos, 0)[0]
+        if usados + tamano > len(self.datos):
+            self._crecer(usados + tamano)
+        struct.pack_into(f'<I{len(codificada)}s', self.datos, usados, len(codificada), codificada)
+        posicion = usados + tamano - 8
+        struct.pack_into('<d', self.datos, posicion, 0.0)
+        # El contador de bytes usados se escribe al final: quien lee nunca ve una entrada a medias.
+        struct.pack_into('<I', self.datos, 0, usados + tamano)
+        self.posiciones[clave] = posicion
+        return posicion
+
+    def _crecer(self, minimo):
+        capacidad = len(self.datos)
+        while capacidad < minimo:
+            capacidad *= 2
+        if self.ruta is None:
+            self.datos.extend(bytes(capacidad - len(self.datos)))
+            return
+        self.datos.close()
+        self.archivo.truncate(capacidad)
+        self.datos = mmap.mmap(self.archivo.fileno(), 0)
+
+    def sumar(self, clave, cantidad):
+        with self.lock:
+            posicion = self.posiciones.get(clave)
+            if posicion is None:
+                posicion = self._agregar(clave)
+            valor = struct.unpack_from('<d', self.datos, posicion)[0]
+            struct.pack_into('<d', self.datos, posicion, valor + cantidad)
+
+    def leer(self):
+        with self.lock:
+            return [(clave, struct.unpack_from('<d', self.datos, posicion)[0]) for clave, posicion in _entradas(self.datos)]
+
+
+_valores = None
+_pid = None
+_lock = threading.Lock()
+
+
+# Cada proceso (worker de gunicorn) abre su propio archivo la primera vez que registra algo, también después de un fork.
+def _valores_proceso():
+    global _valores, _pid
+    if _pid != os.getpid():
+        with _lock:
+            if _pid != os.getpid():
+                directorio = settings.METRICAS_DIR
+                ruta = None
+                if directorio:
+                    Path(directorio).mkdir(parents=True, exist_ok=True)
+                    ruta = os.path.join(directorio, f'metricas_{os.getpid()}.db')
+                _valores = _Valores(ruta)
+                _pid = os.getpid()
+    return _valores
+
+
+def _clave(nombre, sufijo, nombres, valores, extra=()):
+    etiquetas = [[nombre_etiqueta, str(valor)] for nombre_etiqueta, valor in zip(nombres, valores)]
+    return json.dumps([nombre, sufijo, etiquetas + list(extra)], separators=(',', ':'))
+
+
+class _Familia:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        _FAMILIAS[nombre] = self
+
+    def _valores_etiquetas(self, etiquetas):
+        return [etiquetas[nombre] for nombre in self.etiquetas]
+
+
+class Contador(_Familia):
+    tipo = 'counter'
+
+    def inc(self, cantidad=1, **etiquetas):
+        if settings.METRICAS_ACTIVAS:
+            _valores_proceso().sumar(_clave(self.nombre, '_total', self.etiquetas, self._valores_etiquetas(etiquetas)), cantidad)
+
+
+class Histograma(_Familia):
+    tipo = 'histogram'
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites) + (math.inf,)
+
+    def observe(self, valor, **etiquetas):
+        if not settings.METRICAS_ACTIVAS:
+            return
+        valores = _valores_proceso()
+        propias = self._valores_etiquetas(etiquetas)
+        # Se guardan los buckets ya acumulados (le=...), igual que en el formato de texto.
+        for limite in self.limites:
+            if valor <= limite:
+                valores.sumar(_clave(self.nombre, '_bucket', self.etiquetas, propias, [['le', _numero(limite)]]), 1)
+        valores.sumar(_clave(self.nombre, '_sum', self.etiquetas, propias), valor)
+        valores.sumar(_clave(self.nombre, '_count', self.etiquetas, propias), 1)
+
+
+SOLICITUD_SEGUNDOS = Histograma(
+    'http_solicitud_segundos', 'Duración de las solicitudes por vista, método y estado.', ('vista', 'metodo', 'estado'),
+)
+SOLICITUD_DB_SEGUNDOS = Histograma('http_solicitud_db_segundos', 'Tiempo de base de datos por solicitud.', ('vista',))
+CONSULTAS = Contador('db_consultas', 'Consultas SQL ejecutadas en solicitudes, por tipo.', ('tipo',))
+CONSULTAS_SEGUNDOS = Contador('db_consultas_segundos', 'Tiempo acumulado de consultas SQL en solicitudes, por tipo.', ('tipo',))
+REPORTE_SEGUNDOS = Histograma(
+    'reporte_generacion_segundos', 'Duración de la generación de reportes PDF.', ('tipo',),
+    limites=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+IMPORTACION_FILAS = Contador('importacion_filas', 'Filas procesadas por las importaciones masivas.', ('tipo',))
+IMPORTACION_SEGUNDOS = Histograma(
+    'importacion_segundos', 'Duración de las importaciones masivas.', ('tipo',),
+    limites=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+)
+SUBIDA_BYTES = Histograma(
+    'evidencia_subida_bytes', 'Tamaño de las fotos de evidencia recibidas.', ('via',),
+    limites=tuple(2 ** potencia * 1024 for potencia in range(4, 16, 2)),
+)
+
+
+def tipo_consulta(sql):
+    inicio = sql.lstrip()[:6].lower()
+    return inicio if inicio in TIPOS_CONSULTA else 'otro'
+
+
+# Lo llama MedicionMiddleware al terminar cada solicitud.
+def registrar_solicitud(vista, metodo, estado, total, db, por_tipo):
+    if metodo not in METODOS:
+        metodo = 'otro'
+    SOLICITUD_SEGUNDOS.observe(total, vista=vista, metodo=metodo, estado=estado)
+    SOLICITUD_DB_SEGUNDOS.observe(db, vista=vista)
+    for tipo, (cantidad, segundos) in por_tipo.items():
+        CONSULTAS.inc(cantidad, tipo=tipo)
+        CONSULTAS_SEGUNDOS.inc(segundos, tipo=tipo)
+
+
+def registrar_importacion(tipo, filas, segundos):
+    IMPORTACION_FILAS.inc(filas, tipo=tipo)
+    IMPORTACION_SEGUNDOS.observe(segundos, tipo=tipo)
+
+
+def _numero(valor):
+    return '+Inf' if math.isinf(valor) else repr(float(valor))
+
+
+def _escapar(valor):
+    return valor.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+# Suma los archivos de todos los procesos (los de workers ya terminados también: los contadores no retroceden).
+def valores_agregados():
+    totales = {}
+    if settings.METRICAS_DIR and os.path.isdir(settings.METRICAS_DIR):
+        for entrada in os.scandir(settings.METRICAS_DIR):
+            if not (entrada.name.startswith('metricas_') and entrada.name.endswith('.db')):
+                continue
+            with open(entrada.path, 'rb') as archivo:
+                datos = archivo.read()
+            if len(datos) < ENCABEZADO:
+                continue
+            for clave, posicion in _entradas(datos):
+                totales[clave] = totales.get(clave, 0.0) + struct.unpack_from('<d', datos, posicion)[0]
+    elif _valores is not None and _pid == os.getpid():
+        for clave, valor in _valores.leer():
+            totales[clave] = totales.get(clave, 0.0) + valor
+    return totales
+
+
+def _orden_muestra(muestra):
+    (sufijo, etiquetas), _ = muestra
+    le = dict(etiquetas).get('le')
+    sin_le = [par for par in etiquetas if par[0] != 'le']
+    return sin_le, {'_bucket': 0, '_sum': 1, '_count': 2}.get(sufijo, 0), float(le) if le else 0.0
+
+
+def exposicion():
+    por_familia = {}
+    for clave, valor in valores_agregados().items():
+        nombre, sufijo, etiquetas = json.loads(clave)
+        por_familia.setdefault(nombre, []).append(((sufijo, [tuple(par) for par in etiquetas]), valor))
+    lineas = []
+    for nombre in sorted(_FAMILIAS):
+        familia = _FAMILIAS[nombre]
+        # En el formato 0.0.4 el TYPE de un contador lleva el mismo nombre que su muestra (_total).
+        publicado = f'{nombre}_total' if familia.tipo == 'counter' else nombre
+        lineas.append(f'# HELP {publicado} {familia.ayuda}')
+        lineas.append(f'# TYPE {publicado} {familia.tipo}')
+        for (sufijo, etiquetas), valor in sorted(por_familia.get(nombre, []), key=_orden_muestra):
+            texto = ','.join(f'{clave}="{_escapar(dato)}"' for clave, dato in etiquetas)
+            lineas.append(f'{nombre}{sufijo}{{{texto}}} {valor!r}' if texto else f'{nombre}{sufijo} {valor!r}')
+    return '\n'.join(lineas) + '\n'
+
+
+# Formato de texto de Prometheus para un recolector local. Fuera de las IPs permitidas, o si la solicitud
+# llegó a través del proxy (X-Forwarded-For), responde 404 para no revelar que existe.
+def vista_metricas(request):
+    if request.META.get('HTTP_X_FORWARDED_FOR') or request.META.get('REMOTE_ADDR') not in settings.METRICAS_IPS:
+        raise Http404()
+    return HttpResponse(exposicion(), content_type=TIPO_CONTENIDO)
+
+
+def limpiar_directorio():
+    borrados = 0
+    if settings.METRICAS_DIR and os.path.isdir(settings.METRICAS_DIR):
+        for entrada in os.scandir(settings.METRICAS_DIR):
+            if entrada.name.startswith('metricas_') and entrada.name.endswith('.db'):
+                os.unlink(entrada.path)
+                borrados += 1
+    return borrados
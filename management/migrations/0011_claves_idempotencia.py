@@ -0,0 +1,56 @@
+from django.db import migrations
+
+
+def create_claves_idempotencia(apps, schema_editor):
+    connection = schema_editor.connection
+    cursor = connection.cursor()
+
+    if connection.vendor == "sqlite":
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS claves_idempotencia (
+                huella TEXT PRIMARY KEY,
+                huella_cuerpo TEXT NOT NULL,
+                codigo_estado INTEGER,
+                respuesta TEXT,
+                creado_en TEXT NOT NULL,
+                expira_en TEXT NOT NULL
+            )
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS IX_claves_idempotencia_expira ON claves_idempotencia(expira_en)"
+        )
+    else:
+        cursor.execute(
+            """
+            IF NOT EXISTS (
+                SELECT 1
+                FROM sys.tables t
+                JOIN sys.schemas s ON s.schema_id = t.schema_id
+                WHERE t.name = 'claves_idempotencia' AND s.name = 'sistema'
+            )
+            BEGIN
+                CREATE TABLE sistema.claves_idempotencia (
+                    huella CHAR(64) NOT NULL PRIMARY KEY,
+                    huella_cuerpo CHAR(64) NOT NULL,
+                    codigo_estado SMALLINT NULL,
+                    respuesta NVARCHAR(MAX) NULL,
+                    creado_en DATETIME2(3) NOT NULL DEFAULT SYSUTCDATETIME(),
+                    expira_en DATETIME2(3) NOT NULL
+                );
+
+                CREATE INDEX IX_claves_idempotencia_expira ON sistema.claves_idempotencia(expira_en);
+            END
+            """
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0010_ruta_estado"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_claves_idempotencia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+
+def create_lotes_importacion(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        # En SQL Server las tablas ya existen en el esquema sistema (db ruteros.sql).
+        return
+
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS lotes_importacion (
+            id_lote INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre_archivo TEXT NOT NULL,
+            hash_archivo BLOB,
+            estado TEXT NOT NULL DEFAULT 'PENDIENTE',
+            subido_por INTEGER NOT NULL,
+            subido_en TEXT NOT NULL,
+            comentarios TEXT
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS IX_li_estado_fecha ON lotes_importacion(estado, subido_en)"
+    )
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS UX_li_hash ON lotes_importacion(hash_archivo) "
+        "WHERE hash_archivo IS NOT NULL"
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS items_importacion (
+            id_item INTEGER PRIMARY KEY AUTOINCREMENT,
+            id_lote INTEGER NOT NULL,
+            fila INTEGER NOT NULL,
+            datos_json TEXT NOT NULL,
+            valido INTEGER NOT NULL DEFAULT 0,
+            errores_json TEXT,
+            creado_en TEXT NOT NULL,
+            FOREIGN KEY (id_lote) REFERENCES lotes_importacion(id_lote) ON DELETE CASCADE
+        )
+        """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS IX_ii_lote_fila ON items_importacion(id_lote, fila)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS IX_ii_valido ON items_importacion(valido)"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0011_claves_idempotencia"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_lotes_importacion, migrations.RunPython.noop),
+    ]
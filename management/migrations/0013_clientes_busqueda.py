@@ -0,0 +1,72 @@
+from django.db import migrations
+
+
+# Índice FTS5 con contenido externo: el texto vive en clientes y los triggers mantienen el índice.
+SQLITE_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS clientes_fts USING fts5(
+    nit,
+    nombre,
+    direccion,
+    content='clientes',
+    content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS clientes_fts_ai AFTER INSERT ON clientes BEGIN
+    INSERT INTO clientes_fts(rowid, nit, nombre, direccion)
+    VALUES (new.rowid, new.nit, new.nombre, new.direccion);
+END;
+
+CREATE TRIGGER IF NOT EXISTS clientes_fts_ad AFTER DELETE ON clientes BEGIN
+    INSERT INTO clientes_fts(clientes_fts, rowid, nit, nombre, direccion)
+    VALUES ('delete', old.rowid, old.nit, old.nombre, old.direccion);
+END;
+
+CREATE TRIGGER IF NOT EXISTS clientes_fts_au AFTER UPDATE ON clientes BEGIN
+    INSERT INTO clientes_fts(clientes_fts, rowid, nit, nombre, direccion)
+    VALUES ('delete', old.rowid, old.nit, old.nombre, old.direccion);
+    INSERT INTO clientes_fts(rowid, nit, nombre, direccion)
+    VALUES (new.rowid, new.nit, new.nombre, new.direccion);
+END;
+
+INSERT INTO clientes_fts(clientes_fts) VALUES ('rebuild');
+"""
+
+
+# En SQL Server usamos un índice de texto completo con seguimiento automático de cambios.
+MSSQL_SQL = """
+IF NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'ft_sistema')
+    CREATE FULLTEXT CATALOG ft_sistema;
+
+IF NOT EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('sistema.clientes'))
+BEGIN
+    DECLARE @pk SYSNAME = (
+        SELECT name FROM sys.indexes
+        WHERE object_id = OBJECT_ID('sistema.clientes') AND is_primary_key = 1
+    );
+    EXEC('CREATE FULLTEXT INDEX ON sistema.clientes (nit, nombre, direccion) KEY INDEX '
+        + QUOTENAME(@pk) + ' ON ft_sistema WITH CHANGE_TRACKING AUTO');
+END
+"""
+
+
+def create_clientes_busqueda(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        connection.connection.executescript(SQLITE_SQL)
+    else:
+        connection.cursor().execute(MSSQL_SQL)
+
+
+class Migration(migrations.Migration):
+    # CREATE FULLTEXT CATALOG no puede ejecutarse dentro de una transacción en SQL Server.
+    atomic = False
+
+    dependencies = [
+        ("management", "0012_lotes_importacion"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_clientes_busqueda, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+MSSQL_SQL = """
+IF COL_LENGTH('sistema.evidencias_fotograficas', 'miniatura') IS NULL
+    ALTER TABLE sistema.evidencias_fotograficas ADD miniatura NVARCHAR(260) NULL;
+IF COL_LENGTH('sistema.evidencias_fotograficas', 'mediana') IS NULL
+    ALTER TABLE sistema.evidencias_fotograficas ADD mediana NVARCHAR(260) NULL;
+"""
+
+
+# Rutas de las versiones reducidas de cada foto; se llenan en segundo plano después de subirla.
+def add_evidencia_derivados(apps, schema_editor):
+    connection = schema_editor.connection
+    cursor = connection.cursor()
+    if connection.vendor == "sqlite":
+        columnas = {fila[1] for fila in cursor.execute("PRAGMA table_info(evidencias_fotograficas)").fetchall()}
+        for columna in ("miniatura", "mediana"):
+            if columna not in columnas:
+                cursor.execute(f"ALTER TABLE evidencias_fotograficas ADD COLUMN {columna} TEXT NULL")
+    else:
+        cursor.execute(MSSQL_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0013_clientes_busqueda"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_evidencia_derivados, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+from django.db import migrations
+
+
+def create_cargas_evidencia(apps, schema_editor):
+    connection = schema_editor.connection
+    cursor = connection.cursor()
+
+    if connection.vendor == "sqlite":
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cargas_evidencia (
+                id_carga TEXT PRIMARY KEY,
+                nombre_archivo TEXT NOT NULL,
+                tamano_total INTEGER NOT NULL,
+                recibido INTEGER NOT NULL DEFAULT 0,
+                metadatos TEXT,
+                subido_por INTEGER NOT NULL,
+                id_evidencia INTEGER NULL REFERENCES evidencias_fotograficas(id) ON DELETE SET NULL,
+                creado_en TEXT NOT NULL,
+                expira_en TEXT NOT NULL
+            )
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS IX_cargas_evidencia_expira ON cargas_evidencia(expira_en)"
+        )
+    else:
+        cursor.execute(
+            """
+            IF NOT EXISTS (
+                SELECT 1
+                FROM sys.tables t
+                JOIN sys.schemas s ON s.schema_id = t.schema_id
+                WHERE t.name = 'cargas_evidencia' AND s.name = 'sistema'
+            )
+            BEGIN
+                CREATE TABLE sistema.cargas_evidencia (
+                    id_carga CHAR(32) NOT NULL PRIMARY KEY,
+                    nombre_archivo NVARCHAR(260) NOT NULL,
+                    tamano_total BIGINT NOT NULL,
+                    recibido BIGINT NOT NULL DEFAULT 0,
+                    metadatos NVARCHAR(MAX) NULL,
+                    subido_por INT NOT NULL,
+                    id_evidencia BIGINT NULL,
+                    creado_en DATETIME2(3) NOT NULL DEFAULT SYSUTCDATETIME(),
+                    expira_en DATETIME2(3) NOT NULL,
+
+                    CONSTRAINT FK_cargas_evidencia FOREIGN KEY (id_evidencia)
+                        REFERENCES sistema.evidencias_fotograficas(id) ON DELETE SET NULL
+                );
+
+                CREATE INDEX IX_cargas_evidencia_expira ON sistema.cargas_evidencia(expira_en);
+            END
+            """
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0014_evidencia_derivados"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_cargas_evidencia, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from django.db import migrations
+
+
+def create_archivos(apps, schema_editor):
+    connection = schema_editor.connection
+    cursor = connection.cursor()
+
+    if connection.vendor == "sqlite":
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS archivos (
+                id_archivo INTEGER PRIMARY KEY AUTOINCREMENT,
+                tipo_entidad TEXT NOT NULL,
+                id_entidad TEXT NOT NULL,
+                categoria TEXT NULL,
+                nombre_archivo TEXT NOT NULL,
+                tipo_mime TEXT NULL,
+                url TEXT NOT NULL,
+                tamano_bytes INTEGER NULL,
+                creado_en TEXT NOT NULL
+            )
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS IX_archivos_entidad ON archivos(tipo_entidad, id_entidad)"
+        )
+        cursor.execute("CREATE INDEX IF NOT EXISTS IX_archivos_url ON archivos(url)")
+    else:
+        # La tabla ya existe en el esquema sistema (db ruteros.sql); solo falta poder contar referencias por url.
+        cursor.execute(
+            """
+            IF NOT EXISTS (
+                SELECT 1 FROM sys.indexes
+                WHERE name = 'IX_archivos_url' AND object_id = OBJECT_ID('sistema.archivos')
+            )
+                CREATE INDEX IX_archivos_url ON sistema.archivos(url);
+            """
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0015_cargas_evidencia"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_archivos, migrations.RunPython.noop),
+    ]
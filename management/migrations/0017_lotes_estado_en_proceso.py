@@ -0,0 +1,35 @@
+from django.db import migrations
+
+
+def ampliar_estados_lote(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        # En SQLite la columna estado no tiene CHECK.
+        return
+
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        IF EXISTS (
+            SELECT 1 FROM sys.check_constraints
+            WHERE name = 'CK_li_estado' AND parent_object_id = OBJECT_ID('sistema.lotes_importacion')
+        )
+            ALTER TABLE sistema.lotes_importacion DROP CONSTRAINT CK_li_estado;
+        """
+    )
+    cursor.execute(
+        """
+        ALTER TABLE sistema.lotes_importacion ADD CONSTRAINT CK_li_estado
+            CHECK (estado IN ('PENDIENTE','EN_PROCESO','VALIDADO','CARGADO','ERROR'));
+        """
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0016_archivos"),
+    ]
+
+    operations = [
+        migrations.RunPython(ampliar_estados_lote, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+def quitar_fk_usuario_lote(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == "sqlite":
+        # En SQLite la tabla se creó sin la FK.
+        return
+
+    # subido_por guarda el id del usuario de Django (auth_user), igual que cargas_evidencia;
+    # la FK a sistema.usuarios rechazaba esos ids o atribuía el lote a otro usuario.
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        IF EXISTS (
+            SELECT 1 FROM sys.foreign_keys
+            WHERE name = 'FK_li_usuario' AND parent_object_id = OBJECT_ID('sistema.lotes_importacion')
+        )
+            ALTER TABLE sistema.lotes_importacion DROP CONSTRAINT FK_li_usuario;
+        """
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0017_lotes_estado_en_proceso"),
+    ]
+
+    operations = [
+        migrations.RunPython(quitar_fk_usuario_lote, migrations.RunPython.noop),
+    ]
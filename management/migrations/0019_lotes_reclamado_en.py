@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+MSSQL_SQL = """
+IF COL_LENGTH('sistema.lotes_importacion', 'reclamado_en') IS NULL
+    ALTER TABLE sistema.lotes_importacion ADD reclamado_en DATETIME2(3) NULL;
+"""
+
+
+# Último aviso del proceso que tiene el lote EN_PROCESO; si deja de avanzar, 'procesar_lotes' lo devuelve a la cola.
+def add_lotes_reclamado_en(apps, schema_editor):
+    connection = schema_editor.connection
+    cursor = connection.cursor()
+    if connection.vendor == "sqlite":
+        columnas = {fila[1] for fila in cursor.execute("PRAGMA table_info(lotes_importacion)").fetchall()}
+        if "reclamado_en" not in columnas:
+            cursor.execute("ALTER TABLE lotes_importacion ADD COLUMN reclamado_en TEXT NULL")
+    else:
+        cursor.execute(MSSQL_SQL)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0018_lotes_subido_por_usuario_django"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_lotes_reclamado_en, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+# Índice para buscar productos por código sin distinguir mayúsculas (?codigo=). En SQL Server no hace falta:
+# la llave primaria ya usa la intercalación CI de la base.
+def add_productos_codigo_nocase(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+
+    cursor = connection.cursor()
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS IX_productos_codigo_nocase ON productos(codigo COLLATE NOCASE)"
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("management", "0019_lotes_reclamado_en"),
+    ]
+
+    operations = [
+        migrations.RunPython(add_productos_codigo_nocase, migrations.RunPython.noop),
+    ]
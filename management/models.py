@@ -1,8 +1,13 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import EmailValidator, RegexValidator, MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .almacenamiento import almacenamiento_evidencias
 
 # Pequeña ayuda para que el mismo código funcione igual con SQLite y con SQL Server.
 def _is_sqlite():
@@ -291,7 +296,8 @@ class RegistroVisita(models.Model):
 
 # Evidencias en foto o enlaces que acompañan cada visita o venta.
 class EvidenciaFotografica(models.Model):
-    imagen = models.ImageField(upload_to='evidencias/', null=True, blank=True)
+    # Nombres por contenido (evidencias/ab/cd/<sha256>.jpg): fotos repetidas comparten archivo.
+    imagen = models.ImageField(upload_to='evidencias/', storage=almacenamiento_evidencias, null=True, blank=True)
     url = models.URLField(max_length=1024, null=True, blank=True)
     descripcion = models.CharField(max_length=300, null=True, blank=True)
     cliente = models.ForeignKey(
@@ -320,6 +326,13 @@ class EvidenciaFotografica(models.Model):
         related_name='evidencias',
     )
     registrada_en = models.DateTimeField(default=timezone.now)
+    # Derivados generados en segundo plano (ver management/derivados.py); vacíos mientras se procesan.
+    miniatura = models.ImageField(
+        upload_to='evidencias/derivados/', storage=almacenamiento_evidencias, null=True, blank=True, editable=False,
+    )
+    mediana = models.ImageField(
+        upload_to='evidencias/derivados/', storage=almacenamiento_evidencias, null=True, blank=True, editable=False,
+    )
 
     class Meta:
         db_table = db_table('evidencias_fotograficas')
@@ -331,6 +344,117 @@ class EvidenciaFotografica(models.Model):
         return f"Evidencia {self.id} - {identificador}"
 
 
+# Archivos asociados a entidades (sistema.archivos); cada fila es una referencia al archivo en url.
+class Archivo(models.Model):
+    id_archivo = models.AutoField(primary_key=True)
+    tipo_entidad = models.CharField(max_length=64)
+    id_entidad = models.CharField(max_length=64)
+    categoria = models.CharField(max_length=50, null=True, blank=True)
+    nombre_archivo = models.CharField(max_length=260)
+    tipo_mime = models.CharField(max_length=100, null=True, blank=True)
+    url = models.CharField(max_length=1000)
+    tamano_bytes = models.BigIntegerField(null=True, blank=True)
+    creado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = db_table('archivos')
+        managed = _SQLITE
+
+    def __str__(self):
+        return f"{self.tipo_entidad} {self.id_entidad} - {self.url}"
+
+
+# Subida de una foto por partes: los bloques se agregan a un archivo temporal y la evidencia se crea al finalizar.
+class CargaEvidencia(models.Model):
+    id_carga = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    nombre_archivo = models.CharField(max_length=260)
+    tamano_total = models.BigIntegerField()
+    recibido = models.BigIntegerField(default=0)
+    metadatos = models.JSONField(null=True, blank=True)
+    subido_por = models.IntegerField()
+    evidencia = models.ForeignKey(
+        EvidenciaFotografica,
+        db_column='id_evidencia',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+    )
+    creado_en = models.DateTimeField(default=timezone.now)
+    expira_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = db_table('cargas_evidencia')
+        managed = _SQLITE
+
+    def __str__(self):
+        return f"Carga {self.id_carga} - {self.recibido}/{self.tamano_total}"
+
+
+# Lotes de importación: las filas se preparan aquí y se validan y aplican en segundo plano.
+class LoteImportacion(models.Model):
+    ESTADOS = [
+        ('PENDIENTE', 'Pendiente'),
+        ('EN_PROCESO', 'En proceso'),
+        ('VALIDADO', 'Validado'),
+        ('CARGADO', 'Cargado'),
+        ('ERROR', 'Error'),
+    ]
+    id_lote = models.AutoField(primary_key=True)
+    nombre_archivo = models.CharField(max_length=260)
+    hash_archivo = models.BinaryField(max_length=32, null=True, blank=True, unique=True)
+    estado = models.CharField(max_length=15, choices=ESTADOS, default='PENDIENTE')
+    # Id del usuario de Django (request.user.id), no de sistema.usuarios.
+    subido_por = models.IntegerField()
+    subido_en = models.DateTimeField(default=timezone.now)
+    comentarios = models.CharField(max_length=500, null=True, blank=True)
+    # Se renueva mientras el lote avanza EN_PROCESO; uno que quedó atrás se considera abandonado.
+    reclamado_en = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = db_table('lotes_importacion')
+        managed = _SQLITE
+
+    def __str__(self):
+        return f"Lote {self.id_lote} - {self.nombre_archivo} - {self.estado}"
+
+
+# Cada fila del archivo con sus datos normalizados y el resultado de la validación.
+class ItemImportacion(models.Model):
+    id_item = models.AutoField(primary_key=True)
+    id_lote = models.ForeignKey(LoteImportacion, db_column='id_lote', on_delete=models.CASCADE, related_name='items')
+    fila = models.IntegerField()
+    datos_json = models.TextField()
+    valido = models.BooleanField(default=False)
+    errores_json = models.TextField(null=True, blank=True)
+    creado_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = db_table('items_importacion')
+        managed = _SQLITE
+        ordering = ['fila']
+
+    def __str__(self):
+        return f"Lote {self.id_lote_id} - Fila {self.fila}"
+
+
+# Respuestas guardadas por clave de idempotencia para repetir reintentos sin duplicar escrituras.
+class ClaveIdempotencia(models.Model):
+    huella = models.CharField(max_length=64, primary_key=True)
+    huella_cuerpo = models.CharField(max_length=64)
+    codigo_estado = models.PositiveSmallIntegerField(null=True, blank=True)
+    respuesta = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    creado_en = models.DateTimeField(default=timezone.now)
+    expira_en = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = db_table('claves_idempotencia')
+        managed = _SQLITE
+
+    def __str__(self):
+        return f"Idempotencia {self.huella} - {self.codigo_estado}"
+
+
 # Perfil sencillo para enlazar roles a los usuarios Django.
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+# Paginación por número de página para catálogos y tablas pequeñas.
+class PaginacionEstandar(PageNumberPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_TAMANO_PAGINA
+
+
+# Tablas que crecen sin parar: el cursor avanza por la llave primaria y evita OFFSET.
+class PaginacionCursor(CursorPagination):
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_TAMANO_PAGINA
+
+
+class PaginacionRutas(PaginacionCursor):
+    ordering = 'id_ruta'
+
+
+class PaginacionVentas(PaginacionCursor):
+    ordering = 'id_venta'
+
+
+class PaginacionEvidencias(PaginacionCursor):
+    # id crece con registrada_en y, a diferencia de la fecha, es único e indexado.
+    ordering = '-id'
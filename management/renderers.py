@@ -0,0 +1,57 @@
+import datetime
+import decimal
+
+from django.utils.encoding import force_str
+from django.utils.functional import Promise
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él usamos los de DRF.
+    orjson = None
+
+
+def _por_defecto(obj):
+    # orjson ya maneja datetime y UUID; solo quedan los tipos que DRF resuelve en su encoder.
+    if isinstance(obj, decimal.Decimal):
+        # Igual que el encoder de DRF; los DecimalField del serializer ya llegan como texto.
+        return float(obj)
+    if isinstance(obj, Promise):
+        return force_str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError(f'Tipo no serializable: {type(obj).__name__}')
+
+
+# Mismo contrato que JSONRenderer pero con orjson; decimales y fechas salen igual que con DRF.
+class ORJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        # OPT_UTC_Z: las fechas en UTC terminan en 'Z', como en el encoder de DRF.
+        opciones = orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            opciones |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_por_defecto, option=opciones)
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
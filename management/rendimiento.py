@@ -0,0 +1,140 @@
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from rest_framework import serializers
+
+from .metricas import registrar_solicitud, tipo_consulta
+
+logger = logging.getLogger(__name__)
+
+_medicion_actual = ContextVar('medicion_actual', default=None)
+
+
+class Medicion:
+    __slots__ = ('inicio', 'vista', 'consultas', 'db', 'por_tipo', 'serializador', 'fin_vista', 'render', '_profundidad')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.vista = None
+        self.consultas = 0
+        self.db = 0.0
+        self.por_tipo = {}
+        self.serializador = 0.0
+        self.fin_vista = None
+        self.render = 0.0
+        self._profundidad = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper de la conexión: cuenta cada consulta y su tiempo.
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.db += duracion
+            self.consultas += 1
+            acumulado = self.por_tipo.setdefault(tipo_consulta(sql), [0, 0.0])
+            acumulado[0] += 1
+            acumulado[1] += duracion
+
+
+def nombre_vista(view_func, metodo):
+    clase = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if clase is None:
+        return getattr(view_func, '__qualname__', repr(view_func))
+    acciones = getattr(view_func, 'actions', None) or {}
+    return f'{clase.__name__}.{acciones.get(metodo.lower(), metodo.lower())}'
+
+
+def _medir_data(propiedad):
+    # Solo mide el .data más externo: ListSerializer.data llama al de la clase base y no se cuenta dos veces.
+    def data(self):
+        medicion = _medicion_actual.get()
+        if medicion is None or medicion._profundidad:
+            return propiedad.fget(self)
+        medicion._profundidad += 1
+        inicio = time.perf_counter()
+        try:
+            return propiedad.fget(self)
+        finally:
+            medicion.serializador += time.perf_counter() - inicio
+            medicion._profundidad -= 1
+
+    data._medido = True
+    return property(data)
+
+
+# Envuelve Serializer.data y ListSerializer.data en todo el proceso. Lo llama AppConfig.ready, y solo
+# cuando MedicionMiddleware está en MIDDLEWARE; importar este módulo no cambia nada.
+def instrumentar_serializadores():
+    for clase in (serializers.Serializer, serializers.ListSerializer):
+        propiedad = clase.__dict__['data']
+        if not getattr(propiedad.fget, '_medido', False):
+            clase.data = _medir_data(propiedad)
+
+
+def _ms(segundos):
+    return round(segundos * 1000, 1)
+
+
+# Tiempo total, de base de datos (con número de consultas), de serializadores y de render por solicitud.
+# Sale en el encabezado Server-Timing, en una línea de log con la vista resuelta (ClienteViewSet.list, ...)
+# y en los histogramas de /metrics (management/metricas.py).
+class MedicionMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        medicion = Medicion()
+        token = _medicion_actual.set(medicion)
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(medicion))
+                response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        total = time.perf_counter() - medicion.inicio
+        if medicion.fin_vista is not None:
+            medicion.render = max(total - (medicion.fin_vista - medicion.inicio), 0.0)
+        self.publicar(request, response, medicion, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        medicion = _medicion_actual.get()
+        if medicion is not None:
+            medicion.vista = nombre_vista(view_func, request.method)
+
+    def process_template_response(self, request, response):
+        # Respuestas de DRF: lo que sigue es el render (JSON, PDF navegable, ...).
+        medicion = _medicion_actual.get()
+        if medicion is not None:
+            medicion.fin_vista = time.perf_counter()
+        return response
+
+    def publicar(self, request, response, medicion, total):
+        datos = {
+            'vista': medicion.vista or '-',
+            'metodo': request.method,
+            'ruta': request.path,
+            'estado': response.status_code,
+            'total_ms': _ms(total),
+            'db_ms': _ms(medicion.db),
+            'consultas': medicion.consultas,
+            'serializador_ms': _ms(medicion.serializador),
+            'render_ms': _ms(medicion.render),
+        }
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join((
+                f'db;dur={datos["db_ms"]};desc="{medicion.consultas} consultas"',
+                f'ser;dur={datos["serializador_ms"]}',
+                f'render;dur={datos["render_ms"]}',
+                f'total;dur={datos["total_ms"]}',
+            ))
+        registrar_solicitud(datos['vista'], request.method, response.status_code, total, medicion.db, medicion.por_tipo)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(' '.join(f'{clave}={valor}' for clave, valor in datos.items()), extra={'medicion': datos})
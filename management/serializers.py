@@ -1,19 +1,30 @@
+import json
+
 from django.contrib.auth.models import User
 from django.db import transaction
 from rest_framework import serializers
 
+from . import catalogos
+from .campos import CamposDinamicosMixin
+from .derivados import quitar_metadatos
+from .medios import prefijo_media, url_media
 from .models import (
     Cliente, Producto, Venta, DetalleVenta, Vendedor, RegistroVisita,
-    Ruta, ClienteRuta, CatPresentacion, CatEstatusCredito, ReportFile, UserProfile,
-    EvidenciaFotografica, CatTiempoCliente, CatResultadoVisita,
+    Ruta, ClienteRuta, ReportFile, UserProfile,
+    EvidenciaFotografica, LoteImportacion, ItemImportacion,
 )
 
 
-class ClienteSerializer(serializers.ModelSerializer):
+class ClienteSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
         model = Cliente
         fields = '__all__'
 
+    def validate_estatus_credito(self, value):
+        if not catalogos.existe('estatus_credito', value):
+            raise serializers.ValidationError(f"Estatus de crédito '{value}' no existe.")
+        return value
+
 
 class VentaSerializer(serializers.ModelSerializer):
     class Meta:
@@ -27,35 +38,81 @@ class DetalleVentaSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+# Formato de cada línea NDJSON de la ingesta masiva; las referencias se validan por bloque en la vista.
+class DetalleVentaIngestaSerializer(serializers.Serializer):
+    linea = serializers.IntegerField(min_value=1)
+    codigo_producto = serializers.CharField(max_length=30, required=False, allow_null=True)
+    cantidad = serializers.IntegerField(min_value=1)
+    precio_unitario = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0)
+
+
+class VentaIngestaSerializer(serializers.Serializer):
+    ref = serializers.CharField(max_length=100, required=False, allow_blank=True)
+    fecha = serializers.DateTimeField()
+    nit_cliente = serializers.CharField(max_length=9)
+    id_ruta = serializers.IntegerField(required=False, allow_null=True)
+    total = serializers.DecimalField(max_digits=14, decimal_places=2, min_value=0)
+    detalles = DetalleVentaIngestaSerializer(many=True, required=False)
+
+    def validate_detalles(self, value):
+        lineas = [detalle['linea'] for detalle in value]
+        if len(lineas) != len(set(lineas)):
+            raise serializers.ValidationError('Los números de línea no pueden repetirse.')
+        return value
+
+
 # Serializer de productos que traduce entre el id de presentación y su nombre.
-class ProductoSerializer(serializers.ModelSerializer):
-    presentacion = serializers.CharField(source='presentacion.presentacion', read_only=True)
+class ProductoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    # La llave de la presentación es su nombre, así que no hace falta cargar el catálogo para mostrarla.
+    presentacion = serializers.CharField(source='presentacion_id', read_only=True)
     presentacion_id = serializers.CharField(write_only=True, required=True)
 
     class Meta:
         model = Producto
         fields = ['codigo', 'descripcion', 'color', 'precio_unitario', 'presentacion', 'presentacion_id', 'creado_en', 'actualizado_en']
 
-    def create(self, validated_data):
-        presentacion_value = validated_data.pop('presentacion_id')
-        validated_data['presentacion'] = CatPresentacion.objects.get(presentacion=presentacion_value)
-        return super().create(validated_data)
+    def validate_presentacion_id(self, value):
+        # Validamos contra el catálogo en memoria; create/update asignan la llave sin consultar.
+        if not catalogos.existe('presentacion', value):
+            raise serializers.ValidationError(f"Presentación '{value}' no existe.")
+        return value
 
-    def update(self, instance, validated_data):
-        if 'presentacion_id' in validated_data:
-            presentacion_value = validated_data.pop('presentacion_id')
-            instance.presentacion = CatPresentacion.objects.get(presentacion=presentacion_value)
-        return super().update(instance, validated_data)
+
+# Fila de la carga masiva de productos; sin validadores de unicidad para no consultar por fila.
+class ProductoCargaSerializer(serializers.Serializer):
+    codigo = serializers.CharField(max_length=30)
+    descripcion = serializers.CharField(max_length=200)
+    color = serializers.CharField(max_length=50, required=False, allow_null=True, allow_blank=True)
+    precio_unitario = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0)
+    presentacion_id = serializers.CharField(max_length=15)
+
+    def validate_presentacion_id(self, value):
+        if not catalogos.existe('presentacion', value):
+            raise serializers.ValidationError(f"Presentación '{value}' no existe.")
+        return value
 
 
 # Incluimos los datos del cliente dentro de la ruta para no hacer consultas extra.
 class ClienteRutaSerializer(serializers.ModelSerializer):
     cliente = ClienteSerializer(read_only=True)
+    # Llaves de catálogo leídas y validadas contra el catálogo en memoria, no con una consulta por fila.
+    id_tiempo_cliente = serializers.IntegerField(source='id_tiempo_cliente_id')
+    resultado_visita = serializers.CharField(source='resultado_visita_id', required=False)
 
     class Meta:
         model = ClienteRuta
         fields = ['ruta', 'cliente', 'orden_visita', 'id_tiempo_cliente', 'hora_inicio', 'hora_fin', 'resultado_visita', 'observaciones']
 
+    def validate_id_tiempo_cliente(self, value):
+        if not catalogos.existe('tiempo_cliente', value):
+            raise serializers.ValidationError(f"Tiempo cliente '{value}' no existe.")
+        return value
+
+    def validate_resultado_visita(self, value):
+        if not catalogos.existe('resultado_visita', value):
+            raise serializers.ValidationError(f"Resultado visita '{value}' no existe.")
+        return value
+
 
 class ClienteRutaInputSerializer(serializers.Serializer):
     nit_cliente = serializers.CharField()
@@ -68,7 +125,7 @@ class ClienteRutaInputSerializer(serializers.Serializer):
 
 
 # Rutas con sus clientes ya ordenados.
-class RutaSerializer(serializers.ModelSerializer):
+class RutaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     clienterutas = ClienteRutaSerializer(source='clienteruta_set', many=True, read_only=True)
     clientes = ClienteRutaInputSerializer(write_only=True, many=True, required=False)
 
@@ -131,21 +188,15 @@ class RutaSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({'clientes': [f"Cliente '{nit}' no existe" for nit in faltantes]})
 
         tiempos_ids = {item['id_tiempo_cliente'] for item in clientes_data}
-        tiempos = CatTiempoCliente.objects.filter(id_tiempo_cliente__in=tiempos_ids)
-        tiempos_map = {tiempo.id_tiempo_cliente: tiempo for tiempo in tiempos}
+        tiempos_map = catalogos.obtener_catalogo('tiempo_cliente')
         faltantes_tiempo = sorted({tiempo_id for tiempo_id in tiempos_ids if tiempo_id not in tiempos_map})
         if faltantes_tiempo:
             raise serializers.ValidationError({'clientes': [f"Tiempo cliente '{tiempo_id}' no existe" for tiempo_id in faltantes_tiempo]})
 
         resultado_ids = {item.get('resultado_visita') for item in clientes_data if item.get('resultado_visita')}
-        if resultado_ids:
-            resultados = CatResultadoVisita.objects.filter(resultado_visita__in=resultado_ids)
-            resultados_map = {resultado.resultado_visita: resultado for resultado in resultados}
-            faltantes_resultado = sorted(resultado_ids - resultados_map.keys())
-            if faltantes_resultado:
-                raise serializers.ValidationError({'clientes': [f"Resultado visita '{resultado}' no existe" for resultado in faltantes_resultado]})
-        else:
-            resultados_map = {}
+        faltantes_resultado = sorted(resultado_ids - catalogos.obtener_catalogo('resultado_visita').keys())
+        if faltantes_resultado:
+            raise serializers.ValidationError({'clientes': [f"Resultado visita '{resultado}' no existe" for resultado in faltantes_resultado]})
 
         ClienteRuta.objects.filter(ruta=ruta).delete()
         registros = []
@@ -156,7 +207,7 @@ class RutaSerializer(serializers.ModelSerializer):
                 ruta=ruta,
                 cliente=cliente,
                 orden_visita=item['orden_visita'],
-                id_tiempo_cliente=tiempos_map[item['id_tiempo_cliente']],
+                id_tiempo_cliente_id=item['id_tiempo_cliente'],
                 resultado_visita_id=resultado_visita_id,
                 observaciones=item.get('observaciones'),
                 hora_inicio=item.get('hora_inicio'),
@@ -167,7 +218,7 @@ class RutaSerializer(serializers.ModelSerializer):
 
 
 # Vendedores incluyen un resumen textual del nivel de éxito.
-class VendedorSerializer(serializers.ModelSerializer):
+class VendedorSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     nivel_exito = serializers.SerializerMethodField()
 
     class Meta:
@@ -192,11 +243,13 @@ class RegistroVisitaSerializer(serializers.ModelSerializer):
 
 
 # Serializador de evidencias que expone datos relacionados listos para el frontend.
-class EvidenciaFotograficaSerializer(serializers.ModelSerializer):
+class EvidenciaFotograficaSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     cliente_nombre = serializers.CharField(source='cliente.nombre', read_only=True)
     ruta_nombre = serializers.CharField(source='ruta.nombre', read_only=True)
     venta_total = serializers.SerializerMethodField()
     imagen_url = serializers.SerializerMethodField()
+    miniatura_url = serializers.SerializerMethodField()
+    mediana_url = serializers.SerializerMethodField()
 
     class Meta:
         model = EvidenciaFotografica
@@ -204,6 +257,8 @@ class EvidenciaFotograficaSerializer(serializers.ModelSerializer):
             'id',
             'imagen',
             'imagen_url',
+            'miniatura_url',
+            'mediana_url',
             'url',
             'descripcion',
             'cliente',
@@ -219,6 +274,10 @@ class EvidenciaFotograficaSerializer(serializers.ModelSerializer):
             'url': {'required': False, 'allow_null': True, 'allow_blank': True},
         }
 
+    def validate_imagen(self, imagen):
+        # GPS y datos de la cámara se quitan antes de guardar; la normalización y los derivados siguen en segundo plano.
+        return quitar_metadatos(imagen) if imagen else imagen
+
     def validate(self, attrs):
         imagen = attrs.get('imagen')
         url = attrs.get('url')
@@ -230,21 +289,64 @@ class EvidenciaFotograficaSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Debe proporcionar una imagen o un URL de evidencia.')
         return attrs
 
+    def _url_archivo(self, archivo):
+        # El prefijo se guarda en el contexto: en una lista se construye una vez y no por cada fila.
+        prefijo = self.context.get('_prefijo_media')
+        if prefijo is None:
+            prefijo = prefijo_media(self.context.get('request'))
+            self.context['_prefijo_media'] = prefijo
+        return url_media(prefijo, archivo.name)
+
     def get_imagen_url(self, obj):
-        request = self.context.get('request') if hasattr(self, 'context') else None
         if obj.imagen and hasattr(obj.imagen, 'url'):
-            url = obj.imagen.url
-            if request:
-                return request.build_absolute_uri(url)
-            return url
+            return self._url_archivo(obj.imagen)
         return obj.url
 
+    # Mientras el derivado no existe devolvemos el original para que el cliente siempre tenga algo que mostrar.
+    def get_miniatura_url(self, obj):
+        if obj.miniatura:
+            return self._url_archivo(obj.miniatura)
+        return self.get_imagen_url(obj)
+
+    def get_mediana_url(self, obj):
+        if obj.mediana:
+            return self._url_archivo(obj.mediana)
+        return self.get_imagen_url(obj)
+
     def get_venta_total(self, obj):
         if obj.venta:
             return obj.venta.total
         return None
 
 
+# Estado de un lote de importación; comentarios guarda el resultado en JSON.
+class LoteImportacionSerializer(serializers.ModelSerializer):
+    resultado = serializers.SerializerMethodField()
+
+    class Meta:
+        model = LoteImportacion
+        fields = ['id_lote', 'nombre_archivo', 'estado', 'subido_por', 'subido_en', 'resultado']
+
+    def get_resultado(self, obj):
+        if not obj.comentarios:
+            return None
+        try:
+            return json.loads(obj.comentarios)
+        except ValueError:
+            return obj.comentarios
+
+
+class ItemImportacionErrorSerializer(serializers.ModelSerializer):
+    errores = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ItemImportacion
+        fields = ['fila', 'errores']
+
+    def get_errores(self, obj):
+        return json.loads(obj.errores_json) if obj.errores_json else None
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
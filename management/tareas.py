@@ -0,0 +1,35 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.TAREAS_HILOS, thread_name_prefix='tareas')
+    return _executor
+
+
+def _ejecutar(func, args):
+    # Cada hilo usa su propia conexión; la cerramos al terminar para no dejarla colgada.
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Falló la tarea en segundo plano %s%r', func.__name__, args)
+    finally:
+        close_old_connections()
+
+
+# Programa una tarea para después del commit, así el hilo ve los datos ya confirmados.
+def encolar(func, *args):
+    if settings.TAREAS_EN_SEGUNDO_PLANO:
+        transaction.on_commit(lambda: _get_executor().submit(_ejecutar, func, args))
+    else:
+        transaction.on_commit(lambda: func(*args))
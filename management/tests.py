@@ -1,17 +1,41 @@
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import traceback
+from collections import Counter
+from io import BytesIO, StringIO
+
 from django.contrib.auth.models import User
-from django.db import IntegrityError
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from PIL import Image
 from rest_framework.test import APIClient
 
+from . import catalogos
+from .urls import router
+from .importacion import leer_csv
 from .models import (
     Cliente,
     Producto,
     Vendedor,
     Ruta,
     ClienteRuta,
+    CatEstatusCredito,
     CatPresentacion,
     CatTiempoCliente,
     CatResultadoVisita,
+    Venta,
+    DetalleVenta,
+    HistorialVenta,
+    RegistroVisita,
+    LoteImportacion,
+    EvidenciaFotografica,
+    Archivo,
+    UserProfile,
 )
 
 
@@ -93,3 +117,1024 @@ class RutaClientesAPITests(TestCase):
         self.assertEqual(respuesta.status_code, 400)
         data = respuesta.json()
         self.assertIn('clientes', data)
+
+
+class IdempotenciaAPITests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='movil', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        vendedor = Vendedor.objects.create(dpi='8888888888888', nombre='Vendedor Movil', sueldo=100)
+        self.ruta = Ruta.objects.create(dpi_vendedor=vendedor, fecha='2025-11-05')
+        self.cliente = Cliente.objects.create(nit='200000001', nombre='Cliente Movil')
+        self.url = f'/api/rutas/{self.ruta.id_ruta}/recorridos/'
+        self.payload = {'fecha': '2025-11-05T10:00:00Z', 'nit_cliente': self.cliente.nit, 'total': '150.00'}
+
+    def test_reintento_repite_respuesta_sin_duplicar_venta(self):
+        primera = self.client_api.post(self.url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='venta-1')
+        segunda = self.client_api.post(self.url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='venta-1')
+
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 201)
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(segunda.json()['id_venta'], primera.json()['id_venta'])
+        self.assertEqual(Venta.objects.filter(id_ruta=self.ruta).count(), 1)
+
+    def test_misma_clave_con_otro_cuerpo(self):
+        self.client_api.post(self.url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='venta-2')
+        otro = dict(self.payload, total='99.00')
+        respuesta = self.client_api.post(self.url, otro, format='json', HTTP_IDEMPOTENCY_KEY='venta-2')
+        self.assertEqual(respuesta.status_code, 422)
+        self.assertEqual(Venta.objects.filter(id_ruta=self.ruta).count(), 1)
+
+    def test_reserva_abandonada_se_reclama(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from .models import ClaveIdempotencia
+
+        # Como si el worker hubiera muerto después de reservar la clave y antes de responder.
+        self.client_api.post(self.url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='venta-3')
+        Venta.objects.all().delete()
+        ClaveIdempotencia.objects.update(codigo_estado=None, respuesta=None)
+        respuesta = self.client_api.post(self.url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='venta-3')
+        self.assertEqual(respuesta.status_code, 409)
+
+        ClaveIdempotencia.objects.update(creado_en=timezone.now() - timedelta(minutes=10))
+        respuesta = self.client_api.post(self.url, self.payload, format='json', HTTP_IDEMPOTENCY_KEY='venta-3')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(Venta.objects.filter(id_ruta=self.ruta).count(), 1)
+        self.assertEqual(ClaveIdempotencia.objects.get().codigo_estado, 201)
+
+
+class VentaIngestaAPITests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='erp', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        self.cliente = Cliente.objects.create(nit='300000001', nombre='Cliente ERP')
+        Producto.objects.create(codigo='P-1', descripcion='Producto', precio_unitario=5, presentacion_id='INDIVIDUAL')
+
+    def test_ingesta_gzip_con_errores_por_linea(self):
+        lineas = [
+            {'ref': 'a', 'fecha': '2025-11-05T10:00:00Z', 'nit_cliente': self.cliente.nit, 'total': '10.00',
+             'detalles': [{'linea': 1, 'codigo_producto': 'P-1', 'cantidad': 2, 'precio_unitario': '5.00'}]},
+            {'ref': 'b', 'fecha': '2025-11-05T10:00:00Z', 'nit_cliente': '999999999', 'total': '1.00'},
+        ]
+        cuerpo = ''.join(json.dumps(linea) + '\n' for linea in lineas) + '{no es json\n'
+        respuesta = self.client_api.generic(
+            'POST', '/api/ventas/ingesta/', gzip.compress(cuerpo.encode('utf-8')),
+            content_type='application/x-ndjson', HTTP_CONTENT_ENCODING='gzip',
+        )
+
+        self.assertEqual(respuesta.status_code, 200)
+        resultados = [json.loads(linea) for linea in b''.join(respuesta.streaming_content).splitlines()]
+        self.assertEqual([r.get('estado') for r in resultados[:3]], ['ok', 'error', 'error'])
+        self.assertIn('nit_cliente', resultados[1]['errores'])
+        self.assertEqual(resultados[-1]['resumen'], {'creadas': 1, 'con_error': 2})
+        venta = Venta.objects.get(id_venta=resultados[0]['id_venta'])
+        self.assertEqual(DetalleVenta.objects.filter(id_venta=venta).count(), 1)
+
+    @override_settings(INGESTA_MAX_BYTES_LINEA=200)
+    def test_linea_demasiado_larga_es_error_de_esa_linea(self):
+        valida = {'ref': 'c', 'fecha': '2025-11-05T10:00:00Z', 'nit_cliente': self.cliente.nit, 'total': '1.00'}
+        larga = dict(valida, ref='x' * 1000)
+        cuerpo = json.dumps(larga) + '\n' + json.dumps(valida) + '\n'
+        respuesta = self.client_api.generic('POST', '/api/ventas/ingesta/', cuerpo.encode('utf-8'), content_type='application/x-ndjson')
+
+        resultados = [json.loads(linea) for linea in b''.join(respuesta.streaming_content).splitlines()]
+        self.assertEqual([(r['linea'], r['estado']) for r in resultados[:2]], [(1, 'error'), (2, 'ok')])
+        self.assertIn('200 bytes', resultados[0]['errores']['linea'][0])
+
+
+class ClienteCSVImportTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='importador', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        Cliente.objects.create(nit='400000001', nombre='Nombre Viejo')
+
+    def _subir(self, contenido):
+        archivo = SimpleUploadedFile('clientes.csv', contenido.encode('utf-8'), content_type='text/csv')
+        return self.client_api.post('/api/importaciones/clientes/csv/', {'archivo': archivo}, format='multipart')
+
+    def test_crea_y_actualiza_en_bloque(self):
+        respuesta = self._subir(
+            'nit,nombre,direccion,correo_electronico,estatus_credito\n'
+            '400000001,Nombre Nuevo,Zona 1,,A\n'
+            '400000002,Cliente Dos,,dos@example.com,\n'
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json(), {'creados': 1, 'actualizados': 1})
+        self.assertEqual(Cliente.objects.get(nit='400000001').nombre, 'Nombre Nuevo')
+        self.assertEqual(Cliente.objects.get(nit='400000002').estatus_credito, 'B')
+
+    def test_errores_revierten_todo(self):
+        respuesta = self._subir(
+            'nit,nombre,direccion,correo_electronico,estatus_credito\n'
+            '400000003,Valido,,,B\n'
+            'ABC,,,no-es-correo,B\n'
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        errores = respuesta.json()['errores']
+        self.assertEqual(errores[0]['fila'], 3)
+        self.assertEqual(set(errores[0]['errores']), {'nit', 'nombre', 'correo_electronico'})
+        self.assertFalse(Cliente.objects.filter(nit='400000003').exists())
+
+    def test_archivo_repetido_devuelve_resultado_previo(self):
+        contenido = 'nit,nombre,direccion,correo_electronico,estatus_credito\n400000006,Repetido,,,B\n'
+        primera = self._subir(contenido)
+        Cliente.objects.filter(nit='400000006').update(nombre='Editado a mano')
+        segunda = self._subir(contenido)
+        self.assertEqual(primera.status_code, 201)
+        self.assertEqual(segunda.status_code, 200)
+        self.assertTrue(segunda.json()['duplicado'])
+        self.assertEqual(segunda.json()['creados'], 1)
+        self.assertEqual(Cliente.objects.get(nit='400000006').nombre, 'Editado a mano')
+
+    def test_lectura_por_trozos_respeta_multibyte_y_comillas(self):
+        contenido = '\ufeffnit,nombre\n400000004,"Ñandú, S.A.\nZona 2"\n400000005,Café\n'.encode('utf-8')
+        archivo = SimpleUploadedFile('clientes.csv', contenido, content_type='text/csv')
+        filas = list(leer_csv(archivo, tamano_lectura=3))
+        self.assertEqual([f['nit'] for f in filas], ['400000004', '400000005'])
+        self.assertEqual(filas[0]['nombre'], 'Ñandú, S.A.\nZona 2')
+        self.assertEqual(filas[1]['nombre'], 'Café')
+
+
+@override_settings(TAREAS_EN_SEGUNDO_PLANO=False, IMPORTACION_ERRORES_POR_PAGINA=1)
+class LoteImportacionTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='lotes', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+
+    def _subir(self, contenido):
+        archivo = SimpleUploadedFile('clientes.csv', contenido.encode('utf-8'), content_type='text/csv')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client_api.post('/api/importaciones/clientes/lotes/', {'archivo': archivo}, format='multipart')
+
+    def test_lote_se_carga_en_segundo_plano(self):
+        respuesta = self._subir('nit,nombre,direccion,correo_electronico,estatus_credito\n500000001,Uno,,,A\n500000002,Dos,,,B\n')
+        self.assertEqual(respuesta.status_code, 202)
+        estado = self.client_api.get(f"/api/importaciones/lotes/{respuesta.json()['id_lote']}/").json()
+        self.assertEqual(estado['estado'], 'CARGADO')
+        self.assertEqual(estado['resultado'], {'creados': 2, 'actualizados': 0})
+        self.assertEqual(estado['progreso']['porcentaje'], 100.0)
+        self.assertTrue(Cliente.objects.filter(nit='500000002').exists())
+
+    def test_lote_con_errores_pagina_errores_y_no_carga(self):
+        respuesta = self._subir('nit,nombre,direccion,correo_electronico,estatus_credito\nX1,Uno,,,A\nX2,,,,B\n500000003,Tres,,,B\n')
+        url = f"/api/importaciones/lotes/{respuesta.json()['id_lote']}/"
+        estado = self.client_api.get(url).json()
+        self.assertEqual(estado['estado'], 'VALIDADO')
+        self.assertEqual(estado['progreso']['con_error'], 2)
+        self.assertEqual(estado['errores']['count'], 2)
+        self.assertEqual(estado['errores']['results'][0]['fila'], 2)
+        segunda = self.client_api.get(url, {'page': 2}).json()
+        self.assertEqual(segunda['errores']['results'][0]['fila'], 3)
+        self.assertFalse(Cliente.objects.filter(nit='500000003').exists())
+        self.assertEqual(LoteImportacion.objects.get().estado, 'VALIDADO')
+
+        otro = APIClient()
+        otro.force_authenticate(user=User.objects.create_user(username='ajeno', password='secret'))
+        self.assertEqual(otro.get(url).status_code, 404)
+
+    def test_archivo_de_lote_rechazado_se_puede_reenviar(self):
+        contenido = 'nit,nombre,direccion,correo_electronico,estatus_credito\n500000007,Siete,,,ZZ\n'
+        primera = self._subir(contenido)
+        self.assertEqual(LoteImportacion.objects.get().estado, 'VALIDADO')
+        # Ya existe el estatus de crédito que faltaba: el mismo archivo debe poder cargarse.
+        CatEstatusCredito.objects.get_or_create(estatus_credito='ZZ', defaults={'descripcion': 'Nuevo'})
+        catalogos.invalidar('estatus_credito')
+        segunda = self._subir(contenido)
+        self.assertEqual(segunda.status_code, 202)
+        self.assertFalse(segunda.json()['duplicado'])
+        self.assertNotEqual(segunda.json()['id_lote'], primera.json()['id_lote'])
+        self.assertEqual(LoteImportacion.objects.get(pk=segunda.json()['id_lote']).estado, 'CARGADO')
+        self.assertIsNone(LoteImportacion.objects.get(pk=primera.json()['id_lote']).hash_archivo)
+
+    def test_lote_repetido_no_se_vuelve_a_preparar(self):
+        contenido = 'nit,nombre,direccion,correo_electronico,estatus_credito\n500000004,Cuatro,,,A\n'
+        primera = self._subir(contenido)
+        segunda = self._subir(contenido)
+        self.assertEqual(segunda.status_code, 200)
+        self.assertTrue(segunda.json()['duplicado'])
+        self.assertEqual(segunda.json()['id_lote'], primera.json()['id_lote'])
+        self.assertEqual(LoteImportacion.objects.count(), 1)
+
+    def test_falla_en_validacion_no_deja_el_lote_en_proceso(self):
+        from unittest import mock
+
+        from django.core.management import call_command
+
+        contenido = 'nit,nombre,direccion,correo_electronico,estatus_credito\n500000006,Seis,,,A\n'
+        with mock.patch('management.importacion.validar_cliente', side_effect=RuntimeError('sin conexión')):
+            with self.assertRaises(RuntimeError):
+                self._subir(contenido)
+        lote = LoteImportacion.objects.get()
+        self.assertEqual(lote.estado, 'ERROR')
+        self.assertIn('sin conexión', self.client_api.get(f'/api/importaciones/lotes/{lote.id_lote}/').json()['resultado']['detail'])
+
+        call_command('procesar_lotes', lote=lote.id_lote, stdout=StringIO())
+        self.assertEqual(LoteImportacion.objects.get().estado, 'CARGADO')
+
+    def test_lote_abandonado_en_proceso_vuelve_a_la_cola(self):
+        from datetime import timedelta
+
+        from django.core.management import call_command
+        from django.utils import timezone
+
+        atascado = LoteImportacion.objects.create(
+            nombre_archivo='a.csv', estado='EN_PROCESO', subido_por=self.user.id,
+            reclamado_en=timezone.now() - timedelta(hours=2),
+        )
+        activo = LoteImportacion.objects.create(
+            nombre_archivo='b.csv', estado='EN_PROCESO', subido_por=self.user.id, reclamado_en=timezone.now(),
+        )
+        call_command('procesar_lotes', stdout=StringIO())
+        self.assertEqual(LoteImportacion.objects.get(pk=atascado.pk).estado, 'CARGADO')
+        self.assertEqual(LoteImportacion.objects.get(pk=activo.pk).estado, 'EN_PROCESO')
+
+
+class ClienteBusquedaTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='buscador', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        Cliente.objects.create(nit='600000001', nombre='Distribuidora Los Andes', direccion='Calzada Roosevelt')
+        Cliente.objects.create(nit='600000002', nombre='Ferretería El Martillo', direccion='Zona 1')
+        Cliente.objects.create(nit='610000003', nombre='Andes Express', direccion='Zona 10')
+
+    def _nits(self, q, **params):
+        respuesta = self.client_api.get('/api/clientes/buscar/', dict(params, q=q))
+        self.assertEqual(respuesta.status_code, 200)
+        return [c['nit'] for c in respuesta.json()['results']], respuesta.json()
+
+    def test_prefijos_de_tokens_nombre_direccion_y_nit(self):
+        self.assertEqual(self._nits('distr and')[0], ['600000001'])
+        self.assertEqual(sorted(self._nits('andes')[0]), ['600000001', '610000003'])
+        self.assertEqual(self._nits('ferreteria')[0], ['600000002'])
+        self.assertEqual(self._nits('6100')[0], ['610000003'])
+        self.assertEqual(self._nits('zona 10')[0], ['610000003'])
+
+    def test_indice_sigue_escrituras_y_pagina(self):
+        Cliente.objects.filter(nit='600000002').update(nombre='Andes Hardware')
+        Cliente.objects.filter(nit='610000003').delete()
+        nits, data = self._nits('andes', page_size=1)
+        self.assertEqual(len(nits), 1)
+        self.assertIsNotNone(data['next'])
+        segunda, data = self._nits('andes', page_size=1, page=2)
+        self.assertIsNone(data['next'])
+        self.assertEqual(sorted(nits + segunda), ['600000001', '600000002'])
+
+    @override_settings(BUSQUEDA_MAX_CANDIDATOS=1)
+    def test_candidatos_son_los_mejor_puntuados(self):
+        # Primero en el índice pero solo coincide por dirección, que pesa menos que el nombre.
+        Cliente.objects.filter(nit='600000001').update(nombre='Distribuidora Central', direccion='Calle Andes')
+        self.assertEqual(self._nits('andes')[0], ['610000003'])
+
+
+class ConsultaPorLlavesTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='llaves', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        for nit in ('700000001', '700000002', '700000003'):
+            Cliente.objects.create(nit=nit, nombre=f'Cliente {nit}')
+        Producto.objects.create(codigo='ABC-1', descripcion='A', precio_unitario=1, presentacion_id='INDIVIDUAL')
+        Producto.objects.create(codigo='abc-2', descripcion='B', precio_unitario=1, presentacion_id='INDIVIDUAL')
+        Producto.objects.create(codigo='XyZ-3', descripcion='C', precio_unitario=1, presentacion_id='INDIVIDUAL')
+
+    def test_clientes_por_varios_nit(self):
+        respuesta = self.client_api.get('/api/clientes/', {'nit': '700000001, 700000003,700000001'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual([c['nit'] for c in respuesta.json()['results']], ['700000001', '700000003'])
+
+    def test_productos_por_codigo_sin_importar_mayusculas(self):
+        respuesta = self.client_api.get('/api/productos/', {'codigo': 'abc-1,ABC-2'})
+        self.assertEqual(sorted(p['codigo'] for p in respuesta.json()['results']), ['ABC-1', 'abc-2'])
+
+    def test_producto_con_codigo_mixto(self):
+        respuesta = self.client_api.get('/api/productos/', {'codigo': 'xyz-3'})
+        self.assertEqual([p['codigo'] for p in respuesta.json()['results']], ['XyZ-3'])
+
+
+class PaginacionTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='paginas', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        vendedor = Vendedor.objects.create(dpi='7777777777777', nombre='Vendedor Paginas', sueldo=100)
+        for dia in range(1, 6):
+            Ruta.objects.create(dpi_vendedor=vendedor, fecha=f'2025-11-0{dia}')
+
+    def test_rutas_con_cursor(self):
+        ids = []
+        url = '/api/rutas/?page_size=2'
+        while url:
+            data = self.client_api.get(url).json()
+            self.assertNotIn('count', data)
+            ids += [ruta['id_ruta'] for ruta in data['results']]
+            url = data['next']
+        self.assertEqual(ids, sorted(Ruta.objects.values_list('id_ruta', flat=True)))
+
+    def test_vendedores_con_paginacion_por_defecto(self):
+        data = self.client_api.get('/api/vendedores/', {'page_size': 1}).json()
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(len(data['results']), 1)
+
+
+class CatalogoCacheTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='catalogos', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+
+    def test_catalogo_en_memoria_se_invalida_al_guardar(self):
+        catalogos.obtener_catalogo('presentacion')
+        with self.assertNumQueries(0):
+            self.assertTrue(catalogos.existe('presentacion', 'INDIVIDUAL'))
+            self.assertFalse(catalogos.existe('presentacion', 'CAJA'))
+        with self.captureOnCommitCallbacks(execute=True):
+            CatPresentacion.objects.create(presentacion='CAJA', descripcion='Caja')
+        self.assertTrue(catalogos.existe('presentacion', 'CAJA'))
+        with self.captureOnCommitCallbacks(execute=True):
+            CatPresentacion.objects.filter(presentacion='CAJA').delete()
+        self.assertFalse(catalogos.existe('presentacion', 'CAJA'))
+
+    def test_version_cambia_solo_al_confirmar(self):
+        catalogos.obtener_catalogo('presentacion')
+        version = catalogos._version('presentacion')
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                CatPresentacion.objects.create(presentacion='BULTO', descripcion='Bulto')
+                # Una lectura antes del commit no debe quedar guardada con una versión nueva.
+                self.assertFalse(catalogos.existe('presentacion', 'BULTO'))
+                self.assertEqual(catalogos._version('presentacion'), version)
+        self.assertNotEqual(catalogos._version('presentacion'), version)
+        self.assertTrue(catalogos.existe('presentacion', 'BULTO'))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with transaction.atomic():
+                CatPresentacion.objects.create(presentacion='SACO', descripcion='Saco')
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+
+    @override_settings(CATALOGOS_TTL=60)
+    def test_copia_local_vence_sin_invalidacion(self):
+        from unittest import mock
+
+        # Como otro worker con caché local: el cambio no le llega por versión, solo por vencimiento.
+        catalogos.invalidar('presentacion')
+        catalogos.obtener_catalogo('presentacion')
+        CatPresentacion.objects.bulk_create([CatPresentacion(presentacion='FARDO', descripcion='Fardo')])
+        self.assertFalse(catalogos.existe('presentacion', 'FARDO'))
+        ahora = catalogos.time.monotonic()
+        with mock.patch.object(catalogos.time, 'monotonic', return_value=ahora + 61):
+            self.assertTrue(catalogos.existe('presentacion', 'FARDO'))
+
+    def test_cliente_ruta_valida_catalogos_en_memoria(self):
+        from .serializers import ClienteRutaSerializer
+
+        CatTiempoCliente.objects.get_or_create(id_tiempo_cliente=1, defaults={'minutos': 15, 'descripcion': 'Corto'})
+        CatResultadoVisita.objects.get_or_create(resultado_visita='PENDIENTE', defaults={'descripcion': 'Pendiente'})
+        catalogos.invalidar('tiempo_cliente')
+        catalogos.invalidar('resultado_visita')
+        catalogos.obtener_catalogo('tiempo_cliente')
+        catalogos.obtener_catalogo('resultado_visita')
+        with self.assertNumQueries(0):
+            valido = ClienteRutaSerializer(data={'id_tiempo_cliente': 1, 'resultado_visita': 'PENDIENTE'}, partial=True)
+            self.assertTrue(valido.is_valid(), valido.errors)
+            invalido = ClienteRutaSerializer(data={'id_tiempo_cliente': 99, 'resultado_visita': 'NADA'}, partial=True)
+            self.assertFalse(invalido.is_valid())
+        self.assertEqual(set(invalido.errors), {'id_tiempo_cliente', 'resultado_visita'})
+
+    def test_producto_con_presentacion_inexistente(self):
+        respuesta = self.client_api.post(
+            '/api/productos/',
+            {'codigo': 'P-9', 'descripcion': 'X', 'precio_unitario': '1.00', 'presentacion_id': 'NO-EXISTE'},
+            format='json',
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('presentacion_id', respuesta.json())
+        respuesta = self.client_api.post(
+            '/api/productos/',
+            {'codigo': 'P-9', 'descripcion': 'X', 'precio_unitario': '1.00', 'presentacion_id': 'DOCENA'},
+            format='json',
+        )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json()['presentacion'], 'DOCENA')
+
+
+class ProductoCargaMasivaTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='precios', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        Producto.objects.create(codigo='PM-1', descripcion='Viejo', precio_unitario=1, presentacion_id='INDIVIDUAL')
+
+    def test_carga_json_crea_y_actualiza(self):
+        respuesta = self.client_api.post('/api/productos/bulk/', [
+            {'codigo': 'PM-1', 'descripcion': 'Nuevo', 'precio_unitario': '2.50', 'presentacion_id': 'INDIVIDUAL'},
+            {'codigo': 'PM-2', 'descripcion': 'Otro', 'precio_unitario': '3.00', 'presentacion_id': 'DOCENA'},
+        ], format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        data = respuesta.json()
+        self.assertEqual((data['creados'], data['actualizados']), (1, 1))
+        self.assertEqual([r['estado'] for r in data['resultados']], ['actualizado', 'creado'])
+        self.assertEqual(str(Producto.objects.get(codigo='PM-1').precio_unitario), '2.50')
+
+    def test_carga_csv_con_error_no_aplica_cambios(self):
+        contenido = (
+            'codigo,descripcion,precio_unitario,presentacion\n'
+            'PM-1,Nuevo,9.00,INDIVIDUAL\n'
+            'PM-3,Malo,1.00,NO-EXISTE\n'
+        ).encode('utf-8')
+        archivo = SimpleUploadedFile('precios.csv', contenido, content_type='text/csv')
+        respuesta = self.client_api.post('/api/productos/bulk/', {'archivo': archivo}, format='multipart')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['resultados'][1]['fila'], 3)
+        self.assertEqual(str(Producto.objects.get(codigo='PM-1').precio_unitario), '1.00')
+        self.assertFalse(Producto.objects.filter(codigo='PM-3').exists())
+
+
+class CamposDinamicosTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='campos', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        vendedor = Vendedor.objects.create(dpi='6666666666666', nombre='Vendedor Campos', sueldo=100)
+        tiempo, _ = CatTiempoCliente.objects.get_or_create(id_tiempo_cliente=1, defaults={'minutos': 15, 'descripcion': 'Corto'})
+        CatResultadoVisita.objects.get_or_create(resultado_visita='PENDIENTE', defaults={'descripcion': 'Pendiente'})
+        for dia in range(1, 4):
+            ruta = Ruta.objects.create(dpi_vendedor=vendedor, fecha=f'2025-11-0{dia}')
+            cliente = Cliente.objects.create(nit=f'60000000{dia}', nombre=f'Cliente {dia}')
+            ClienteRuta.objects.create(ruta=ruta, cliente=cliente, orden_visita=1, id_tiempo_cliente=tiempo)
+
+    def test_clientes_solo_campos_pedidos(self):
+        respuesta = self.client_api.get('/api/clientes/', {'fields': 'nit,nombre'})
+        self.assertEqual(set(respuesta.json()['results'][0]), {'nit', 'nombre'})
+        respuesta = self.client_api.get('/api/clientes/', {'omit': 'direccion,correo_electronico'})
+        self.assertNotIn('direccion', respuesta.json()['results'][0])
+        self.assertIn('estatus_credito', respuesta.json()['results'][0])
+
+    def test_rutas_sin_anidados_no_hacen_prefetch(self):
+        # Una consulta para los validadores de GET condicional y otra para la página.
+        with self.assertNumQueries(2):
+            respuesta = self.client_api.get('/api/rutas/', {'fields': 'id_ruta,fecha,estado'})
+        self.assertEqual(set(respuesta.json()['results'][0]), {'id_ruta', 'fecha', 'estado'})
+        # Con los anidados: una consulta extra para todas las rutas, no una por ruta.
+        with self.assertNumQueries(3):
+            respuesta = self.client_api.get('/api/rutas/')
+        self.assertEqual(respuesta.json()['results'][0]['clienterutas'][0]['cliente']['nit'], '600000001')
+
+    def test_evidencias_con_select_related_base(self):
+        cliente = Cliente.objects.get(nit='600000001')
+        EvidenciaFotografica.objects.create(cliente=cliente, url='https://example.com/e.jpg', descripcion='Fachada')
+        respuesta = self.client_api.get('/api/evidencias/', {'fields': 'id,descripcion'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['results'][0], {'id': respuesta.json()['results'][0]['id'], 'descripcion': 'Fachada'})
+        respuesta = self.client_api.get('/api/evidencias/', {'fields': 'id,cliente'})
+        self.assertEqual(respuesta.json()['results'][0]['cliente'], '600000001')
+
+
+class GetCondicionalTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.user = User.objects.create_user(username='etag', password='secret')
+        self.client_api.force_authenticate(user=self.user)
+        Producto.objects.create(codigo='ET-1', descripcion='A', precio_unitario=1, presentacion_id='INDIVIDUAL')
+
+    def test_lista_responde_304_sin_cambios(self):
+        respuesta = self.client_api.get('/api/productos/')
+        etag = respuesta['ETag']
+        with self.assertNumQueries(1):
+            respuesta = self.client_api.get('/api/productos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.content, b'')
+        self.client_api.patch('/api/productos/ET-1/', {'precio_unitario': '2.00'}, format='json')
+        respuesta = self.client_api.get('/api/productos/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_detalle_con_if_modified_since(self):
+        respuesta = self.client_api.get('/api/productos/ET-1/')
+        respuesta = self.client_api.get('/api/productos/ET-1/', HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(self.client_api.get('/api/productos/NO-EXISTE/').status_code, 404)
+
+    def test_ruta_cambia_etag_al_editar_sus_clientes(self):
+        vendedor = Vendedor.objects.create(dpi='6666666666666', nombre='Vendedor ETag', sueldo=100)
+        ruta = Ruta.objects.create(dpi_vendedor=vendedor, fecha='2025-11-05')
+        cliente = Cliente.objects.create(nit='800000001', nombre='Cliente ETag')
+        tiempo, _ = CatTiempoCliente.objects.get_or_create(id_tiempo_cliente=1, defaults={'minutos': 15, 'descripcion': 'Corto'})
+        CatResultadoVisita.objects.get_or_create(resultado_visita='PENDIENTE', defaults={'descripcion': 'Pendiente'})
+        visita = ClienteRuta.objects.create(ruta=ruta, cliente=cliente, orden_visita=1, id_tiempo_cliente=tiempo)
+        url = f'/api/rutas/{ruta.id_ruta}/'
+        etag = self.client_api.get(url)['ETag']
+
+        visita.observaciones = 'Cerrado'
+        visita.save()
+        respuesta = self.client_api.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['clienterutas'][0]['observaciones'], 'Cerrado')
+
+        etag = respuesta['ETag']
+        visita.delete()
+        self.assertEqual(self.client_api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ORJSONRendererTests(TestCase):
+    def test_mismo_resultado_que_drf(self):
+        from datetime import datetime, timezone as tz
+        from decimal import Decimal
+        from rest_framework.renderers import JSONRenderer
+        from .renderers import ORJSONRenderer
+
+        datos = {'total': Decimal('10.50'), 'fecha': datetime(2025, 11, 5, 8, 30, tzinfo=tz.utc), 'nombre': 'Café', 1: [None]}
+        self.assertEqual(json.loads(ORJSONRenderer().render(datos)), json.loads(JSONRenderer().render(datos)))
+
+    def test_json_invalido_responde_400(self):
+        client_api = APIClient()
+        client_api.force_authenticate(user=User.objects.create_user(username='json', password='secret'))
+        respuesta = client_api.post('/api/productos/bulk/', b'[{"codigo": ', content_type='application/json')
+        self.assertEqual(respuesta.status_code, 400)
+
+
+def _jpeg_prueba(ancho, alto):
+    buffer = BytesIO()
+    Image.new('RGB', (ancho, alto), color=(0, 128, 255)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+@override_settings(TAREAS_EN_SEGUNDO_PLANO=False)
+class EvidenciaDerivadosTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(user=User.objects.create_user(username='fotos', password='secret'))
+
+    def test_subida_genera_miniatura_y_mediana(self):
+        archivo = SimpleUploadedFile('foto.jpg', _jpeg_prueba(3000, 2000), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client_api.post('/api/evidencias/subir/', {'archivo': archivo}, format='multipart')
+        self.assertEqual(respuesta.status_code, 201)
+        # La respuesta sale antes de procesar: mientras tanto la miniatura apunta al original.
+        self.assertEqual(respuesta.json()['miniatura_url'], respuesta.json()['imagen_url'])
+
+        evidencia = EvidenciaFotografica.objects.get(pk=respuesta.json()['id'])
+        with Image.open(evidencia.miniatura.path) as miniatura:
+            self.assertEqual(miniatura.size, (320, 213))
+        with Image.open(evidencia.mediana.path) as mediana:
+            self.assertEqual(max(mediana.size), 1280)
+        data = self.client_api.get(f'/api/evidencias/{evidencia.pk}/').json()
+        self.assertTrue(data['miniatura_url'].endswith(evidencia.miniatura.name))
+
+    def test_foto_se_normaliza_sin_exif_y_orientada(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientación: rotada 90° como la guardan muchos teléfonos.
+        exif[0x010F] = 'Telefono'
+        buffer = BytesIO()
+        Image.new('RGB', (4000, 3000), color=(200, 10, 10)).save(buffer, format='JPEG', exif=exif.tobytes(), quality=95)
+        archivo = SimpleUploadedFile('cruda.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client_api.post('/api/evidencias/subir/', {'archivo': archivo}, format='multipart')
+
+        evidencia = EvidenciaFotografica.objects.get(pk=respuesta.json()['id'])
+        self.assertNotEqual(evidencia.imagen.name, respuesta.json()['imagen_url'].split('/media/')[-1])
+        with Image.open(evidencia.imagen.path) as imagen:
+            self.assertEqual(imagen.size, (1536, 2048))
+            self.assertNotIn('exif', imagen.info)
+        self.assertLess(evidencia.imagen.size, len(buffer.getvalue()))
+
+    def test_original_se_guarda_sin_gps_antes_de_normalizar(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x010F] = 'Telefono'
+        exif.get_ifd(0x8825)[2] = (14.0, 38.0, 2.0)  # GPSLatitude
+        buffer = BytesIO()
+        Image.new('RGB', (400, 300), color=(200, 10, 10)).save(buffer, format='JPEG', exif=exif.tobytes())
+
+        # Sin ejecutar los callbacks de on_commit: así queda el original mientras la tarea no corre.
+        for datos in ({'archivo': SimpleUploadedFile('gps.jpg', buffer.getvalue())},
+                      {'archivos': [SimpleUploadedFile(f'gps{i}.jpg', buffer.getvalue()) for i in range(2)]}):
+            respuesta = self.client_api.post('/api/evidencias/subir/', datos, format='multipart')
+            self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(EvidenciaFotografica.objects.count(), 3)
+        for evidencia in EvidenciaFotografica.objects.all():
+            with Image.open(evidencia.imagen.path) as imagen:
+                guardado = imagen.getexif()
+                self.assertEqual(imagen.size, (400, 300))
+                self.assertEqual(dict(guardado), {0x0112: 6})
+                self.assertFalse(guardado.get_ifd(0x8825))
+
+    def test_varias_fotos_en_una_solicitud(self):
+        vendedor = Vendedor.objects.create(dpi='5555555555555', nombre='Vendedor Fotos', sueldo=100)
+        ruta = Ruta.objects.create(dpi_vendedor=vendedor, fecha='2025-11-05')
+        archivos = [
+            SimpleUploadedFile(f'foto{i}.jpg', _jpeg_prueba(100 + i, 100), content_type='image/jpeg') for i in range(3)
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client_api.post(
+                '/api/evidencias/subir/', {'archivos': archivos, 'id_ruta': ruta.id_ruta, 'descripcion': 'Parada'}, format='multipart',
+            )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(len(respuesta.json()['evidencias']), 3)
+        self.assertEqual(EvidenciaFotografica.objects.filter(ruta=ruta, descripcion='Parada', miniatura__isnull=False).count(), 3)
+        self.assertEqual(Archivo.objects.filter(categoria='original').count(), 3)
+
+        archivos = [SimpleUploadedFile('ok.jpg', _jpeg_prueba(10, 10)), SimpleUploadedFile('malo.jpg', b'no es imagen')]
+        respuesta = self.client_api.post('/api/evidencias/subir/', {'archivos': archivos}, format='multipart')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('malo.jpg', respuesta.json()['archivos'])
+
+
+@override_settings(TAREAS_EN_SEGUNDO_PLANO=False)
+class CargaEvidenciaTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, EVIDENCIA_CARGAS_DIR=f'{self.media}/cargas', EVIDENCIA_CARGA_MAX_BLOQUE=4096)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(user=User.objects.create_user(username='cargas', password='secret'))
+
+    def _bloque(self, url, contenido, desplazamiento):
+        return self.client_api.put(
+            url, contenido, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(desplazamiento),
+        )
+
+    def test_carga_por_partes_con_reintento(self):
+        foto = _jpeg_prueba(200, 100) + b'\0' * 5000
+        respuesta = self.client_api.post('/api/evidencias/cargas/', {
+            'nombre_archivo': 'foto.jpg', 'tamano_total': len(foto), 'descripcion': 'Fachada',
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        url = f"/api/evidencias/cargas/{respuesta.json()['id_carga']}/"
+
+        self.assertEqual(self._bloque(url, foto[:4000], 0).json()['recibido'], 4000)
+        # Un bloque que salta posiciones se rechaza e indica desde dónde seguir.
+        respuesta = self._bloque(url, foto[5000:], 5000)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta['Upload-Offset'], '4000')
+        # Reenviar un bloque ya recibido no cambia nada.
+        self.assertEqual(self._bloque(url, foto[:4000], 0).json()['recibido'], 4000)
+        self.assertEqual(self.client_api.post(f'{url}finalizar/').status_code, 409)
+        self.assertTrue(self._bloque(url, foto[4000:], 4000).json()['completa'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client_api.post(f'{url}finalizar/')
+        self.assertEqual(respuesta.status_code, 201)
+        evidencia = EvidenciaFotografica.objects.get(pk=respuesta.json()['id'])
+        self.assertEqual(evidencia.descripcion, 'Fachada')
+        with evidencia.imagen.open('rb') as archivo:
+            self.assertEqual(archivo.read(), foto)
+        self.assertTrue(evidencia.miniatura)
+        # Finalizar de nuevo devuelve la misma evidencia.
+        self.assertEqual(self.client_api.post(f'{url}finalizar/').json()['id'], evidencia.pk)
+        self.assertEqual(EvidenciaFotografica.objects.count(), 1)
+
+
+@override_settings(TAREAS_EN_SEGUNDO_PLANO=False)
+class AlmacenamientoPorContenidoTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(user=User.objects.create_user(username='cas', password='secret'))
+
+    def _subir(self, contenido, nombre):
+        archivo = SimpleUploadedFile(nombre, contenido, content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client_api.post('/api/evidencias/subir/', {'archivo': archivo}, format='multipart').json()
+
+    def test_misma_foto_se_guarda_una_vez_y_se_recolecta_sin_referencias(self):
+        from .archivos import recolectar_huerfanos
+
+        foto = _jpeg_prueba(400, 300)
+        primera = EvidenciaFotografica.objects.get(pk=self._subir(foto, 'parada.jpg')['id'])
+        segunda = EvidenciaFotografica.objects.get(pk=self._subir(foto, 'venta.JPEG')['id'])
+        self.assertEqual(primera.imagen.name, segunda.imagen.name)
+        self.assertRegex(primera.imagen.name, r'^evidencias/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertEqual(Archivo.objects.filter(url=primera.imagen.name).count(), 2)
+
+        primera.delete()
+        self.assertEqual(recolectar_huerfanos(0), [])
+        ruta = segunda.imagen.path
+        segunda.delete()
+        self.assertEqual(len(recolectar_huerfanos(0)), 3)
+        self.assertFalse(os.path.exists(ruta))
+
+    def test_recolector_respeta_archivo_tocado_durante_la_pasada(self):
+        from unittest import mock
+
+        from django.core.files.base import ContentFile
+
+        from . import archivos
+        from .almacenamiento import almacenamiento_evidencias
+
+        nombre = almacenamiento_evidencias.save('vieja.jpg', ContentFile(_jpeg_prueba(30, 30)))
+        ruta = almacenamiento_evidencias.path(nombre)
+        os.utime(ruta, (0, 0))
+
+        def subida_repetida(nombres):
+            # Otra subida con el mismo contenido renueva la fecha antes de registrar su referencia.
+            os.utime(ruta)
+            return set()
+
+        with mock.patch.object(archivos, '_referenciados', side_effect=subida_repetida):
+            self.assertEqual(archivos.recolectar_huerfanos(3600), [])
+        self.assertTrue(os.path.exists(ruta))
+
+
+class MedioEvidenciaTests(TestCase):
+    def setUp(self):
+        from django.core.files.base import ContentFile
+        from .almacenamiento import almacenamiento_evidencias
+
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.contenido = _jpeg_prueba(50, 50)
+        self.nombre = almacenamiento_evidencias.save('foto.jpg', ContentFile(self.contenido))
+        self.url = f'/media/{self.nombre}'
+        self.client = APIClient()
+        self.client.force_authenticate(user=User.objects.create_user(username='medios', password='secret'))
+
+    def test_cache_inmutable_etag_y_rangos(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido)
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertEqual(respuesta['Content-Type'], 'image/jpeg')
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=respuesta['ETag']).status_code, 304)
+        parcial = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(parcial.status_code, 206)
+        self.assertEqual(b''.join(parcial.streaming_content), self.contenido[10:20])
+        self.assertEqual(parcial['Content-Range'], f'bytes 10-19/{len(self.contenido)}')
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=999999-').status_code, 416)
+        self.assertEqual(self.client.get('/media/evidencias/../../etc/passwd').status_code, 404)
+
+    def test_requiere_autenticacion(self):
+        self.assertEqual(APIClient().get(self.url).status_code, 401)
+
+    @override_settings(ARCHIVOS_DESCARGA='x-accel')
+    def test_descarga_delegada_a_nginx(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta['X-Accel-Redirect'], f'/_media/{self.nombre}')
+        self.assertEqual(respuesta.content, b'')
+
+
+class GaleriaRutaTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(user=User.objects.create_user(username='galeria', password='secret'))
+        vendedor = Vendedor.objects.create(dpi='4444444444444', nombre='Vendedor Galeria', sueldo=100)
+        tiempo, _ = CatTiempoCliente.objects.get_or_create(id_tiempo_cliente=1, defaults={'minutos': 15, 'descripcion': 'Corto'})
+        CatResultadoVisita.objects.get_or_create(resultado_visita='PENDIENTE', defaults={'descripcion': 'Pendiente'})
+        self.ruta = Ruta.objects.create(dpi_vendedor=vendedor, fecha='2025-11-05')
+        primero = Cliente.objects.create(nit='700000001', nombre='Tienda Uno')
+        segundo = Cliente.objects.create(nit='700000002', nombre='Tienda Dos')
+        ClienteRuta.objects.create(ruta=self.ruta, cliente=segundo, orden_visita=1, id_tiempo_cliente=tiempo)
+        ClienteRuta.objects.create(ruta=self.ruta, cliente=primero, orden_visita=2, id_tiempo_cliente=tiempo)
+        venta = Venta.objects.create(fecha='2025-11-05T10:00:00Z', nit_cliente=primero, id_ruta=self.ruta, total='150.50')
+        EvidenciaFotografica.objects.create(ruta=self.ruta, cliente=primero, venta=venta, imagen='evidencias/a.jpg')
+        EvidenciaFotografica.objects.create(
+            ruta=self.ruta, cliente=segundo, imagen='evidencias/b.jpg', miniatura='evidencias/b_min.jpg',
+        )
+        EvidenciaFotografica.objects.create(ruta=self.ruta, url='https://example.com/sin-cliente.jpg')
+
+    def test_galeria_agrupada_por_parada_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            respuesta = self.client_api.get(f'/api/rutas/{self.ruta.pk}/galeria/')
+        self.assertEqual(respuesta.status_code, 200)
+        paradas = respuesta.json()['paradas']
+        self.assertEqual([parada['orden_visita'] for parada in paradas], [1, 2, None])
+        self.assertEqual(paradas[0]['cliente_nombre'], 'Tienda Dos')
+        self.assertEqual(paradas[0]['evidencias'][0]['miniatura_url'], 'http://testserver/media/evidencias/b_min.jpg')
+        self.assertEqual(paradas[1]['evidencias'][0]['mediana_url'], 'http://testserver/media/evidencias/a.jpg')
+        self.assertEqual(float(paradas[1]['evidencias'][0]['venta_total']), 150.5)
+        self.assertEqual(paradas[2]['evidencias'][0]['imagen_url'], 'https://example.com/sin-cliente.jpg')
+        self.assertEqual(self.client_api.get('/api/rutas/999999/galeria/').status_code, 404)
+
+
+class JWTSinConsultaTests(TestCase):
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user = User.objects.create_user(username='token', password='secret', email='token@example.com')
+        UserProfile.objects.create(user=self.user, rol='vendedor')
+
+    def _login(self):
+        respuesta = self.client.post('/api/auth/login/', {'username': 'token', 'password': 'secret'})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_token_lleva_claims_y_no_consulta_usuario(self):
+        from .autenticacion import JWTSinConsulta
+        from rest_framework_simplejwt.tokens import AccessToken
+
+        data = self._login()
+        self.assertEqual(data['user'], {'id': self.user.id, 'username': 'token', 'email': 'token@example.com'})
+        token = AccessToken(data['access'])
+        self.assertEqual((token['username'], token['rol']), ('token', 'vendedor'))
+
+        autenticacion = JWTSinConsulta()
+        # La primera vez se verifica que siga activo; después sale de la caché.
+        with self.assertNumQueries(1):
+            usuario, _ = autenticacion.authenticate(self._peticion(data['access']))
+        with self.assertNumQueries(0):
+            usuario, _ = autenticacion.authenticate(self._peticion(data['access']))
+        self.assertEqual((usuario.id, usuario.username, usuario.rol), (self.user.id, 'token', 'vendedor'))
+
+    def test_usuario_desactivado_pierde_acceso(self):
+        access = self._login()['access']
+        self.assertEqual(self.client.get('/api/clientes/', HTTP_AUTHORIZATION=f'Bearer {access}').status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/clientes/', HTTP_AUTHORIZATION=f'Bearer {access}').status_code, 401)
+
+    def _peticion(self, access):
+        from rest_framework.test import APIRequestFactory
+
+        return APIRequestFactory().get('/api/clientes/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+
+class MedicionMiddlewareTests(TestCase):
+    def setUp(self):
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(user=User.objects.create_user(username='medicion', password='secret'))
+        Cliente.objects.create(nit='800000001', nombre='Cliente Medido')
+
+    def test_server_timing_y_log_con_la_vista(self):
+        with self.assertLogs('management.rendimiento', level='INFO') as registro:
+            respuesta = self.client_api.get('/api/clientes/')
+        self.assertEqual(respuesta.status_code, 200)
+        metricas = {parte.split(';')[0] for parte in respuesta['Server-Timing'].split(', ')}
+        self.assertEqual(metricas, {'db', 'ser', 'render', 'total'})
+        self.assertIn('consultas"', respuesta['Server-Timing'])
+        datos = registro.records[0].medicion
+        self.assertEqual(datos['vista'], 'ClienteViewSet.list')
+        self.assertGreaterEqual(datos['consultas'], 1)
+        self.assertGreater(datos['serializador_ms'] + datos['db_ms'], 0)
+
+
+# Presupuesto de consultas: cada GET del router debe costar lo mismo con pocos o con muchos registros.
+# Si una consulta se repite por fila (N+1) la prueba falla mostrando el SQL y desde dónde se ejecutó.
+class PresupuestoConsultasMixin:
+    # Endpoints que necesitan parámetros propios; el resto se recorre sin parámetros.
+    parametros_endpoint = {}
+
+    def endpoints_router(self, claves):
+        for prefijo, viewset, basename in router.registry:
+            yield f'/api/{prefijo}/'
+            for accion in viewset.get_extra_actions():
+                if 'get' in accion.mapping and not accion.detail:
+                    yield f'/api/{prefijo}/{accion.url_path}/'
+            if basename not in claves:
+                continue
+            yield f'/api/{prefijo}/{claves[basename]}/'
+            for accion in viewset.get_extra_actions():
+                if 'get' in accion.mapping and accion.detail:
+                    yield f'/api/{prefijo}/{claves[basename]}/{accion.url_path}/'
+
+    def capturar_consultas(self, url):
+        consultas = []
+
+        def registrar(execute, sql, params, many, context):
+            consultas.append((sql, _origen_consulta()))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(registrar):
+            respuesta = self.client_api.get(url, self.parametros_endpoint.get(url, {}))
+        self.assertEqual(respuesta.status_code, 200, f'{url}: {respuesta.status_code}')
+        return consultas
+
+    def assertPresupuestoConstante(self, urls, crecer):
+        for url in urls:
+            self.capturar_consultas(url)  # Calienta cachés de proceso (catálogos) antes de medir.
+        pocos = {url: self.capturar_consultas(url) for url in urls}
+        crecer()
+        fallas = []
+        for url in urls:
+            muchos = self.capturar_consultas(url)
+            if len(muchos) > len(pocos[url]):
+                fallas.append(_reporte_crecimiento(url, pocos[url], muchos))
+        if fallas:
+            self.fail('Consultas que crecen con los datos:\n' + '\n'.join(fallas))
+
+
+DIRECTORIO_APP = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def _origen_consulta():
+    marcos = [
+        marco for marco in traceback.extract_stack()[:-2]
+        if marco.filename.startswith(DIRECTORIO_APP) and not marco.filename.endswith(('tests.py', 'rendimiento.py'))
+    ]
+    return ' <- '.join(f'{os.path.basename(marco.filename)}:{marco.lineno} {marco.name}' for marco in reversed(marcos[-3:]))
+
+
+def _reporte_crecimiento(url, pocos, muchos):
+    antes = Counter(sql for sql, _ in pocos)
+    despues = Counter(sql for sql, _ in muchos)
+    lineas = [f'{url}: {len(pocos)} -> {len(muchos)} consultas']
+    for sql, veces in despues.items():
+        if veces > antes.get(sql, 0):
+            origen = next(origen for texto, origen in muchos if texto == sql)
+            texto = re.sub(r'\s+', ' ', sql)[:200]
+            lineas.append(f'  {antes.get(sql, 0)} -> {veces}x {texto}\n    en {origen or "?"}')
+    return '\n'.join(lineas)
+
+
+class PresupuestoConsultasRouterTests(PresupuestoConsultasMixin, TestCase):
+    parametros_endpoint = {'/api/clientes/buscar/': {'q': 'presupuesto'}}
+
+    def setUp(self):
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(user=User.objects.create_user(username='presupuesto', password='secret'))
+        self.tiempo, _ = CatTiempoCliente.objects.get_or_create(id_tiempo_cliente=1, defaults={'minutos': 15, 'descripcion': 'Corto'})
+        CatResultadoVisita.objects.get_or_create(resultado_visita='PENDIENTE', defaults={'descripcion': 'Pendiente'})
+        self.vendedor = Vendedor.objects.create(dpi='9000000000000', nombre='Vendedor Presupuesto', sueldo=100)
+        self.ruta = Ruta.objects.create(dpi_vendedor=self.vendedor, fecha='2025-11-05')
+        self.sembrados = 0
+        self.sembrar(2)
+
+    # Agrega registros hasta tener n de cada cosa; la ruta y el vendedor principales crecen con ellos.
+    def sembrar(self, n):
+        for i in range(self.sembrados, n):
+            cliente = Cliente.objects.create(nit=f'9{i:08d}', nombre=f'Presupuesto Cliente {i}')
+            Producto.objects.create(codigo=f'PRE-{i}', descripcion='Presupuesto', precio_unitario=1, presentacion_id='INDIVIDUAL')
+            vendedor = Vendedor.objects.create(dpi=f'91{i:011d}', nombre=f'Vendedor {i}', sueldo=100)
+            Ruta.objects.create(dpi_vendedor=vendedor, fecha='2025-11-06')
+            ClienteRuta.objects.create(ruta=self.ruta, cliente=cliente, orden_visita=i + 1, id_tiempo_cliente=self.tiempo)
+            venta = Venta.objects.create(fecha='2025-11-05T10:00:00Z', nit_cliente=cliente, id_ruta=self.ruta, total=10)
+            HistorialVenta.objects.create(
+                id_venta=venta.id_venta, id_ruta=self.ruta, nit_cliente=cliente, dpi_vendedor=self.vendedor,
+                fecha_venta='2025-11-05T10:00:00Z', total_venta=10, tiempo_real_visita_min=10 + i,
+            )
+            EvidenciaFotografica.objects.create(ruta=self.ruta, cliente=cliente, venta=venta, url=f'https://example.com/{i}.jpg')
+            RegistroVisita.objects.create(vendedor=self.vendedor, cliente=cliente, resultado='VENTA')
+        self.sembrados = n
+
+    def test_endpoints_del_router_no_crecen_con_los_datos(self):
+        claves = {
+            'cliente': '900000000',
+            'producto': 'PRE-0',
+            'vendedor': self.vendedor.pk,
+            'ruta': self.ruta.pk,
+            'evidencia': EvidenciaFotografica.objects.order_by('id').first().pk,
+        }
+        urls = list(self.endpoints_router(claves))
+        self.assertIn(f'/api/rutas/{self.ruta.pk}/comparacion_tiempos/', urls)
+        self.assertPresupuestoConstante(urls, lambda: self.sembrar(8))
+
+
+class MetricasTests(TestCase):
+    def setUp(self):
+        from . import metricas
+
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(METRICAS_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # Cada prueba arranca con su propio archivo de proceso.
+        metricas._pid = None
+        self.addCleanup(setattr, metricas, '_pid', None)
+        self.client_api = APIClient()
+        self.client_api.force_authenticate(user=User.objects.create_user(username='metricas', password='secret'))
+
+    def test_histogramas_suman_los_archivos_de_todos_los_workers(self):
+        from . import metricas
+
+        self.assertEqual(self.client_api.get('/api/clientes/').status_code, 200)
+        # Otro worker con su propio archivo en el mismo directorio.
+        otro = metricas._Valores(os.path.join(self.directorio, 'metricas_999999.db'))
+        otro.sumar(metricas._clave('importacion_filas', '_total', ('tipo',), ['productos']), 40)
+        metricas.registrar_importacion('productos', 10, 0.2)
+
+        texto = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE http_solicitud_segundos histogram', texto)
+        self.assertIn('http_solicitud_segundos_count{vista="ClienteViewSet.list",metodo="GET",estado="200"} 1.0', texto)
+        self.assertIn('http_solicitud_segundos_bucket{vista="ClienteViewSet.list",metodo="GET",estado="200",le="+Inf"} 1.0', texto)
+        self.assertIn('importacion_filas_total{tipo="productos"} 50.0', texto)
+        self.assertIn('db_consultas_total{tipo="select"}', texto)
+
+    def test_solo_desde_ip_local(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='10.1.2.3').status_code, 404)
+        self.assertEqual(self.client.get('/metrics')['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
@@ -8,8 +8,14 @@ from .views import (
     ReportViewSet,
     CustomTokenObtainView,
     ClienteCSVImportView,
+    ClienteLoteImportView,
+    LoteImportacionDetailView,
     EvidenciaFotograficaViewSet,
     EvidenciaFotograficaUploadView,
+    CargaEvidenciaView,
+    CargaEvidenciaDetalleView,
+    CargaEvidenciaFinalizarView,
+    VentaNDJSONIngestaView,
 )
 
 # Enrutador principal del API, agrupa los módulos más usados del sistema.
@@ -27,7 +33,13 @@ report_download = ReportViewSet.as_view({'get': 'descargar'})
 urlpatterns = [
     path('auth/login/', CustomTokenObtainView.as_view(), name='token_obtain_pair'),
     path('importaciones/clientes/csv/', ClienteCSVImportView.as_view(), name='importar-clientes-csv'),
+    path('importaciones/clientes/lotes/', ClienteLoteImportView.as_view(), name='importar-clientes-lote'),
+    path('importaciones/lotes/<int:pk>/', LoteImportacionDetailView.as_view(), name='lote-importacion-detalle'),
+    path('ventas/ingesta/', VentaNDJSONIngestaView.as_view(), name='ventas-ingesta'),
     path('evidencias/subir/', EvidenciaFotograficaUploadView.as_view(), name='evidencias-subir'),
+    path('evidencias/cargas/', CargaEvidenciaView.as_view(), name='evidencias-cargas'),
+    path('evidencias/cargas/<uuid:pk>/', CargaEvidenciaDetalleView.as_view(), name='evidencias-carga-detalle'),
+    path('evidencias/cargas/<uuid:pk>/finalizar/', CargaEvidenciaFinalizarView.as_view(), name='evidencias-carga-finalizar'),
     path('reportes/', report_list, name='reportes'),
     path('reportes/descargar/<str:uid>/', report_download, name='reportes-descargar'),
     path('', include(router.urls)),
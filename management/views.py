@@ -1,38 +1,60 @@
 from datetime import date, datetime
 from decimal import Decimal
-import csv
-import io
 
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse, Http404
+from django.http import Http404, StreamingHttpResponse
 from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.utils import timezone
 from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
 import uuid
 import tempfile
 import os
+import time
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from django.utils.dateparse import parse_date, parse_datetime
 
-from django.db import transaction
-from django.db.models import Avg, Count
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, FilteredRelation, Prefetch, Q
 from django.db.models.deletion import ProtectedError
+from django.db.models.functions import Collate
 from .models import (
     Cliente, Producto, Venta, DetalleVenta, Vendedor, RegistroVisita, Ruta, ClienteRuta,
-    HistorialVenta, ReportFile, EvidenciaFotografica,
+    HistorialVenta, ReportFile, EvidenciaFotografica, LoteImportacion, CargaEvidencia,
 )
+from . import catalogos
+from .busqueda import buscar_clientes
+from .archivos import guardar_lote_evidencias
+from .autenticacion import TokenConDatosSerializer
+from .campos import CamposDinamicosViewSetMixin
+from .cargas import ArchivoPreparado, ErrorCarga, eliminar_temporal, escribir_bloque, iniciar_carga, ruta_temporal
+from .condicional import GetCondicionalMixin
+from .derivados import encolar_derivados, quitar_metadatos
+from .idempotencia import idempotente
+from .importacion import (
+    CAMPOS_CLIENTE, buscar_lote_por_hash, calcular_hash, cargar_productos, crear_lote, importar_clientes, leer_csv,
+    progreso_lote, registrar_lote_cargado,
+)
+from .ingesta import abrir_flujo, ingerir_ventas
+from .metricas import REPORTE_SEGUNDOS, SUBIDA_BYTES
+from .medios import prefijo_media, ruta_descarga_interna, servir_archivo, url_media
+from .pagination import PaginacionEvidencias, PaginacionRutas, PaginacionVentas
 from .serializers import (
     ClienteSerializer, ProductoSerializer, VentaSerializer, DetalleVentaSerializer, VendedorSerializer,
     RegistroVisitaSerializer, RutaSerializer, ClienteRutaSerializer, ReportFileSerializer,
-    EvidenciaFotograficaSerializer,
+    EvidenciaFotograficaSerializer, LoteImportacionSerializer, ItemImportacionErrorSerializer,
 )
 
 # Reordenamos la información recibida para guardar evidencias sin importar el formato del formulario.
@@ -76,36 +98,47 @@ def _build_evidencia_payload(data, files):
     return payload
 
 
+# Convierte '?nit=a,b,c' en una lista sin repetidos para consultar varias llaves de una vez.
+def _claves_consulta(valor):
+    if not valor:
+        return []
+    return list(dict.fromkeys(clave.strip() for clave in valor.split(',') if clave.strip()))
+
+
 class CustomTokenObtainView(TokenObtainPairView):
     # Vista de autenticación que también devuelve información básica del usuario.
     permission_classes = (AllowAny,)
+    serializer_class = TokenConDatosSerializer
 
     def post(self, request, *args, **kwargs):
-        resp = super().post(request, *args, **kwargs)
-        if resp.status_code != 200:
-            return resp
-        data = resp.data
-        # Adjuntamos datos simples del usuario para que el frontend no haga otra consulta.
-        from django.contrib.auth.models import User
-        username = request.data.get('username')
+        serializer = self.get_serializer(data=request.data)
         try:
-            user = User.objects.get(username=username)
-            data['user'] = {'id': user.id, 'username': user.username, 'email': user.email}
-        except User.DoesNotExist:
-            data['user'] = None
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0]) from e
+        data = dict(serializer.validated_data)
+        # Adjuntamos datos simples del usuario (ya autenticado por el serializer) sin otra consulta.
+        user = serializer.user
+        data['user'] = {'id': user.id, 'username': user.username, 'email': user.email}
         return Response(data)
 
 
-class ClienteViewSet(viewsets.ModelViewSet):
+class ClienteViewSet(CamposDinamicosViewSetMixin, GetCondicionalMixin, viewsets.ModelViewSet):
     # CRUD de clientes con un filtro rápido por NIT.
     queryset = Cliente.objects.all().order_by('nit')
     serializer_class = ClienteSerializer
 
     def list(self, request, *args, **kwargs):
-        nit = request.GET.get('n') or request.GET.get('nit')
+        nits = _claves_consulta(request.GET.get('n') or request.GET.get('nit'))
+        if len(nits) > settings.CONSULTA_MAX_CLAVES:
+            return Response({"detail": f"Máximo {settings.CONSULTA_MAX_CLAVES} NIT por consulta."}, status=status.HTTP_400_BAD_REQUEST)
         qs = self.get_queryset()
-        if nit:
-            qs = qs.filter(nit__iexact=nit)
+        if nits:
+            # El NIT solo tiene dígitos: la igualdad exacta usa el índice de la llave primaria.
+            qs = qs.filter(nit__in=nits)
+        no_modificado = self.verificar_condicional(request, qs)
+        if no_modificado:
+            return no_modificado
         page = self.paginate_queryset(qs)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -113,45 +146,116 @@ class ClienteViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(qs, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def buscar(self, request):
+        # Autocompletado sobre el índice de texto; paginamos sin COUNT para que cada página cueste lo mismo.
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = int(request.query_params.get('page_size', settings.BUSQUEDA_TAMANO_PAGINA))
+        except ValueError:
+            return Response({"detail": "page y page_size deben ser números."}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = min(max(page_size, 1), settings.BUSQUEDA_MAX_TAMANO_PAGINA)
+
+        clientes = buscar_clientes(request.query_params.get('q'), page_size + 1, (page - 1) * page_size)
+        url = request.build_absolute_uri()
+        siguiente = replace_query_param(url, 'page', page + 1) if len(clientes) > page_size else None
+        anterior = replace_query_param(url, 'page', page - 1) if page > 1 else None
+        serializer = self.get_serializer(clientes[:page_size], many=True)
+        return Response({'next': siguiente, 'previous': anterior, 'results': serializer.data})
+
 
-class ProductoViewSet(viewsets.ModelViewSet):
+class ProductoViewSet(CamposDinamicosViewSetMixin, GetCondicionalMixin, viewsets.ModelViewSet):
     # Administración de productos y búsqueda por código.
     queryset = Producto.objects.all().order_by('codigo')
     serializer_class = ProductoSerializer
 
     def list(self, request, *args, **kwargs):
-        codigo = request.GET.get('codigo')
+        codigos = _claves_consulta(request.GET.get('codigo'))
+        if len(codigos) > settings.CONSULTA_MAX_CLAVES:
+            return Response({"detail": f"Máximo {settings.CONSULTA_MAX_CLAVES} códigos por consulta."}, status=status.HTTP_400_BAD_REQUEST)
         qs = self.get_queryset()
-        if codigo:
-            qs = qs.filter(codigo__iexact=codigo)
-        if codigo:
-            serializer = self.get_serializer(qs, many=True)
-            return Response(serializer.data)
-        return super().list(request, *args, **kwargs)
+        if codigos:
+            # En lugar de iexact (que envuelve la columna en UPPER) comparamos con una intercalación sin mayúsculas
+            # que tiene índice: 'abc-1' encuentra 'AbC-1' y cada valor sigue siendo una búsqueda indexada.
+            if settings.PRODUCTOS_CODIGO_COLACION:
+                qs = qs.alias(codigo_ci=Collate('codigo', settings.PRODUCTOS_CODIGO_COLACION)).filter(codigo_ci__in=codigos)
+            else:
+                qs = qs.filter(codigo__in=codigos)
+        no_modificado = self.verificar_condicional(request, qs)
+        if no_modificado:
+            return no_modificado
+        page = self.paginate_queryset(qs)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(qs, many=True)
+        return Response(serializer.data)
+
+    # Alta o actualización masiva (lista de precios) desde JSON o un CSV en el campo 'archivo'.
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        archivo = request.FILES.get('archivo')
+        if archivo is not None:
+            try:
+                filas = [
+                    (numero, {(k or '').strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()})
+                    for numero, row in enumerate(leer_csv(archivo), start=2)
+                ]
+            except UnicodeDecodeError:
+                return Response({"detail": "El archivo CSV debe estar codificado en UTF-8."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            datos = request.data.get('productos') if isinstance(request.data, dict) else request.data
+            if not isinstance(datos, list) or not all(isinstance(fila, dict) for fila in datos):
+                return Response({"detail": "Envíe una lista de productos o un CSV en el campo 'archivo'."}, status=status.HTTP_400_BAD_REQUEST)
+            filas = list(enumerate(datos, start=1))
+
+        if not filas:
+            return Response({"detail": "No se recibieron productos."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(filas) > settings.PRODUCTOS_CARGA_MAX_FILAS:
+            return Response({"detail": f"Máximo {settings.PRODUCTOS_CARGA_MAX_FILAS} productos por carga."}, status=status.HTTP_400_BAD_REQUEST)
+
+        resultados, aplicado = cargar_productos(filas)
+        resumen = {
+            'creados': sum(1 for r in resultados if r['estado'] == 'creado'),
+            'actualizados': sum(1 for r in resultados if r['estado'] == 'actualizado'),
+            'errores': sum(1 for r in resultados if r['estado'] == 'error'),
+            'resultados': resultados,
+        }
+        if not aplicado:
+            resumen['detail'] = 'Se encontraron errores de validación; no se aplicó ningún cambio.'
+            return Response(resumen, status=status.HTTP_400_BAD_REQUEST)
+        return Response(resumen, status=status.HTTP_200_OK)
 
 # Control de vendedores y un endpoint auxiliar para registrar visitas.
-class VendedorViewSet(viewsets.ModelViewSet):
+class VendedorViewSet(CamposDinamicosViewSetMixin, GetCondicionalMixin, viewsets.ModelViewSet):
     queryset = Vendedor.objects.all().order_by('dpi')
     serializer_class = VendedorSerializer
 
     @action(detail=True, methods=['get', 'post'])
+    @idempotente
     def visitas(self, request, pk=None):
         vendedor = get_object_or_404(Vendedor, pk=pk)
         if request.method == 'GET':
-            visitas = vendedor.visitas.all()
-            serializer = RegistroVisitaSerializer(visitas, many=True)
-            return Response(serializer.data)
+            visitas = vendedor.visitas.all().order_by('-fecha', '-id')
+            page = self.paginate_queryset(visitas)
+            serializer = RegistroVisitaSerializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         else:
             data = request.data.copy()
-            data['vendedor'] = vendedor.id
+            data['vendedor'] = vendedor.pk
             serializer = RegistroVisitaSerializer(data=data)
             serializer.is_valid(raise_exception=True)
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 # Gestión de rutas y acciones relacionadas con los recorridos.
-class RutaViewSet(viewsets.ModelViewSet):
+class RutaViewSet(CamposDinamicosViewSetMixin, GetCondicionalMixin, viewsets.ModelViewSet):
     queryset = Ruta.objects.all().order_by('id_ruta')
     serializer_class = RutaSerializer
+    pagination_class = PaginacionRutas
+    campos_modificacion = ('actualizado_en', 'clienteruta__cliente__actualizado_en')
+    prefetch_por_campo = {
+        'clienterutas': Prefetch('clienteruta_set', queryset=ClienteRuta.objects.select_related('cliente')),
+    }
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -168,13 +272,16 @@ class RutaViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['get', 'post'])
+    @idempotente
     def recorridos(self, request, pk=None):
         ruta = get_object_or_404(Ruta, pk=pk)
         if request.method == 'GET':
             # Entregamos las ventas vinculadas a la ruta como historial de recorridos.
             ventas = Venta.objects.filter(id_ruta=ruta)
-            serializer = VentaSerializer(ventas, many=True)
-            return Response(serializer.data)
+            paginator = PaginacionVentas()
+            page = paginator.paginate_queryset(ventas, request, view=self)
+            serializer = VentaSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
         else:
             data = request.data.copy()
             data['id_ruta'] = ruta.id_ruta
@@ -187,23 +294,74 @@ class RutaViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def comparacion_tiempos(self, request, pk=None):
         ruta = get_object_or_404(Ruta, pk=pk)
+        tiempos = catalogos.obtener_catalogo('tiempo_cliente')
+        # Promedio de minutos reales por cliente desde el historial de ventas, en una sola consulta agrupada.
+        promedios = dict(
+            HistorialVenta.objects.filter(id_ruta=ruta)
+            .values('nit_cliente')
+            .annotate(avg_real=Avg('tiempo_real_visita_min'))
+            .values_list('nit_cliente', 'avg_real')
+        )
         registro = []
-        for cr in ruta.clienteruta_set.all():
-            # Minutos planificados tomados del catálogo.
-            planned = None
-            if cr.id_tiempo_cliente and hasattr(cr.id_tiempo_cliente, 'minutos'):
-                planned = cr.id_tiempo_cliente.minutos
-            # Promedio de minutos reales usando el historial de ventas.
-            avg = HistorialVenta.objects.filter(id_ruta=ruta, nit_cliente=cr.cliente).aggregate(avg_real=Avg('tiempo_real_visita_min'))
-            avg_real = avg.get('avg_real')
-            registro.append({'cliente': cr.cliente.nombre, 'planned': planned, 'avg_real': avg_real})
+        for cr in ruta.clienteruta_set.select_related('cliente'):
+            # Minutos planificados tomados del catálogo en memoria.
+            tiempo = tiempos.get(cr.id_tiempo_cliente_id)
+            planned = tiempo.minutos if tiempo else None
+            registro.append({'cliente': cr.cliente.nombre, 'planned': planned, 'avg_real': promedios.get(cr.cliente_id)})
         return Response(registro)
 
+    # Galería de la ruta agrupada por parada, con nombres de cliente y URLs de miniaturas, en una sola consulta.
+    @action(detail=True, methods=['get'])
+    def galeria(self, request, pk=None):
+        filas = (
+            EvidenciaFotografica.objects.filter(ruta_id=pk)
+            .annotate(parada=FilteredRelation('cliente__clienteruta', condition=Q(cliente__clienteruta__ruta_id=pk)))
+            .order_by(F('parada__orden_visita').asc(nulls_last=True), 'cliente_id', '-id')
+            .values(
+                'id', 'imagen', 'miniatura', 'mediana', 'url', 'descripcion', 'registrada_en',
+                'cliente_id', 'cliente__nombre', 'parada__orden_visita', 'venta_id', 'venta__total',
+            )
+        )
+        prefijo = prefijo_media(request)
+        paradas = []
+        for fila in filas:
+            if not paradas or paradas[-1]['nit_cliente'] != fila['cliente_id']:
+                paradas.append({
+                    'orden_visita': fila['parada__orden_visita'],
+                    'nit_cliente': fila['cliente_id'],
+                    'cliente_nombre': fila['cliente__nombre'],
+                    'evidencias': [],
+                })
+            imagen_url = url_media(prefijo, fila['imagen']) or fila['url']
+            paradas[-1]['evidencias'].append({
+                'id': fila['id'],
+                'imagen_url': imagen_url,
+                'miniatura_url': url_media(prefijo, fila['miniatura']) or imagen_url,
+                'mediana_url': url_media(prefijo, fila['mediana']) or imagen_url,
+                'descripcion': fila['descripcion'],
+                'registrada_en': fila['registrada_en'],
+                'id_venta': fila['venta_id'],
+                'venta_total': fila['venta__total'],
+            })
+        if not paradas and not Ruta.objects.filter(pk=pk).exists():
+            raise Http404('Ruta no existe')
+        return Response({'id_ruta': int(pk), 'paradas': paradas})
+
+# Ingesta masiva de ventas en NDJSON (opcionalmente gzip) con resultados por línea en streaming.
+class VentaNDJSONIngestaView(APIView):
+
+    def post(self, request):
+        flujo = abrir_flujo(request.stream, request.META.get('HTTP_CONTENT_ENCODING'))
+        if flujo is None:
+            return Response({"detail": "Envíe las ventas en el cuerpo de la solicitud, una por línea."}, status=status.HTTP_400_BAD_REQUEST)
+        return StreamingHttpResponse(ingerir_ventas(flujo), content_type='application/x-ndjson')
+
 # Permite listar, crear y actualizar evidencias con filtros sencillos.
-class EvidenciaFotograficaViewSet(viewsets.ModelViewSet):
+class EvidenciaFotograficaViewSet(CamposDinamicosViewSetMixin, viewsets.ModelViewSet):
     queryset = EvidenciaFotografica.objects.select_related('cliente', 'ruta', 'venta').order_by('-registrada_en')
     serializer_class = EvidenciaFotograficaSerializer
     parser_classes = (MultiPartParser, FormParser, JSONParser)
+    pagination_class = PaginacionEvidencias
 
     def _normalize_payload(self, request):
         return _build_evidencia_payload(request.data, request.FILES)
@@ -248,6 +406,16 @@ class EvidenciaFotograficaViewSet(viewsets.ModelViewSet):
         kwargs['partial'] = True
         return self.update(request, *args, **kwargs)
 
+    def perform_create(self, serializer):
+        encolar_derivados(serializer.save())
+
+    def perform_update(self, serializer):
+        if serializer.validated_data.get('imagen'):
+            # Los derivados de la foto anterior ya no aplican; se regeneran en segundo plano.
+            encolar_derivados(serializer.save(miniatura=None, mediana=None))
+        else:
+            serializer.save()
+
 
 # Generamos un PDF ligero con resúmenes de cada módulo.
 class ReportViewSet(viewsets.ViewSet):
@@ -282,6 +450,7 @@ class ReportViewSet(viewsets.ViewSet):
         tmp_dir = tempfile.gettempdir()
         filename = f"report_{tipo_normalized}_{uid}.pdf"
         file_path = os.path.join(tmp_dir, filename)
+        inicio_reporte = time.perf_counter()
         c = canvas.Canvas(file_path, pagesize=letter)
         width, height = letter
         margin_x = 72
@@ -603,6 +772,9 @@ class ReportViewSet(viewsets.ViewSet):
             )
 
         c.save()
+        REPORTE_SEGUNDOS.observe(
+            time.perf_counter() - inicio_reporte, tipo=tipo_normalized if tipo_normalized in tipo_map.values() else 'otro',
+        )
 
         rf = ReportFile.objects.create(uuid=uid, nombre_archivo=filename, file_path=file_path)
         serializer = ReportFileSerializer(rf)
@@ -612,83 +784,92 @@ class ReportViewSet(viewsets.ViewSet):
     def descargar(self, request, uid=None):
         try:
             rf = ReportFile.objects.get(uuid=uid)
-            if not os.path.exists(rf.file_path):
-                raise Http404('Archivo no encontrado')
-            return FileResponse(open(rf.file_path, 'rb'), as_attachment=True, filename=rf.nombre_archivo)
+            # Cada reporte tiene su propio uuid y no cambia: el navegador puede revalidar con ETag.
+            relativa = os.path.relpath(rf.file_path, tempfile.gettempdir())
+            return servir_archivo(
+                request,
+                rf.file_path,
+                etag=rf.uuid,
+                tipo='application/pdf',
+                nombre_descarga=rf.nombre_archivo,
+                ruta_interna=ruta_descarga_interna(settings.REPORTES_ACCEL_PREFIX, None if relativa.startswith('..') else relativa),
+            )
         except ReportFile.DoesNotExist:
             raise Http404('Reporte no existe')
 
 # Importamos clientes desde un CSV validando encabezados y datos clave.
 class ClienteCSVImportView(APIView):
     parser_classes = (MultiPartParser,)
-    expected_headers = ['nit', 'nombre', 'direccion', 'correo_electronico', 'estatus_credito']
+    expected_headers = CAMPOS_CLIENTE
 
-    def post(self, request):
+    def _abrir_csv(self, request):
         archivo = request.FILES.get('archivo')
         if not archivo:
-            return Response({"detail": "Cargue un archivo CSV en el campo 'archivo'."}, status=status.HTTP_400_BAD_REQUEST)
+            return None, None, Response({"detail": "Cargue un archivo CSV en el campo 'archivo'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not archivo.size:
+            return None, None, Response({"detail": "El archivo CSV está vacío."}, status=status.HTTP_400_BAD_REQUEST)
 
+        reader = leer_csv(archivo)
         try:
-            raw_content = archivo.read().decode('utf-8-sig')
+            fieldnames = reader.fieldnames
         except UnicodeDecodeError:
-            return Response({"detail": "El archivo CSV debe estar codificado en UTF-8."}, status=status.HTTP_400_BAD_REQUEST)
-
-        if not raw_content.strip():
-            return Response({"detail": "El archivo CSV está vacío."}, status=status.HTTP_400_BAD_REQUEST)
+            return None, None, Response({"detail": "El archivo CSV debe estar codificado en UTF-8."}, status=status.HTTP_400_BAD_REQUEST)
+        if not fieldnames:
+            return None, None, Response({"detail": "El archivo CSV no contiene encabezados."}, status=status.HTTP_400_BAD_REQUEST)
 
-        reader = csv.DictReader(io.StringIO(raw_content))
-        if not reader.fieldnames:
-            return Response({"detail": "El archivo CSV no contiene encabezados."}, status=status.HTTP_400_BAD_REQUEST)
-
-        normalized_headers = [h.strip().lower() for h in reader.fieldnames]
+        normalized_headers = [h.strip().lower() for h in fieldnames]
         missing = [header for header in self.expected_headers if header not in normalized_headers]
         if missing:
-            return Response({
+            return None, None, Response({
                 "detail": "Encabezados faltantes en el CSV.",
                 "faltantes": missing,
                 "esperados": self.expected_headers,
             }, status=status.HTTP_400_BAD_REQUEST)
+        return archivo, reader, None
 
-        errores = []
-        creados = 0
-        actualizados = 0
-        now = timezone.now()
-
-        with transaction.atomic():
-            for idx, row in enumerate(reader, start=2):
-                normalized_row = {k.strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
-                if not any(normalized_row.values()):
-                    continue  # fila en blanco
-
-                data = {
-                    'nit': normalized_row.get('nit') or '',
-                    'nombre': normalized_row.get('nombre') or '',
-                    'direccion': normalized_row.get('direccion') or None,
-                    'correo_electronico': normalized_row.get('correo_electronico') or None,
-                    'estatus_credito': (normalized_row.get('estatus_credito') or 'B')[:2],
-                }
-
-                existing = Cliente.objects.filter(nit=data['nit']).first()
-                serializer = ClienteSerializer(existing, data=data) if existing else ClienteSerializer(data=data)
-
-                if serializer.is_valid():
-                    save_kwargs = {'actualizado_en': now}
-                    if not existing:
-                        save_kwargs['creado_en'] = now
-                    serializer.save(**save_kwargs)
-                    if existing:
-                        actualizados += 1
-                    else:
-                        creados += 1
-                else:
-                    errores.append({'fila': idx, 'errores': serializer.errors})
+    def _lote_previo(self, request):
+        # Una pasada de hash sobre el archivo basta para reconocer una carga ya procesada.
+        archivo = request.FILES.get('archivo')
+        if not archivo:
+            return None, None
+        hash_archivo = calcular_hash(archivo)
+        return hash_archivo, buscar_lote_por_hash(hash_archivo)
 
-            if errores:
-                transaction.set_rollback(True)
+    def post(self, request):
+        hash_archivo, previo = self._lote_previo(request)
+        if previo is not None:
+            if previo.estado != 'CARGADO':
                 return Response({
-                    'detail': 'Se encontraron errores de validación.',
-                    'errores': errores,
-                }, status=status.HTTP_400_BAD_REQUEST)
+                    "detail": f"Este archivo ya está registrado en el lote {previo.id_lote}.",
+                    "id_lote": previo.id_lote,
+                    "estado": previo.estado,
+                }, status=status.HTTP_409_CONFLICT)
+            data = LoteImportacionSerializer(previo).data['resultado'] or {}
+            data.update({'duplicado': True, 'id_lote': previo.id_lote})
+            return Response(data, status=status.HTTP_200_OK)
+
+        archivo, reader, error = self._abrir_csv(request)
+        if error is not None:
+            return error
+
+        filas = enumerate(reader, start=2)
+        try:
+            with transaction.atomic():
+                creados, actualizados, errores = importar_clientes(filas)
+                if errores:
+                    transaction.set_rollback(True)
+                    return Response({
+                        'detail': 'Se encontraron errores de validación.',
+                        'errores': errores,
+                    }, status=status.HTTP_400_BAD_REQUEST)
+                try:
+                    with transaction.atomic():
+                        registrar_lote_cargado(archivo.name, request.user.id, hash_archivo, creados, actualizados)
+                except IntegrityError:
+                    pass  # otra carga simultánea del mismo archivo ya quedó registrada
+        except UnicodeDecodeError:
+            return Response({"detail": "El archivo CSV debe estar codificado en UTF-8."}, status=status.HTTP_400_BAD_REQUEST)
 
         status_code = status.HTTP_201_CREATED if creados else status.HTTP_200_OK
         return Response({
@@ -696,21 +877,199 @@ class ClienteCSVImportView(APIView):
             'actualizados': actualizados,
         }, status=status_code)
 
+# Misma validación de encabezados, pero las filas se preparan en un lote que se procesa en segundo plano.
+class ClienteLoteImportView(ClienteCSVImportView):
+
+    def _respuesta_lote(self, lote, status_code, duplicado=False):
+        data = LoteImportacionSerializer(lote).data
+        data['progreso'] = progreso_lote(lote)
+        data['duplicado'] = duplicado
+        return Response(data, status=status_code)
+
+    def post(self, request):
+        hash_archivo, previo = self._lote_previo(request)
+        if previo is not None:
+            return self._respuesta_lote(previo, status.HTTP_200_OK, duplicado=True)
+
+        archivo, reader, error = self._abrir_csv(request)
+        if error is not None:
+            return error
+
+        try:
+            lote = crear_lote(reader, archivo.name, request.user.id, hash_archivo)
+        except UnicodeDecodeError:
+            return Response({"detail": "El archivo CSV debe estar codificado en UTF-8."}, status=status.HTTP_400_BAD_REQUEST)
+        except IntegrityError:
+            previo = buscar_lote_por_hash(hash_archivo)
+            if previo is None:
+                raise
+            return self._respuesta_lote(previo, status.HTTP_200_OK, duplicado=True)
+        return self._respuesta_lote(lote, status.HTTP_202_ACCEPTED)
+
+
+# Consulta de avance de un lote con sus errores por fila paginados.
+class LoteImportacionDetailView(APIView):
+
+    def get(self, request, pk):
+        # Los errores por fila traen datos de clientes: cada usuario solo ve sus propios lotes.
+        lote = get_object_or_404(LoteImportacion, pk=pk, subido_por=request.user.id)
+        data = LoteImportacionSerializer(lote).data
+        data['progreso'] = progreso_lote(lote)
+
+        errores = lote.items.filter(valido=False, errores_json__isnull=False).order_by('fila')
+        paginator = PageNumberPagination()
+        paginator.page_size = settings.IMPORTACION_ERRORES_POR_PAGINA
+        page = paginator.paginate_queryset(errores, request, view=self)
+        data['errores'] = paginator.get_paginated_response(ItemImportacionErrorSerializer(page, many=True).data).data
+        return Response(data)
+
 # Endpoint dedicado para subir evidencias con archivos grandes.
 class EvidenciaFotograficaUploadView(APIView):
     parser_classes = (MultiPartParser, FormParser)
 
     def post(self, request):
-        archivo = request.FILES.get('archivo') or request.FILES.get('imagen')
+        archivos = request.FILES.getlist('archivos') or request.FILES.getlist('archivo') or request.FILES.getlist('imagen')
+        if len(archivos) > 1:
+            return self._subir_varias(request, archivos)
+        archivo = request.FILES.get('archivo') or request.FILES.get('imagen') or request.FILES.get('archivos')
         if not archivo:
             return Response({"detail": "Cargue un archivo en el campo 'archivo' o 'imagen'."}, status=status.HTTP_400_BAD_REQUEST)
 
         payload = _build_evidencia_payload(request.data, request.FILES)
+        payload.pop('archivos', None)
         if 'imagen' not in payload:
             payload['imagen'] = archivo
 
         serializer = EvidenciaFotograficaSerializer(data=payload, context={'request': request})
         serializer.is_valid(raise_exception=True)
         evidencia = serializer.save()
+        SUBIDA_BYTES.observe(archivo.size, via='directa')
+        encolar_derivados(evidencia)
         response_data = EvidenciaFotograficaSerializer(evidencia, context={'request': request}).data
         return Response(response_data, status=status.HTTP_201_CREATED)
+
+    # Varias fotos con los mismos cliente/ruta/venta: se validan los datos una vez y se insertan juntas.
+    def _subir_varias(self, request, archivos):
+        if len(archivos) > settings.EVIDENCIA_MAX_ARCHIVOS_LOTE:
+            return Response({"detail": f"Máximo {settings.EVIDENCIA_MAX_ARCHIVOS_LOTE} archivos por solicitud."}, status=status.HTTP_400_BAD_REQUEST)
+
+        payload = _build_evidencia_payload(request.data, {})
+        for campo in ('archivos', 'archivo', 'imagen'):
+            payload.pop(campo, None)
+        serializer = EvidenciaFotograficaSerializer(data=dict(payload, imagen=archivos[0]), context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        comunes = {campo: valor for campo, valor in serializer.validated_data.items() if campo != 'imagen'}
+
+        campo_imagen = serializer.fields['imagen']
+        errores = {}
+        for posicion, archivo in enumerate(archivos[1:], start=1):
+            try:
+                campo_imagen.run_validation(archivo)
+            except ValidationError as exc:
+                errores[archivo.name or str(posicion)] = exc.detail
+            except DjangoValidationError as exc:
+                # El ImageField de DRF deja pasar el error de Django cuando se usa fuera de un serializer.
+                errores[archivo.name or str(posicion)] = exc.messages
+        if errores:
+            return Response({'archivos': errores}, status=status.HTTP_400_BAD_REQUEST)
+
+        evidencias = guardar_lote_evidencias(archivos, comunes, preparar=quitar_metadatos)
+        for archivo in archivos:
+            SUBIDA_BYTES.observe(archivo.size, via='lote')
+        for evidencia in evidencias:
+            encolar_derivados(evidencia)
+        data = EvidenciaFotograficaSerializer(evidencias, many=True, context={'request': request}).data
+        return Response({'evidencias': data}, status=status.HTTP_201_CREATED)
+
+
+CAMPOS_METADATOS_CARGA = ('descripcion', 'cliente', 'ruta', 'venta')
+
+
+def _estado_carga(carga, codigo=status.HTTP_200_OK, **extra):
+    data = {
+        'id_carga': carga.id_carga,
+        'recibido': carga.recibido,
+        'tamano_total': carga.tamano_total,
+        'completa': carga.recibido >= carga.tamano_total,
+        'expira_en': carga.expira_en,
+        **extra,
+    }
+    response = Response(data, status=codigo)
+    response['Upload-Offset'] = str(carga.recibido)
+    return response
+
+
+# Subida por partes: POST inicia la carga, PUT agrega bloques con Upload-Offset y .../finalizar/ crea la evidencia.
+class CargaEvidenciaView(APIView):
+
+    def post(self, request):
+        try:
+            tamano_total = int(request.data.get('tamano_total'))
+        except (TypeError, ValueError):
+            return Response({"detail": "Indique 'tamano_total' en bytes."}, status=status.HTTP_400_BAD_REQUEST)
+        payload = _build_evidencia_payload(request.data, {})
+        metadatos = {campo: payload[campo] for campo in CAMPOS_METADATOS_CARGA if payload.get(campo) not in (None, '')}
+        try:
+            carga = iniciar_carga(request.data.get('nombre_archivo') or 'evidencia', tamano_total, metadatos, request.user.id)
+        except ErrorCarga as exc:
+            return Response({"detail": exc.detalle}, status=status.HTTP_400_BAD_REQUEST)
+        response = _estado_carga(carga, status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'{carga.id_carga}/')
+        return response
+
+
+class CargaEvidenciaDetalleView(APIView):
+
+    def _carga(self, request, pk):
+        return get_object_or_404(CargaEvidencia, pk=pk, subido_por=request.user.id)
+
+    # El cliente consulta aquí desde dónde reanudar después de un corte.
+    def get(self, request, pk):
+        return _estado_carga(self._carga(request, pk))
+
+    def put(self, request, pk):
+        carga = self._carga(request, pk)
+        try:
+            desplazamiento = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+            longitud = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return Response({"detail": "Envíe el encabezado Upload-Offset con la posición del bloque."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            # Leemos el cuerpo directo del stream, sin pasar por los parsers ni cargarlo entero en memoria.
+            escribir_bloque(carga, desplazamiento, longitud, request.stream)
+        except ErrorCarga as exc:
+            return _estado_carga(carga, status.HTTP_409_CONFLICT, detail=exc.detalle)
+        return _estado_carga(carga)
+
+    patch = put
+
+    def delete(self, request, pk):
+        carga = self._carga(request, pk)
+        eliminar_temporal(carga)
+        carga.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class CargaEvidenciaFinalizarView(APIView):
+
+    def post(self, request, pk):
+        contexto = {'request': request}
+        with transaction.atomic():
+            carga = get_object_or_404(CargaEvidencia.objects.select_for_update(), pk=pk, subido_por=request.user.id)
+            if carga.evidencia_id is not None:
+                # Reintento de un finalizar que ya se aplicó: devolvemos la misma evidencia.
+                return Response(EvidenciaFotograficaSerializer(carga.evidencia, context=contexto).data)
+            if carga.recibido < carga.tamano_total:
+                return _estado_carga(carga, status.HTTP_409_CONFLICT, detail='Faltan bloques por recibir.')
+
+            with open(ruta_temporal(carga), 'rb') as archivo:
+                payload = dict(carga.metadatos or {}, imagen=ArchivoPreparado(archivo, name=carga.nombre_archivo))
+                serializer = EvidenciaFotograficaSerializer(data=payload, context=contexto)
+                serializer.is_valid(raise_exception=True)
+                evidencia = serializer.save()
+            carga.evidencia = evidencia
+            carga.save(update_fields=['evidencia'])
+        eliminar_temporal(carga)
+        SUBIDA_BYTES.observe(carga.tamano_total, via='por_partes')
+        encolar_derivados(evidencia)
+        return Response(EvidenciaFotograficaSerializer(evidencia, context=contexto).data, status=status.HTTP_201_CREATED)
@@ -0,0 +1,82 @@
+import os
+import sys
+import timeit
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+if str(BASE_DIR) not in sys.path:
+    sys.path.insert(0, str(BASE_DIR))
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "core.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.utils import timezone  # noqa: E402
+from rest_framework.parsers import JSONParser  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from management.models import DetalleVenta, Producto, Vendedor, Venta  # noqa: E402
+from management.renderers import ORJSONParser, ORJSONRenderer, orjson  # noqa: E402
+from management.serializers import (  # noqa: E402
+    DetalleVentaSerializer, ProductoSerializer, VendedorSerializer, VentaSerializer,
+)
+
+# Compara render/parse de DRF contra orjson con las mismas listas que devuelven los endpoints.
+# Uso: python scripts/benchmark_json.py [filas] [repeticiones]
+FILAS = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+REPETICIONES = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+
+def construir_listas(filas):
+    # Instancias en memoria: medimos solo la serialización, no la base de datos.
+    ahora = timezone.now()
+    productos = [
+        Producto(codigo=f'P-{i}', descripcion=f'Producto {i}', color='Rojo', precio_unitario=Decimal('12.34') + i,
+                 presentacion_id='INDIVIDUAL', creado_en=ahora, actualizado_en=ahora)
+        for i in range(filas)
+    ]
+    vendedores = [
+        Vendedor(dpi=f'{i:013d}', nombre=f'Vendedor {i}', correo_electronico=f'v{i}@example.com', telefono='5555-5555',
+                 sueldo=Decimal('4500.00'), nivel_exito_porcent=Decimal('55.50'), creado_en=ahora, actualizado_en=ahora)
+        for i in range(filas)
+    ]
+    ventas = [
+        Venta(id_venta=i, fecha=ahora - timedelta(minutes=i), nit_cliente_id='100000001', id_ruta_id=1,
+              total=Decimal('250.75'), creado_en=ahora, actualizado_en=ahora)
+        for i in range(filas)
+    ]
+    detalles = [
+        DetalleVenta(id_venta_id=i, linea=1, codigo_producto_id='P-1', cantidad=3, precio_unitario=Decimal('12.34'))
+        for i in range(filas)
+    ]
+    return {
+        'productos': ProductoSerializer(productos, many=True).data,
+        'vendedores': VendedorSerializer(vendedores, many=True).data,
+        'ventas': VentaSerializer(ventas, many=True).data,
+        'detalles': DetalleVentaSerializer(detalles, many=True).data,
+    }
+
+
+def medir(func):
+    return min(timeit.repeat(func, number=1, repeat=REPETICIONES)) * 1000
+
+
+if orjson is None:
+    print("[WARN] orjson no está instalado: ORJSONRenderer usa el renderer de DRF y no habrá diferencia.")
+
+print(f"{'lista':<12}{'filas':>7}{'drf ms':>10}{'orjson ms':>11}{'x':>7}{'parse drf':>11}{'parse orjson':>14}")
+for nombre, datos in construir_listas(FILAS).items():
+    drf = JSONRenderer()
+    rapido = ORJSONRenderer()
+    cuerpo = drf.render(datos)
+    assert cuerpo.replace(b' ', b'') == rapido.render(datos).replace(b' ', b''), nombre
+    t_drf = medir(lambda: drf.render(datos))
+    t_rapido = medir(lambda: rapido.render(datos))
+    p_drf = medir(lambda: JSONParser().parse(BytesIO(cuerpo)))
+    p_rapido = medir(lambda: ORJSONParser().parse(BytesIO(cuerpo)))
+    print(f"{nombre:<12}{FILAS:>7}{t_drf:>10.2f}{t_rapido:>11.2f}{t_drf / t_rapido:>7.1f}{p_drf:>11.2f}{p_rapido:>14.2f}")